@@ -1,5 +1,6 @@
 """OmicLearn main file."""
 import os
+import time
 import warnings
 from datetime import datetime
 
@@ -20,10 +21,13 @@ from utils.ui_components import (
     generate_sidebar_elements,
     generate_summary_text,
     get_system_report,
+    keep_run,
     main_analysis_run,
     main_text_and_data_upload,
     objdict,
+    results_bundle,
     return_widgets,
+    run_cross_validation,
     session_history,
 )
 from utils.ui_texts import *
@@ -50,6 +54,8 @@ except ModuleNotFoundError:
 
 # Main Function
 def OmicLearn_Main():
+    rerun_start = time.perf_counter()
+
     # Define state
     state = objdict()
     state["df"] = pd.DataFrame()
@@ -75,35 +81,53 @@ def OmicLearn_Main():
     elif len(state.df) > 0 and not (state.class_0 and state.class_1):
         st.warning("**WARNING:** Define classes for the classification target.")
 
-    elif (
-        (state.df is not None)
-        and (state.class_0 and state.class_1)
-        and (st.button("Run analysis", key="run"))
-    ):
-        # Run main analysis
-        main_analysis_run(state)
+    elif (state.df is not None) and (state.class_0 and state.class_1):
+        run = st.button("Run analysis", key="run")
+        if run:
+            # Run main analysis
+            main_analysis_run(state)
+            state = run_cross_validation(state)
+
+            # Keep the run, its results stay visible on later reruns
+            st.session_state["last_run"] = keep_run(state)
+
+        last_run = st.session_state.get("last_run")
+        if last_run is not None and last_run.dataset_id == state.dataset_id:
+            if not run:
+                st.info(RESULTS_REPLAY_TEXT)
 
-        # Display all results and plots
-        state = display_results_and_plots(state)
+            # Display all results and plots
+            display_results_and_plots(last_run)
 
-        # Generate summary text
-        generate_summary_text(state, report)
+            # Generate summary text
+            last_run["summary_text"] = generate_summary_text(last_run, report)
 
-        # Session and Run info
-        widget_values["Date"] = datetime.now().strftime("%d/%m/%Y %H:%M:%S") + " (UTC)"
+            if run:
+                # Session and Run info
+                widget_values["Date"] = (
+                    datetime.now().strftime("%d/%m/%Y %H:%M:%S") + " (UTC)"
+                )
 
-        # Calculate mean, std and get the top features
-        for _ in state.summary.columns:
-            widget_values[_ + "_mean"] = state.summary.loc["mean"][_]
-            widget_values[_ + "_std"] = state.summary.loc["std"][_]
-        widget_values["top_features"] = state.top_features
+                # Calculate mean, std and get the top features
+                for _ in last_run.summary.columns:
+                    widget_values[_ + "_mean"] = last_run.summary.loc["mean"][_]
+                    widget_values[_ + "_std"] = last_run.summary.loc["std"][_]
+                widget_values["top_features"] = last_run.top_features
 
-        # Show session history
-        session_history(widget_values)
+                # Show session history
+                session_history(widget_values)
+            else:
+                session_history()
+
+            # All results in one file, prepared in the background
+            results_bundle(last_run)
 
     else:
         pass
 
+    # Latency of this rerun, shown in the sidebar on the next one
+    st.session_state["rerun_ms"] = 1000 * (time.perf_counter() - rerun_start)
+
 
 # Run the OmicLearn
 if __name__ == "__main__":
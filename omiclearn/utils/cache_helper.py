@@ -0,0 +1,299 @@
+"""OmicLearn disk cache for loaded datasets."""
+import collections
+import functools
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# Fingerprints of uploaded files by their upload id, computed once per upload
+_upload_fingerprints = collections.OrderedDict()
+
+
+def get_cache_dir():
+    """
+    Returns the directory for converted datasets
+    """
+    cache_dir = os.environ.get(
+        "OMICLEARN_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".omiclearn")
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def _update_fingerprint(fingerprint_hash, value):
+    """
+    Adds a value to the fingerprint hash
+    """
+    if isinstance(value, str) and os.path.isfile(value):
+        # Files are identified by their path, size and modification time
+        stat = os.stat(value)
+        value = ("file", os.path.realpath(value), stat.st_size, stat.st_mtime_ns)
+        fingerprint_hash.update(repr(value).encode())
+    elif hasattr(value, "getbuffer") and hasattr(value, "id"):
+        upload = (value.id, value.name, value.size)
+        if upload not in _upload_fingerprints:
+            upload_hash = hashlib.blake2b(digest_size=16)
+            _update_fingerprint(upload_hash, io.BytesIO(value.getbuffer()))
+            _upload_fingerprints[upload] = upload_hash.digest()
+            if len(_upload_fingerprints) > 64:
+                _upload_fingerprints.popitem(last=False)
+        fingerprint_hash.update(_upload_fingerprints[upload])
+    elif hasattr(value, "getbuffer"):
+        buffer = value.getbuffer()
+        fingerprint_hash.update(repr(("buffer", buffer.nbytes)).encode())
+        # The full content, a sample of it could map different files to one entry
+        fingerprint_hash.update(buffer)
+        del buffer
+    elif isinstance(value, pd.DataFrame):
+        fingerprint_hash.update(repr(("frame", value.shape)).encode())
+        fingerprint_hash.update(repr(list(zip(value.columns, value.dtypes))).encode())
+        fingerprint_hash.update(pd.util.hash_pandas_object(value).to_numpy())
+    elif isinstance(value, (list, tuple)):
+        fingerprint_hash.update(repr((type(value).__name__, len(value))).encode())
+        for _ in value:
+            _update_fingerprint(fingerprint_hash, _)
+    else:
+        fingerprint_hash.update(repr((type(value).__name__, value)).encode())
+
+
+def fingerprint(value):
+    """
+    Cheap content fingerprint of files, buffers, DataFrames and plain values
+
+    Buffers are hashed with their full content, uploaded files once per upload.
+    """
+    fingerprint_hash = hashlib.blake2b(digest_size=16)
+    _update_fingerprint(fingerprint_hash, value)
+    return fingerprint_hash.hexdigest()
+
+
+def _arrow_compatible(df):
+    """
+    Returns df with the mixed type object columns converted to strings
+
+    E.g. an Excel column with numbers and "NA" cannot be written to Arrow
+    files. Missing values are kept, the other columns are not copied.
+    """
+    converted = df
+    for position in np.flatnonzero((df.dtypes == object).to_numpy()):
+        values = df.iloc[:, position]
+        try:
+            pa.array(values, from_pandas=True)
+        except (pa.ArrowException, ValueError, TypeError):
+            if converted is df:
+                converted = df.copy(deep=False)
+            converted.isetitem(
+                position, values.where(values.isna(), values.astype(str))
+            )
+    return converted
+
+
+class DiskCache:
+    """
+    Size-bounded disk cache of DataFrames in zstd compressed Arrow IPC files
+
+    Each entry is a DataFrame with a JSON sidecar for the other results.
+    Entries expire `ttl` seconds after they were written and the least
+    recently used entries are removed once the cache exceeds `max_size` bytes.
+    The last `memory_entries` DataFrames are also kept in memory and are
+    shared between reruns and sessions, so they must not be modified.
+    """
+
+    def __init__(self, name, max_size, ttl, memory_entries=4):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self._memory = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache_dir(self):
+        cache_dir = os.path.join(get_cache_dir(), self.name)
+        os.makedirs(cache_dir, exist_ok=True)
+        return cache_dir
+
+    def _remove(self, key):
+        for extension in [".json", ".arrow"]:
+            try:
+                os.remove(os.path.join(self.cache_dir, key + extension))
+            except FileNotFoundError:
+                pass
+
+    def get(self, key):
+        """
+        Returns the cached DataFrame and extra results or None
+        """
+        with self._lock:
+            if key in self._memory:
+                df, extra, created = self._memory.pop(key)
+                if time.time() - created <= self.ttl:
+                    self._memory[key] = (df, extra, created)
+                    self.hits += 1
+                    try:
+                        os.utime(os.path.join(self.cache_dir, key + ".json"))
+                    except OSError:
+                        pass
+                    return df, extra
+
+        data_path = os.path.join(self.cache_dir, key + ".arrow")
+        meta_path = os.path.join(self.cache_dir, key + ".json")
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if time.time() - meta["created"] > self.ttl:
+                self._remove(key)
+                raise FileNotFoundError(meta_path)
+            df = feather.read_feather(data_path)
+            os.utime(meta_path)  # Mark as recently used
+        except (OSError, ValueError, KeyError, pa.ArrowException):
+            with self._lock:
+                self.misses += 1
+            return None
+        df.attrs["fingerprint"] = key
+        self._keep_in_memory(key, df, meta["extra"], meta["created"], hit=True)
+        return df, meta["extra"]
+
+    def _keep_in_memory(self, key, df, extra, created, hit=False):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            self._memory[key] = (df, extra, created)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def set(self, key, df, extra=None):
+        """
+        Stores a DataFrame and JSON serializable extra results
+
+        Returns False if they cannot be written to disk, they are then only
+        kept in memory.
+        """
+        data_path = os.path.join(self.cache_dir, key + ".arrow")
+        meta_path = os.path.join(self.cache_dir, key + ".json")
+        temp_path = f"{data_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if not all(isinstance(_, str) for _ in df.columns):
+                # Would be read back with string column names
+                raise TypeError("Column names must be strings")
+            # Write to a temporary file first so readers never see partial files
+            feather.write_feather(df, temp_path, compression="zstd")
+            os.replace(temp_path, data_path)
+            with open(temp_path, "w") as f:
+                json.dump({"created": time.time(), "extra": extra}, f)
+            os.replace(temp_path, meta_path)
+        except (OSError, ValueError, TypeError, pa.ArrowException):
+            # E.g. non-string column names, keep the entry in memory only
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            self._remove(key)
+            written = False
+        else:
+            written = True
+        df.attrs["fingerprint"] = key
+        self._keep_in_memory(key, df, extra, time.time())
+        if written:
+            self.evict()
+        return written
+
+    def _entries(self):
+        """
+        Returns (last access, size, key, created) of the cache entries
+        """
+        entries = []
+        cache_dir = self.cache_dir
+        for file_name in os.listdir(cache_dir):
+            if not file_name.endswith(".json"):
+                continue
+            key = file_name[: -len(".json")]
+            try:
+                meta_stat = os.stat(os.path.join(cache_dir, file_name))
+                data_stat = os.stat(os.path.join(cache_dir, key + ".arrow"))
+            except FileNotFoundError:
+                continue
+            size = meta_stat.st_size + data_stat.st_size
+            entries.append((meta_stat.st_mtime, size, key, data_stat.st_mtime))
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Removes expired entries and the least recently used ones above the size cap
+        """
+        with self._lock:
+            entries = self._entries()
+            total_size = sum(_[1] for _ in entries)
+            now = time.time()
+            for last_access, size, key, created in entries:
+                if now - created > self.ttl or total_size > self.max_size:
+                    self._remove(key)
+                    self._memory.pop(key, None)
+                    total_size -= size
+                    self.evictions += 1
+
+    def stats(self):
+        """
+        Hit, miss and eviction counts of this process and the size on disk
+        """
+        entries = self._entries()
+        with self._lock:
+            counts = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+        return {
+            **counts,
+            "entries": len(entries),
+            "size": sum(_[1] for _ in entries),
+        }
+
+    def memoize(self, func):
+        """
+        Caches functions returning a DataFrame or a tuple starting with one
+
+        The key is stored in `df.attrs["fingerprint"]` as the identity of the
+        data. Mixed type object columns are returned as strings.
+        """
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = fingerprint(
+                (func.__module__, func.__qualname__, args, sorted(kwargs.items()))
+            )
+            cached = self.get(key)
+            if cached is not None:
+                df, extra = cached
+                return df if extra is None else (df, *extra)
+
+            result = func(*args, **kwargs)
+            if isinstance(result, tuple):
+                df, extra = result[0], list(result[1:])
+            else:
+                df, extra = result, None
+            if isinstance(df, pd.DataFrame) and len(df.columns) > 0:
+                # Fresh results match the ones read from the cache
+                df = _arrow_compatible(df)
+                self.set(key, df, extra)
+                result = df if extra is None else (df, *extra)
+            return result
+
+        return wrapper
+
+
+# Cache of loaded datasets, bounded by OMICLEARN_CACHE_SIZE_MB and OMICLEARN_CACHE_TTL_HOURS
+DATA_CACHE = DiskCache(
+    "data",
+    max_size=int(float(os.environ.get("OMICLEARN_CACHE_SIZE_MB", 2048)) * (1 << 20)),
+    ttl=float(os.environ.get("OMICLEARN_CACHE_TTL_HOURS", 168)) * 3600,
+)
@@ -0,0 +1,751 @@
+"""OmicLearn data loading helpers."""
+import csv
+import os
+import re
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from .cache_helper import DATA_CACHE
+
+# Checkpoint for the calamine Excel reader
+calamine_installed = False
+try:
+    from python_calamine import CalamineWorkbook
+
+    calamine_installed = True
+except ModuleNotFoundError:
+    pass
+
+# File extensions of the columnar formats
+COLUMNAR_FORMATS = {
+    ".parquet": "Parquet File",
+    ".feather": "Feather File",
+    ".arrow": "Arrow IPC File",
+    ".ipc": "Arrow IPC File",
+}
+
+# Delimiters of the text formats
+CSV_DELIMITERS = {"Comma (,)": ",", "Semicolon (;)": ";", "Tab (\\t) for TSV": "\t"}
+
+# Compressed text files
+COMPRESSIONS = {".gz": "gzip", ".zst": "zstd", ".zip": "zip"}
+
+# Layouts of text files
+DATA_LAYOUTS = ["Samples as rows", "Features as rows", "Long format"]
+
+# Cells matching this pattern are numbers after replacing decimal commas
+NUMBER_PATTERN = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$|^[-+]?(inf|Inf|INF)$"
+
+
+# File extensions that can be read from the data root
+DATA_FILE_EXTENSIONS = (
+    (".csv", ".tsv", ".txt", ".xlsx", ".xls")
+    + tuple(COLUMNAR_FORMATS)
+    + tuple(COMPRESSIONS)
+)
+
+
+def get_compression(file_name):
+    """
+    Returns the compression of a file name or None
+    """
+    return COMPRESSIONS.get(os.path.splitext(file_name)[1].lower())
+
+
+def _zip_member(archive):
+    """
+    Returns the first file of a zip archive
+    """
+    for member in archive.infolist():
+        if not member.is_dir() and not member.filename.startswith("__MACOSX"):
+            return member
+    raise ValueError("The zip archive does not contain a file.")
+
+
+def get_decompressed_name(source, file_name, compression):
+    """
+    File name without the compression extension or the name inside the zip archive
+    """
+    if compression == "zip":
+        with zipfile.ZipFile(source) as archive:
+            return _zip_member(archive).filename
+    return os.path.splitext(file_name)[0]
+
+
+def open_decompressed(source, compression):
+    """
+    Opens a stream of the decompressed content of a file path or buffer
+
+    The content is decompressed block by block while it is read.
+    """
+    if compression == "zip":
+        _rewind(source)
+        archive = zipfile.ZipFile(source)
+        return archive.open(_zip_member(archive))
+    if isinstance(source, str):
+        raw = pa.OSFile(source)
+    else:
+        raw = pa.BufferReader(pa.py_buffer(source.getbuffer()))
+    return pa.CompressedInputStream(raw, compression)
+
+
+def sniff_delimiter(stream, n_bytes=1 << 16):
+    """
+    Detects the delimiter from the first bytes of a text stream or returns None
+    """
+    if isinstance(stream, str):
+        with open(stream, "rb") as f:
+            return sniff_delimiter(f, n_bytes)
+    sample = stream.read(n_bytes)
+    _rewind(stream)
+    if len(sample) == n_bytes:
+        sample = sample[: sample.rfind(b"\n")]  # Ignore the incomplete line
+    sample = sample.decode("utf-8", errors="ignore")
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=",;\t").delimiter
+    except csv.Error:
+        return None
+    return {v: k for k, v in CSV_DELIMITERS.items()}[delimiter]
+
+
+def get_data_root():
+    """
+    Returns the allow-listed server directory with datasets or None
+    """
+    data_root = os.environ.get("OMICLEARN_DATA_ROOT")
+    if data_root and os.path.isdir(data_root):
+        return os.path.realpath(data_root)
+    return None
+
+
+def list_data_files(data_root):
+    """
+    Lists the readable files below the data root as relative paths
+    """
+    data_root = os.path.realpath(data_root)
+    data_files = []
+    for directory, directories, files in os.walk(data_root):
+        directories[:] = sorted(_ for _ in directories if not _.startswith("."))
+        for file_name in sorted(files):
+            if not file_name.lower().endswith(DATA_FILE_EXTENSIONS):
+                continue
+            file_path = os.path.join(directory, file_name)
+            real_path = os.path.realpath(file_path)
+            if os.path.commonpath([data_root, real_path]) == data_root:
+                data_files.append(os.path.relpath(file_path, data_root))
+    return data_files
+
+
+def resolve_data_path(data_root, relative_path):
+    """
+    Returns the real path of a file below the data root
+
+    Raises a ValueError for paths leaving the data root, e.g. by symlinks.
+    """
+    data_root = os.path.realpath(data_root)
+    file_path = os.path.realpath(os.path.join(data_root, relative_path))
+    if os.path.commonpath([data_root, file_path]) != data_root:
+        raise ValueError(f"{relative_path} is not inside the data directory.")
+    if not os.path.isfile(file_path):
+        raise ValueError(f"{relative_path} is not a file.")
+    return file_path
+
+
+@DATA_CACHE.memoize
+def read_sample_file(file_path):
+    """
+    Reads a bundled Excel dataset, converted to Arrow on first use
+    """
+    return pd.read_excel(file_path)
+
+
+def _excel_header(names):
+    """
+    Column names of a header row, named and de-duplicated like pd.read_excel
+    """
+    columns = []
+    for position, name in enumerate(names):
+        if name == "":
+            name = f"Unnamed: {position}"
+        elif isinstance(name, float) and name.is_integer():
+            name = int(name)
+        columns.append(name)
+
+    # Duplicates get the first free suffix of ".1", ".2", ..., named columns first
+    named = [_ for _, name in enumerate(names) if name != ""]
+    unnamed = [_ for _, name in enumerate(names) if name == ""]
+    counts = {}
+    for position in named + unnamed:
+        name = original = columns[position]
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[original] = count + 1
+            name = f"{original}.{count}"
+            count = count + 1 if name in columns else counts.get(name, 0)
+        columns[position] = name
+        counts[name] = count + 1
+    return columns
+
+
+def _read_excel_calamine(source):
+    """
+    Reads the first sheet of an Excel file with calamine
+    """
+    if isinstance(source, str):
+        workbook = CalamineWorkbook.from_path(source)
+    else:
+        source.seek(0)
+        workbook = CalamineWorkbook.from_filelike(source)
+    rows = workbook.get_sheet_by_index(0).to_python()
+    if len(rows) == 0:
+        return pd.DataFrame()
+
+    # Empty cells are empty strings, whole numbers are floats
+    df = pd.DataFrame(rows[1:], columns=_excel_header(rows[0]))
+    df = df.replace("", np.nan).infer_objects()
+    for column in df.columns[(df.dtypes == "float64").to_numpy()]:
+        values = df[column].to_numpy()
+        if np.isfinite(values).all() and (values == np.floor(values)).all():
+            df[column] = values.astype(np.int64)
+    return df
+
+
+def read_excel_file(source):
+    """
+    Reads the first sheet of an Excel file and removes non-string columns
+    """
+    if calamine_installed:
+        df = _read_excel_calamine(source)
+    else:
+        df = pd.read_excel(source, sheet_name=0)
+
+    # Check if all columns are strings
+    warnings = []
+    valid_columns = np.asarray(df.columns.map(type) == str, dtype=bool)
+    if not valid_columns.all():
+        for idx in np.flatnonzero(~valid_columns):
+            _ = df.columns[idx]
+            warnings.append(
+                f"Removing column {idx} with value {_} as type is {type(_)} and not string."
+            )
+        warnings.append(
+            "Errors detected when importing Excel file. Please check that Excel did not convert protein names to dates."
+        )
+        df = df.loc[:, valid_columns]
+
+    return df, warnings
+
+
+def get_columnar_format(file_name):
+    """
+    Returns the columnar format of a file name or None
+    """
+    return COLUMNAR_FORMATS.get(os.path.splitext(file_name)[1].lower())
+
+
+class ColumnarDataset:
+    """
+    Parquet, Feather or Arrow IPC dataset that only reads the requested columns
+
+    Files on disk are memory-mapped, uploaded files are read from their
+    buffer without copying. Rows are identified by their position.
+    """
+
+    def __init__(self, source, file_format):
+        if isinstance(source, str):
+            self._source = pa.memory_map(source)
+        else:
+            self._source = pa.BufferReader(pa.py_buffer(source.getbuffer()))
+        self.file_format = file_format
+        self._table = None
+        self._n_missing = {}
+
+        if file_format == "Parquet File":
+            self._parquet = pq.ParquetFile(self._source)
+            schema = self._parquet.schema_arrow
+        elif file_format in ["Feather File", "Arrow IPC File"]:
+            try:
+                schema = pa.ipc.open_file(self._source).schema
+            except pa.ArrowInvalid:
+                # Feather V1 files and Arrow IPC streams are read at once
+                self._source.seek(0)
+                if file_format == "Feather File":
+                    self._table = feather.read_table(self._source)
+                else:
+                    self._table = pa.ipc.open_stream(self._source).read_all()
+                schema = self._table.schema
+        else:
+            raise NotImplementedError(f"Format {file_format} not implemented")
+
+        # Ignore the index columns written by pandas
+        index_columns = (schema.pandas_metadata or {}).get("index_columns", [])
+        self.columns = [_ for _ in schema.names if _ not in index_columns]
+        self.metadata_columns = [_ for _ in self.columns if _.startswith("_")]
+        self.feature_columns = [_ for _ in self.columns if not _.startswith("_")]
+        # pandas stores NaN values as nulls, other writers may keep NaN floats
+        self._float_columns = set()
+        if schema.pandas_metadata is None:
+            self._float_columns = {
+                _.name for _ in schema if pa.types.is_floating(_.type)
+            }
+
+    def _read_table(self, columns):
+        if self._table is not None:
+            return self._table.select(columns)
+        elif self.file_format == "Parquet File":
+            return self._parquet.read(columns=columns, use_threads=True)
+        else:
+            return feather.read_table(self._source, columns=columns)
+
+    def read(self, columns, rows=None):
+        """
+        Reads the given columns, and optionally only the given row positions
+        """
+        table = self._read_table(list(columns))
+        if rows is not None:
+            table = table.take(pa.array(np.asarray(rows, dtype=np.int64)))
+        return table.to_pandas(
+            ignore_metadata=True, split_blocks=True, self_destruct=True
+        )
+
+    def n_missing(self, columns):
+        """
+        Number of missing values in the given columns, nulls and NaN values
+
+        Nulls are counted from the Parquet statistics or the null counts of
+        the columns. Only the float columns of files not written by pandas
+        are scanned for NaN values.
+        """
+        key = tuple(columns)
+        if key not in self._n_missing:
+            n_missing = None
+            if self._table is None and self.file_format == "Parquet File":
+                n_missing = self._parquet_null_count(columns)
+            if n_missing is None:
+                n_missing = self._scan_missing(columns, count_nulls=True)
+            else:
+                nan_columns = [_ for _ in columns if _ in self._float_columns]
+                n_missing += self._scan_missing(nan_columns, count_nulls=False)
+            self._n_missing[key] = n_missing
+        return self._n_missing[key]
+
+    def _scan_missing(self, columns, count_nulls):
+        """
+        Counts the NaN values, and optionally the nulls, of the given columns
+        """
+        n_missing, start, batch_size = 0, 0, 1000
+        # Read in batches of about 64 MB of columns to bound the memory
+        while start < len(columns):
+            table = self._read_table(list(columns[start : start + batch_size]))
+            for name, column in zip(table.column_names, table.columns):
+                if count_nulls:
+                    n_missing += column.null_count
+                if name in self._float_columns:
+                    n_missing += pc.sum(pc.is_nan(column)).as_py() or 0
+            start += batch_size
+            batch_size = max(1, (64 << 20) * batch_size // max(table.nbytes, 1))
+        return n_missing
+
+    def _parquet_null_count(self, columns):
+        """
+        Null count from the Parquet statistics, None if they are not available
+        """
+        metadata = self._parquet.metadata
+        schema = self._parquet.schema_arrow
+        positions = [schema.get_field_index(_) for _ in columns]
+        n_missing = 0
+        for row_group in range(metadata.num_row_groups):
+            row_group = metadata.row_group(row_group)
+            for position in positions:
+                statistics = row_group.column(position).statistics
+                if statistics is None or not statistics.has_null_count:
+                    return None
+                n_missing += statistics.null_count
+        return n_missing
+
+
+def read_typed_csv(source, delimiter, precision="float64"):
+    """
+    Reads a wide CSV/TSV matrix with the multithreaded Arrow parser
+
+    All columns without a leading '_' are converted to the given float
+    precision. Decimal commas are converted and other non-numeric cells
+    are set to NaN, the coerced cells are reported as warnings.
+    """
+    table = pv.read_csv(
+        source,
+        # Large blocks avoid splitting wide tables in many small chunks
+        read_options=pv.ReadOptions(use_threads=True, block_size=1 << 26),
+        parse_options=pv.ParseOptions(delimiter=CSV_DELIMITERS[delimiter]),
+        convert_options=pv.ConvertOptions(strings_can_be_null=True),
+    )
+    float_type = pa.from_numpy_dtype(np.dtype(precision))
+
+    decimal_commas, non_numeric, examples = {}, {}, set()
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        if name.startswith("_"):
+            columns.append(column)
+            continue
+        if not (
+            pa.types.is_integer(column.type)
+            or pa.types.is_floating(column.type)
+            or pa.types.is_boolean(column.type)
+            or pa.types.is_null(column.type)
+        ):
+            column = pc.utf8_trim_whitespace(pc.cast(column, pa.string()))
+            has_comma = pc.match_substring(column, ",")
+            column = pc.replace_substring(column, ",", ".")
+            is_number = pc.match_substring_regex(column, NUMBER_PATTERN)
+            n_commas = pc.sum(pc.and_(has_comma, is_number)).as_py() or 0
+            invalid = pc.invert(is_number)
+            n_invalid = pc.sum(invalid).as_py() or 0
+            if n_commas:
+                decimal_commas[name] = n_commas
+            if n_invalid:
+                non_numeric[name] = n_invalid
+                if len(examples) < 5:
+                    examples.update(pc.unique(pc.filter(column, invalid)).to_pylist())
+            column = pc.if_else(is_number, column, pa.scalar(None, pa.string()))
+        columns.append(pc.cast(column, float_type))
+    # Release the Arrow buffers while converting
+    table = pa.table(columns, names=table.column_names)
+    del columns
+    df = table.to_pandas(self_destruct=True)
+    del table
+
+    warnings = []
+    for counts, text in [
+        (decimal_commas, "Converted {} cells with decimal commas in {} columns"),
+        (non_numeric, "Set {} non-numeric cells in {} columns to NaN"),
+    ]:
+        if counts:
+            warnings.append(_column_warning(text, counts))
+    if examples:
+        examples = ", ".join(f"'{_}'" for _ in sorted(examples)[:5])
+        warnings.append(f"Non-numeric values found: {examples}.")
+    return df, warnings
+
+
+def _column_warning(text, counts):
+    """
+    Formats a warning with the total count and the first columns of `counts`
+    """
+    warning = text.format(sum(counts.values()), len(counts))
+    warning += f" ({', '.join(str(_) for _ in list(counts)[:5])}"
+    warning += ", ...)." if len(counts) > 5 else ")."
+    return warning
+
+
+def _rewind(source):
+    """
+    Moves a buffer back to its start, paths and streams are left as they are
+    """
+    if hasattr(source, "seek") and source.seekable():
+        source.seek(0)
+
+
+def read_header(source, delimiter):
+    """
+    Returns the column names of a text file
+    """
+    _rewind(source)
+    return pd.read_csv(source, sep=CSV_DELIMITERS[delimiter], nrows=0).columns.tolist()
+
+
+def read_features_as_rows(
+    source, delimiter, feature_column, sample_prefix="", chunksize=10000
+):
+    """
+    Transposes a text file with one row per feature, read in chunks of rows
+
+    Sample columns are the columns starting with `sample_prefix`, the prefix
+    is removed from the sample names. Non-numeric cells are set to NaN and
+    columns without any numeric value are excluded.
+    """
+    _rewind(source)
+    features, blocks, sample_columns = [], [], None
+    for chunk in pd.read_csv(
+        source, sep=CSV_DELIMITERS[delimiter], chunksize=chunksize
+    ):
+        if sample_columns is None:
+            # From the header, non-numeric cells can turn up in any chunk
+            sample_columns = [
+                _
+                for _ in chunk.columns
+                if _ != feature_column and str(_).startswith(sample_prefix)
+            ]
+            n_numeric = np.zeros(len(sample_columns), dtype=np.int64)
+            n_coerced = np.zeros(len(sample_columns), dtype=np.int64)
+        chunk = chunk[chunk[feature_column].notnull()]
+        values = chunk[sample_columns]
+        if not all(pd.api.types.is_numeric_dtype(_) for _ in values.dtypes):
+            coerced = values.apply(pd.to_numeric, errors="coerce")
+            n_coerced += (coerced.isnull() & values.notnull()).to_numpy().sum(axis=0)
+            values = coerced
+        values = values.to_numpy(dtype=np.float64)
+        n_numeric += (~np.isnan(values)).sum(axis=0)
+        features.append(chunk[feature_column].astype(str).to_numpy())
+        blocks.append(values)
+
+    if not sample_columns:
+        return pd.DataFrame(), [f"No columns starting with '{sample_prefix}' found."]
+    warnings = []
+    excluded = (n_numeric == 0) & (n_coerced > 0)
+    if excluded.any():
+        excluded_columns = np.array(sample_columns, dtype=object)[excluded]
+        warnings.append(
+            _column_warning(
+                "Excluded {} columns without numeric values",
+                dict.fromkeys(excluded_columns, 1),
+            )
+        )
+    coerced = {
+        column: n for column, n in zip(sample_columns, n_coerced * ~excluded) if n > 0
+    }
+    if coerced:
+        warnings.append(
+            _column_warning("Set {} non-numeric cells in {} columns to NaN", coerced)
+        )
+    if excluded.all():
+        return pd.DataFrame(), warnings + [
+            f"No numeric columns starting with '{sample_prefix}' found."
+        ]
+    features = pd.Index(np.concatenate(features))
+    values = np.concatenate(blocks).T[~excluded]
+    sample_columns = np.array(sample_columns, dtype=object)[~excluded]
+    duplicated = features.duplicated()
+    if duplicated.any():
+        warnings.append(f"Removing {duplicated.sum()} rows with duplicated features.")
+        features, values = features[~duplicated], values[:, ~duplicated]
+
+    df = pd.DataFrame(values, columns=features)
+    df.insert(0, "_sample", [_[len(sample_prefix) :] for _ in sample_columns])
+    return df, warnings
+
+
+def read_long_format(
+    source, delimiter, sample_column, feature_column, value_column, chunksize=1000000
+):
+    """
+    Pivots a text file with one row per sample and feature, read in chunks
+
+    The codes of samples and features are collected per chunk and the
+    values are placed in the wide matrix at once.
+    """
+    _rewind(source)
+    samples, features = pd.Index([], dtype=object), pd.Index([], dtype=object)
+    sample_codes, feature_codes, values = [], [], []
+    for chunk in pd.read_csv(
+        source,
+        sep=CSV_DELIMITERS[delimiter],
+        usecols=[sample_column, feature_column, value_column],
+        chunksize=chunksize,
+    ):
+        chunk = chunk.dropna(subset=[sample_column, feature_column])
+        chunk_samples = chunk[sample_column].astype(str)
+        chunk_features = chunk[feature_column].astype(str)
+        samples = samples.append(
+            pd.Index(chunk_samples.unique()).difference(samples, sort=False)
+        )
+        features = features.append(
+            pd.Index(chunk_features.unique()).difference(features, sort=False)
+        )
+        sample_codes.append(samples.get_indexer(chunk_samples).astype(np.int32))
+        feature_codes.append(features.get_indexer(chunk_features).astype(np.int32))
+        values.append(
+            pd.to_numeric(chunk[value_column], errors="coerce").to_numpy(float)
+        )
+
+    warnings = []
+    sample_codes = np.concatenate(sample_codes) if sample_codes else np.zeros(0, int)
+    feature_codes = np.concatenate(feature_codes) if feature_codes else np.zeros(0, int)
+    n_duplicated = len(sample_codes) - len(
+        np.unique(sample_codes.astype(np.int64) * len(features) + feature_codes)
+    )
+    if n_duplicated:
+        warnings.append(
+            f"Found {n_duplicated} duplicated sample and feature pairs, using the last value."
+        )
+
+    matrix = np.full((len(samples), len(features)), np.nan)
+    if len(values):
+        matrix[sample_codes, feature_codes] = np.concatenate(values)
+    df = pd.DataFrame(matrix, columns=features)
+    df.insert(0, "_sample", samples)
+    return df, warnings
+
+
+def join_sample_annotations(df, annotations, key):
+    """
+    Adds the sample annotations matching the `_sample` column by `key`
+
+    Annotation columns get a leading '_' so they are not used as features.
+    """
+    annotations = annotations.rename(
+        columns=lambda _: _ if str(_).startswith("_") else f"_{_}"
+    )
+    key = key if key.startswith("_") else f"_{key}"
+    annotations = annotations.drop_duplicates(key).set_index(key)
+    annotations.index = annotations.index.astype(str)
+    annotations = annotations.drop(columns=["_sample"], errors="ignore")
+
+    warnings = []
+    existing = annotations.columns.intersection(df.columns)
+    if len(existing):
+        warnings.append(
+            f"Skipping annotations already in the dataset: {', '.join(existing)}."
+        )
+        annotations = annotations.drop(columns=existing)
+    matched = df["_sample"].isin(annotations.index)
+    if not matched.all():
+        warnings.append(f"No annotations found for {(~matched).sum()} samples.")
+    annotations = annotations.reindex(df["_sample"]).reset_index(drop=True)
+    # Columns are inserted into a shallow copy, the features are not copied
+    sample_position = df.columns.get_loc("_sample")
+    df = df.copy(deep=False)
+    for position, column in enumerate(annotations.columns, sample_position + 1):
+        df.insert(position, column, annotations[column].to_numpy())
+    return df, warnings
+
+
+def _column_statistics(values):
+    """
+    Missing count, mean, variance, minimum and maximum of the observed values
+
+    The variance of all-NaN columns is 0, the other statistics are NaN.
+    """
+    missing = np.isnan(values)
+    n_observed = len(values) - missing.sum(axis=0)
+    filled = np.where(missing, 0.0, values)
+    mean = filled.sum(axis=0) / np.maximum(n_observed, 1)
+    np.subtract(filled, mean, out=filled)
+    filled[missing] = 0.0
+    variance = np.einsum("ij,ij->j", filled, filled) / np.maximum(n_observed, 1)
+    empty = n_observed == 0
+    with np.errstate(invalid="ignore"):
+        minimum = np.fmin.reduce(values, axis=0, initial=np.inf)
+        maximum = np.fmax.reduce(values, axis=0, initial=-np.inf)
+    mean, minimum, maximum = [
+        np.where(empty, np.nan, _) for _ in [mean, minimum, maximum]
+    ]
+    return missing.sum(axis=0), mean, variance, minimum, maximum
+
+
+class DatasetProfile:
+    """
+    Column roles, types and statistics of a dataset, computed in one pass
+
+    Features are the columns without a leading '_'. The missing fraction,
+    mean, variance, minimum and maximum are computed from the observed
+    values of each feature; value counts are kept for the other columns.
+    """
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self.dtypes = df.dtypes
+        self.feature_columns = [_ for _ in df.columns if not str(_).startswith("_")]
+        self.metadata_columns = [_ for _ in df.columns if str(_).startswith("_")]
+
+        # Statistics of the observed values in blocks of columns to bound the memory
+        positions = np.flatnonzero(~df.columns.astype(str).str.startswith("_"))
+        n_features = len(positions)
+        statistics = np.full((5, n_features), np.nan)
+        for start in range(0, n_features, 256):
+            features = df.iloc[:, positions[start : start + 256]]
+            if not all(pd.api.types.is_numeric_dtype(_) for _ in features.dtypes):
+                features = features.apply(pd.to_numeric, errors="coerce")
+            values = features.to_numpy(dtype=float)
+            statistics[:, start : start + values.shape[1]] = _column_statistics(values)
+        n_missing, mean, variance, minimum, maximum = statistics
+
+        index = pd.Index(self.feature_columns)
+        self.missing_fraction = pd.Series(n_missing / max(self.n_rows, 1), index=index)
+        self.mean = pd.Series(mean, index=index)
+        self.variance = pd.Series(variance, index=index)
+        self.minimum = pd.Series(minimum, index=index)
+        self.maximum = pd.Series(maximum, index=index)
+
+        metadata = df[self.metadata_columns]
+        self.value_counts = {_: metadata[_].value_counts() for _ in metadata.columns}
+        self.n_missing = int(n_missing.sum()) + int(metadata.isnull().to_numpy().sum())
+
+
+# Ways to select features by name
+FEATURE_PATTERNS = ["Regex", "Prefix"]
+
+
+class FeatureRegistry:
+    """
+    Feature names with a hashed name to position lookup
+
+    Selections are resolved with sets and returned in the order of the
+    features, so huge feature lists never need list membership tests.
+    """
+
+    def __init__(self, features):
+        self.features = list(features)
+        self.positions = {}
+        for i, name in enumerate(self.features):
+            self.positions.setdefault(name, i)
+
+    def __len__(self):
+        return len(self.features)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def resolve(self, names):
+        """
+        Returns the known names in feature order and the unknown names
+        """
+        known = {_ for _ in names if _ in self.positions}
+        unknown = list(dict.fromkeys(_ for _ in names if _ not in self.positions))
+        return self.select(include=known), unknown
+
+    def match(self, pattern, mode="Regex"):
+        """
+        Returns the features matching a regex or starting with one of the prefixes
+
+        Prefixes are separated by commas or whitespace. Invalid regular
+        expressions raise a ValueError.
+        """
+        if mode == "Regex":
+            try:
+                regex = re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"Invalid regular expression {pattern}: {e}") from e
+            return [_ for _ in self.features if regex.search(str(_))]
+        elif mode == "Prefix":
+            prefixes = tuple(_ for _ in re.split(r"[,\s]+", pattern) if _)
+            if len(prefixes) == 0:
+                return []
+            return [_ for _ in self.features if str(_).startswith(prefixes)]
+        else:
+            raise NotImplementedError(f"Pattern {mode} not implemented")
+
+    def select(self, include=None, exclude=()):
+        """
+        Returns the included features, all by default, without the excluded ones
+        """
+        exclude = set(exclude)
+        if include is None:
+            return [_ for _ in self.features if _ not in exclude]
+        include = set(include) - exclude
+        positions = sorted(self.positions[_] for _ in include if _ in self.positions)
+        return [self.features[_] for _ in positions]
+
+    def page(self, names, page, page_size=50):
+        """
+        Returns the names on a page, counted from 1, and the number of pages
+        """
+        n_pages = max(1, -(-len(names) // page_size))
+        page = min(max(page, 1), n_pages)
+        return names[(page - 1) * page_size : page * page_size], n_pages
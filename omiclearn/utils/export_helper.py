@@ -0,0 +1,82 @@
+"""OmicLearn background exports of figures and tables."""
+import io
+import json
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+# Size of the exported figures
+FIGURE_SIZE = dict(height=700, width=700, scale=1)
+
+
+class ExportService:
+    """
+    Renders figures in a background thread with a warm kaleido process
+
+    Kaleido keeps one renderer process per Python process, which renders
+    one figure at a time. The figures are therefore rendered one after the
+    other in a single thread, in the order they were submitted. The renderer
+    is started when the service is created, so the first export does not
+    wait for it. The zip file of a bundle is written after its figures.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="omiclearn-export"
+        )
+        self._warm_up = self._executor.submit(self._start_renderer)
+
+    @staticmethod
+    def _start_renderer():
+        pio.to_image(go.Figure(), format="svg", **FIGURE_SIZE)
+
+    def render(self, fig, image_format):
+        """
+        Returns a future of the figure's image in the given format
+        """
+        return self._executor.submit(_render, fig, image_format)
+
+    def bundle(self, figures, tables, texts, config):
+        """
+        Returns a future of a zip file with all figures as PDF and SVG,
+        the tables as CSV, the texts as TXT and the config as JSON
+        """
+        renders = {
+            f"{name}.{image_format}": self.render(fig, image_format)
+            for name, fig in figures.items()
+            for image_format in ["pdf", "svg"]
+        }
+        return self._executor.submit(
+            _write_bundle, renders, dict(tables), dict(texts), config
+        )
+
+
+def _render(fig, image_format):
+    """
+    Renders a figure, WebGL traces are exported as vector graphics
+    """
+    if any(trace.type == "scattergl" for trace in fig.data):
+        fig = fig.to_dict()
+        for trace in fig["data"]:
+            if trace["type"] == "scattergl":
+                trace["type"] = "scatter"
+        fig = go.Figure(fig)
+    return pio.to_image(fig, format=image_format, **FIGURE_SIZE)
+
+
+def _write_bundle(renders, tables, texts, config):
+    """
+    Writes the rendered figures, tables, texts and config into a zip file
+    """
+    tables = {name: df.to_csv(index=False) for name, df in tables.items()}
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as bundle:
+        for name, text in {**tables, **texts}.items():
+            bundle.writestr(name, text)
+        bundle.writestr("run_config.json", json.dumps(config, indent=2, default=str))
+        # Submitted before the bundle, so they are already rendered
+        for name, render in renders.items():
+            bundle.writestr(name, render.result())
+    return buffer.getvalue()
@@ -1,4 +1,6 @@
 # Main
+import weakref
+
 import numpy as np
 import pandas as pd
 
@@ -8,7 +10,7 @@ import sklearn.metrics as metrics
 import streamlit as st
 from sklearn import ensemble, linear_model, neighbors, svm, tree
 from sklearn.feature_selection import SelectKBest, chi2, f_classif, mutual_info_classif
-from sklearn.impute import KNNImputer, SimpleImputer
+from sklearn.impute import KNNImputer
 from sklearn.metrics import auc, precision_recall_curve, roc_curve
 from sklearn.model_selection import (
     RepeatedStratifiedKFold,
@@ -16,7 +18,6 @@ from sklearn.model_selection import (
     StratifiedShuffleSplit,
 )
 from sklearn.preprocessing import (
-    LabelEncoder,
     MinMaxScaler,
     PowerTransformer,
     QuantileTransformer,
@@ -24,6 +25,8 @@ from sklearn.preprocessing import (
     StandardScaler,
 )
 
+from .data_helper import DatasetProfile
+
 # Define base metrics to be used
 scores = [
     "accuracy",
@@ -38,47 +41,344 @@ scorer_dict = {metric: metric + "_score" for metric in scores}
 scorer_dict = {key: getattr(metrics, metric) for key, metric in scorer_dict.items()}
 
 
-@st.cache_data(persist=True)
-def transform_dataset(subset, additional_features, proteins):
+# Encodings of categorical additional features
+CATEGORICAL_ENCODINGS = ["Label", "One-hot", "Frequency"]
+
+
+class CategoricalEncoder:
+    """
+    Label, one-hot or frequency encoding of categorical columns in one pass
+
+    Categories are sorted as in sklearn's LabelEncoder, so label encoding
+    gives the same codes. Frequencies are the fractions of the fitted rows
+    and do not use the target. Unseen and missing values are NaN, or belong
+    to no category with one-hot encoding. The fitted mappings can encode
+    new samples of the same dataset.
+    """
+
+    def __init__(self):
+        self.categories_ = {}
+        self.frequencies_ = {}
+        self._codes = {}
+        self._fitted = None
+
+    def fit(self, df, columns=None, rows=None):
+        """
+        Fits the categories of `columns`, all object and category columns by default
+        """
+        if columns is None:
+            columns = df.columns
+        for column in columns:
+            series = df[column] if rows is None else df[column].iloc[rows]
+            if not is_categorical(series.dtype):
+                continue
+            codes, categories = pd.factorize(series, sort=True)
+            counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+            self.categories_[column] = categories
+            self.frequencies_[column] = counts / max(len(codes), 1)
+            if rows is None:
+                self._codes[column] = codes.astype(np.int32)
+        # Codes of the fitted frame are reused instead of looking up the values
+        self._fitted = weakref.ref(df) if rows is None else None
+        return self
+
+    def feature_names(self, columns, encoding="Label"):
+        """
+        Returns the names of the encoded columns
+        """
+        names = []
+        for column in columns:
+            if encoding == "One-hot" and column in self.categories_:
+                names.extend(f"{column}={_}" for _ in self.categories_[column])
+            else:
+                names.append(column)
+        return names
+
+    def transform(self, df, columns, encoding="Label", rows=None, out=None):
+        """
+        Encodes `columns` of the selected rows into a float array
+
+        Columns that were not fitted are copied as numbers.
+        """
+        if encoding not in CATEGORICAL_ENCODINGS:
+            raise NotImplementedError(f"Encoding {encoding} not implemented")
+        n_rows = len(df) if rows is None else len(rows)
+        if out is None:
+            out = np.empty((n_rows, len(self.feature_names(columns, encoding))))
+
+        i = 0
+        for column in columns:
+            series = df[column] if rows is None else df[column].iloc[rows]
+            if column not in self.categories_:
+                out[:, i] = series.to_numpy(dtype=out.dtype)
+                i += 1
+                continue
+
+            if self._fitted is not None and self._fitted() is df:
+                codes = self._codes[column]
+                codes = codes if rows is None else codes[rows]
+            else:
+                codes = self.categories_[column].get_indexer(series)
+            known = codes >= 0
+            if encoding == "One-hot":
+                n_categories = len(self.categories_[column])
+                out[:, i : i + n_categories] = codes[:, None] == np.arange(n_categories)
+                i += n_categories
+                continue
+            elif encoding == "Frequency":
+                out[:, i] = np.where(known, self.frequencies_[column][codes], np.nan)
+            else:
+                out[:, i] = np.where(known, codes, np.nan)
+            i += 1
+        return out
+
+
+def is_categorical(dtype):
+    """
+    Returns whether columns of this dtype are encoded as categories
+    """
+    return dtype in [np.dtype("O"), np.dtype("str")] or isinstance(
+        dtype, pd.CategoricalDtype
+    )
+
+
+def transform_dataset(
+    subset, additional_features, proteins, rows=None, encoder=None, encoding="Label"
+):
+    """
+    Transforms data with the categorical encoder into one read-only float matrix
+
+    `rows` are the positions of the rows to use, all rows by default. Without
+    a fitted encoder the categories are taken from these rows. The columns
+    are copied blockwise into a single array, which is float32 if all protein
+    columns are float32 and float64 otherwise.
+    """
+    if rows is None:
+        rows = np.arange(len(subset))
+    if encoder is None:
+        encoder = CategoricalEncoder().fit(subset, additional_features, rows)
+    positions = subset.columns.get_indexer(proteins)
+    dtypes = subset.dtypes.iloc[positions]
+    dtype = (
+        np.float32 if len(dtypes) > 0 and (dtypes == np.float32).all() else np.float64
+    )
+
+    encoded_features = encoder.feature_names(additional_features, encoding)
+    values = np.empty((len(rows), len(proteins) + len(encoded_features)), dtype)
+    for start in range(0, len(proteins), 256):
+        block = subset.iloc[:, positions[start : start + 256]].to_numpy(dtype=dtype)
+        values[:, start : start + block.shape[1]] = block[rows]
+    encoder.transform(
+        subset, additional_features, encoding, rows, out=values[:, len(proteins) :]
+    )
+
+    # The matrix is shared by all CV splits and must not be modified
+    values.flags.writeable = False
+    return pd.DataFrame(
+        values,
+        index=subset.index[rows],
+        columns=list(proteins) + encoded_features,
+        copy=False,
+    )
+
+
+def feature_view(X, columns):
+    """
+    Returns X[columns], without a copy if the columns are contiguous in X
+    Contiguous columns in reverse order, as of the feature selection, are also views.
+    """
+    positions = X.columns.get_indexer(columns)
+    for step in [1, -1]:
+        if len(positions) > 0 and np.array_equal(
+            positions, positions[0] + step * np.arange(len(positions))
+        ):
+            stop = positions[-1] + step
+            return X.iloc[:, positions[0] : (stop if stop >= 0 else None) : step]
+    return X[columns]
+
+
+def _take(X, rows, columns):
+    """
+    Returns X.iloc[rows, columns] with a single copy of the selected values
+    """
+    return pd.DataFrame(
+        X.to_numpy()[np.ix_(rows, columns)],
+        index=X.index[rows],
+        columns=X.columns[columns],
+    )
+
+
+def prefilter_features(X, max_missing_fraction=1.0, min_variance=0.0, profile=None):
     """
-    Transforms data with label encoder
+    Returns the features passing the missing value and variance thresholds
+    The statistics are taken from the profile of X if it is given
     """
-    transformed_columns = []
-    for _ in additional_features:
-        if subset[_].dtype in [np.dtype("O"), np.dtype("str")]:
-            le = LabelEncoder()
-            transformed = le.fit_transform(subset[_])
+    if profile is None:
+        profile = DatasetProfile(X)
+    missing_fraction = profile.missing_fraction[X.columns].to_numpy()
+    variance = profile.variance[X.columns].to_numpy()
+    keep = (missing_fraction <= max_missing_fraction) & (variance >= min_variance)
+    return X.columns[keep].tolist()
+
+
+def _duplicate_groups(values):
+    """
+    Groups identical columns by hashing their values
+    """
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(values.T), index=False)
+    groups = []
+    for columns in pd.Series(hashes.index).groupby(hashes.values).groups.values():
+        columns = np.sort(np.asarray(columns))
+        # Resolve hash collisions by comparing the values
+        while len(columns) > 1:
+            same = np.array(
+                [
+                    np.array_equal(values[:, columns[0]], values[:, _], equal_nan=True)
+                    for _ in columns
+                ]
+            )
+            groups.append(columns[same])
+            columns = columns[~same]
+    return [_ for _ in groups if len(_) > 1]
+
+
+def _correlated_pairs(values, threshold, min_common=0.5):
+    """
+    Returns the feature pairs with an absolute Pearson correlation above threshold
+
+    The correlation of each pair is computed on the samples where both
+    features are observed, pairs observed together in less than `min_common`
+    of the samples are skipped. It is computed in blocks of columns so that
+    the full feature x feature matrix is never held in memory.
+    """
+    # Features by samples, centered and scaled so that the sums below are well conditioned
+    values = np.array(values, dtype=np.float32).T
+    observed = ~np.isnan(values)
+    n_observed = np.maximum(observed.sum(axis=1, keepdims=True), 1)
+    values[~observed] = 0
+    values -= values.sum(axis=1, keepdims=True) / n_observed
+    values[~observed] = 0
+    scale = np.sqrt((values**2).sum(axis=1, keepdims=True) / n_observed)
+    np.divide(values, scale, out=values, where=scale > 0)
+    complete = observed.all()
+    n_features, n_samples = values.shape
+    if not complete:
+        observed = observed.astype(np.float32)
+        squares = values**2
+        min_observed = max(3, min_common * n_samples)
+
+    # Small blocks skip most of the lower triangle of the correlation matrix
+    block = min(_chunk_size(8 * 4 * n_features), 256)
+    rows, cols = [], []
+    for start in range(0, n_features, block):
+        x, y = values[start : start + block], values[start:]
+        sum_xy = x @ y.T
+        if complete:
+            # Features are scaled to unit variance on all samples
+            corr = sum_xy / n_samples
         else:
-            transformed = subset[_]
-        transformed_columns.append(
-            pd.DataFrame(transformed, columns=[_], index=subset[_].index)
+            mask_x, mask_y = observed[start : start + block], observed[start:]
+            n = mask_x @ mask_y.T
+            sum_x, sum_y = x @ mask_y.T, mask_x @ y.T
+            with np.errstate(divide="ignore", invalid="ignore"):
+                var_x = squares[start : start + block] @ mask_y.T - sum_x**2 / n
+                var_y = mask_x @ squares[start:].T - sum_y**2 / n
+                corr = (sum_xy - sum_x * sum_y / n) / np.sqrt(var_x * var_y)
+            # Pairs without enough common samples or constant on them are skipped
+            corr[(n < min_observed) | ~(var_x > 1e-4 * n) | ~(var_y > 1e-4 * n)] = 0
+        i, j = np.nonzero(np.abs(corr) >= threshold)
+        upper = j > i  # Keep each pair once, without the diagonal
+        rows.append(i[upper] + start)
+        cols.append(j[upper] + start)
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def prune_redundant_features(X, correlation_threshold=None):
+    """
+    Removes duplicate and highly correlated features and keeps one per cluster
+
+    Returns the kept features and a dict mapping each kept feature to the
+    removed features it represents.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    values = X.to_numpy(dtype=float)
+    n_features = values.shape[1]
+    rows, cols = [], []
+
+    # Exact duplicates
+    unique = np.ones(n_features, dtype=bool)
+    for group in _duplicate_groups(values):
+        rows.append(np.full(len(group) - 1, group[0]))
+        cols.append(group[1:])
+        unique[group[1:]] = False
+
+    # Clusters of correlated features
+    if correlation_threshold is not None:
+        unique_idx = np.flatnonzero(unique)
+        i, j = _correlated_pairs(values[:, unique_idx], correlation_threshold)
+        rows.append(unique_idx[i])
+        cols.append(unique_idx[j])
+
+    if rows:
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+    graph = coo_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, cols)), shape=(n_features, n_features)
+    )
+    n_clusters, labels = connected_components(graph, directed=False)
+
+    # Keep the most complete and then most variable feature of each cluster
+    completeness = (~np.isnan(values)).sum(axis=0)
+    variance = np.nan_to_num(np.nanvar(np.where(completeness > 0, values, 0), axis=0))
+    order = np.lexsort((np.arange(n_features), -variance, -completeness, labels))
+    first = np.r_[True, labels[order][1:] != labels[order][:-1]]
+    representatives = order[first]
+    representative_of = np.empty(n_clusters, dtype=int)
+    representative_of[labels[representatives]] = representatives
+
+    columns = X.columns
+    kept = columns[np.sort(representatives)].tolist()
+    clusters = {}
+    for idx in order[~first]:
+        clusters.setdefault(columns[representative_of[labels[idx]]], []).append(
+            columns[idx]
         )
+    return kept, clusters
 
-    if len(transformed_columns) > 1:
-        transformed = pd.concat(transformed_columns, axis=1)
-    elif len(transformed_columns) == 1:
-        transformed = transformed_columns[0]
-    else:
-        transformed = []
 
-    # Join with proteins
-    protein_features = subset[proteins].astype("float")
+class BlockedScaler:
+    """
+    Fits and applies a scaler in blocks of columns
 
-    if len(transformed) >= 1 and len(protein_features) >= 1:
-        X = pd.concat([protein_features, transformed], axis=1)
-    else:
-        if len(transformed) == 0:
-            X = protein_features
-        elif len(protein_features) == 0:
-            X = transformed
-        else:
-            pass
-    return X
+    The scalers scale each feature on its own, so fitting one per block of
+    columns gives the same result, while their temporary copies of the data
+    are only as large as a block.
+    """
+
+    def __init__(self, scaler, copy=True):
+        self.scaler = scaler
+        self.copy = copy
+
+    def fit(self, X):
+        values = np.asarray(X, dtype=float)
+        self.scalers_ = [
+            sklearn.base.clone(self.scaler).fit(values[:, start : start + 256])
+            for start in range(0, values.shape[1], 256)
+        ]
+        return self
 
+    def transform(self, X):
+        X = np.array(X, dtype=float, copy=self.copy)
+        for start, scaler in zip(range(0, X.shape[1], 256), self.scalers_):
+            X[:, start : start + 256] = scaler.transform(X[:, start : start + 256])
+        return X
 
-def normalize_dataset(X, normalization, normalization_params):
+
+def normalize_dataset(X, normalization, normalization_params, copy=True):
     """
     Normalize/Scale data with scalers
+    With `copy=False`, float data is scaled in place
     """
 
     class scaler_:
@@ -110,6 +410,8 @@ def normalize_dataset(X, normalization, normalization_params):
             f"Normalization method {normalization} not implemented"
         )
 
+    if normalization != "None":
+        scaler = BlockedScaler(scaler, copy=copy)
     scaler.fit(X)
     return (
         pd.DataFrame(scaler.transform(X), columns=X.columns, index=X.index),
@@ -117,6 +419,15 @@ def normalize_dataset(X, normalization, normalization_params):
     )
 
 
+def _fill_zero(X):
+    """
+    Returns X with missing values set to 0, X itself if it has none
+    """
+    if np.isnan(X.to_numpy(dtype=float, copy=False)).any():
+        return X.fillna(0)
+    return X
+
+
 def select_features(feature_method, X, y, max_features, n_trees, random_state):
     """
     Returns the features and their imp. attributes based on the given method and params
@@ -125,7 +436,7 @@ def select_features(feature_method, X, y, max_features, n_trees, random_state):
         clf = ensemble.ExtraTreesClassifier(
             n_estimators=n_trees, random_state=random_state
         )
-        clf = clf.fit(X.fillna(0), y)
+        clf = clf.fit(_fill_zero(X), y)
         feature_importance = clf.feature_importances_
         top_sortindex = np.argsort(feature_importance)[::-1]
         p_values = np.empty(len(feature_importance))
@@ -142,7 +453,7 @@ def select_features(feature_method, X, y, max_features, n_trees, random_state):
             raise NotImplementedError(
                 f"Feature method {feature_method} not implemented."
             )
-        clf = clf.fit(X.fillna(0), y)
+        clf = clf.fit(_fill_zero(X), y)
         feature_importance = clf.scores_
         p_values = clf.pvalues_
         if p_values is None:
@@ -165,9 +476,297 @@ def select_features(feature_method, X, y, max_features, n_trees, random_state):
     return top_features, top_features_importance, top_features_pvalues
 
 
-def impute_nan(X, missing_value, random_state):
+def _chunk_size(bytes_per_row):
+    """
+    Returns the number of rows that fit into sklearn's `working_memory`
+    """
+    working_memory = sklearn.get_config()["working_memory"] * 2**20
+    return max(1, int(working_memory // max(bytes_per_row, 1)))
+
+
+def select_knn_features(X, min_completeness, max_features=None):
+    """
+    Returns the columns with at least `min_completeness` observed values
+    """
+    completeness = 1 - np.isnan(X).mean(axis=0)
+    candidates = np.flatnonzero(completeness >= min_completeness)
+    if max_features and len(candidates) > max_features:
+        order = np.argsort(-completeness[candidates], kind="stable")
+        candidates = np.sort(candidates[order[:max_features]])
+    if len(candidates) == 0:
+        candidates = np.arange(X.shape[1])
+    return candidates
+
+
+class KNNDistanceCache:
+    """
+    NaN-Euclidean sample distances computed blockwise and shared between CV splits
+    """
+
+    def __init__(self, X, min_completeness=0.0, max_features=None):
+        values = X.to_numpy(dtype=float)
+        self.feature_idx = select_knn_features(values, min_completeness, max_features)
+        self.features = X.columns[self.feature_idx]
+        self._values = values[:, self.feature_idx]
+        self._index = pd.Index(X.index)
+        n_samples = len(values)
+        self._distances = np.empty((n_samples, n_samples))
+        self._computed = np.zeros(n_samples, dtype=bool)
+
+    def positions(self, index):
+        """
+        Returns the row positions of `index` or None if a row is not cached
+        """
+        if not self._index.is_unique:
+            return None
+        positions = self._index.get_indexer(index)
+        if (positions < 0).any():
+            return None
+        return positions
+
+    def distances(self, rows, cols):
+        """
+        Returns the distances between the cached `rows` and `cols` positions
+        """
+        missing = np.unique(rows[~self._computed[rows]])
+        n_samples, n_features = self._values.shape
+        chunk = _chunk_size(8 * (3 * n_samples + 2 * n_features))
+        for start in range(0, len(missing), chunk):
+            block = missing[start : start + chunk]
+            self._distances[block] = metrics.pairwise.nan_euclidean_distances(
+                self._values[block], self._values
+            )
+            self._computed[block] = True
+        return self._distances[np.ix_(rows, cols)]
+
+
+class BlockedKNNImputer:
+    """
+    KNNImputer with blocked distances, restricted neighbor features and reusable distances
+    """
+
+    def __init__(
+        self,
+        n_neighbors=5,
+        min_completeness=0.0,
+        max_features=None,
+        n_candidates=50,
+        distance_cache=None,
+    ):
+        self.n_neighbors = n_neighbors
+        self.min_completeness = min_completeness
+        self.max_features = max_features
+        self.n_candidates = n_candidates
+        self.distance_cache = distance_cache
+
+    def fit(self, X):
+        self.columns_ = X.columns
+        self._fit_X = X.to_numpy(dtype=float)
+        self._mask_fit_X = np.isnan(self._fit_X)
+        self._valid_mask = ~self._mask_fit_X.all(axis=0)
+        self._fit_X_filled = np.where(self._mask_fit_X, 0.0, self._fit_X)
+        self._fit_positions = None
+        if self.distance_cache is not None:
+            self._fit_positions = self.distance_cache.positions(X.index)
+            neighbor_features = self.distance_cache.features
+        else:
+            neighbor_features = X.columns[
+                select_knn_features(
+                    self._fit_X, self.min_completeness, self.max_features
+                )
+            ]
+        self._neighbor_idx = self.columns_.get_indexer(neighbor_features)
+        self._neighbor_idx = self._neighbor_idx[self._neighbor_idx >= 0]
+        return self
+
+    def _query_distances(self, X, query_index, rows):
+        """
+        Distances between `rows` of X and the fitted samples
+        """
+        if self._fit_positions is not None and query_index is not None:
+            return self.distance_cache.distances(query_index[rows], self._fit_positions)
+        return metrics.pairwise.nan_euclidean_distances(
+            X[np.ix_(rows, self._neighbor_idx)],
+            self._fit_X[:, self._neighbor_idx],
+        )
+
+    def _impute_exact(self, X, rows, dist, need):
+        """
+        Per-column imputation following `KNNImputer` for the `need` entries
+        """
+        for col in np.flatnonzero(need.any(axis=0)):
+            (donors_idx,) = np.nonzero(~self._mask_fit_X[:, col])
+            receivers = np.flatnonzero(need[:, col])
+            dist_subset = dist[receivers][:, donors_idx]
+
+            # Receivers with all nan distances are imputed with the mean
+            all_nan = np.isnan(dist_subset).all(axis=1)
+            X[rows[receivers[all_nan]], col] = self._fit_X[donors_idx, col].mean()
+            receivers = receivers[~all_nan]
+            if len(receivers) == 0:
+                continue
+
+            n_neighbors = min(self.n_neighbors, len(donors_idx))
+            nearest = np.argpartition(dist[receivers][:, donors_idx], n_neighbors - 1)
+            nearest = nearest[:, :n_neighbors]
+            X[rows[receivers], col] = self._fit_X[donors_idx[nearest], col].mean(axis=1)
+
+    def transform(self, X):
+        query_index = None
+        if self.distance_cache is not None and isinstance(X, pd.DataFrame):
+            query_index = self.distance_cache.positions(X.index)
+        X = np.array(X, dtype=float)
+        mask = np.isnan(X)
+        mask[:, ~self._valid_mask] = False
+        rows_missing = np.flatnonzero(mask.any(axis=1))
+
+        n_fit, n_features = self._fit_X.shape
+        n_donors = (~self._mask_fit_X).sum(axis=0)
+        n_neighbors = np.minimum(self.n_neighbors, n_donors)
+        n_candidates = min(max(self.n_candidates, self.n_neighbors), n_fit)
+        chunk = _chunk_size(8 * (2 * n_fit + 3 * n_candidates * n_features))
+
+        for start in range(0, len(rows_missing), chunk):
+            rows = rows_missing[start : start + chunk]
+            dist = self._query_distances(X, query_index, rows)
+            need = mask[rows]
+
+            # Nearest candidate donors of each receiver, sorted by distance
+            dist_sort = np.where(np.isnan(dist), np.inf, dist)
+            candidates = np.argsort(dist_sort, axis=1, kind="stable")[:, :n_candidates]
+            finite = np.isfinite(np.take_along_axis(dist_sort, candidates, axis=1))
+
+            # Take the first `n_neighbors` candidates with a value per column
+            candidate_valid = ~self._mask_fit_X[candidates] & finite[:, :, None]
+            rank = np.cumsum(candidate_valid, axis=1)
+            use = candidate_valid & (rank <= n_neighbors)
+            counts = use.sum(axis=1)
+            sums = np.einsum("rcf,rcf->rf", self._fit_X_filled[candidates], use)
+
+            resolved = need & (counts == n_neighbors) & (n_neighbors > 0)
+            block = X[rows]
+            block[resolved] = sums[resolved] / counts[resolved]
+            X[rows] = block
+
+            # Fall back to the full donor search when candidates are not enough
+            fallback = need & ~resolved
+            if fallback.any():
+                self._impute_exact(X, rows, dist, fallback)
+
+        return X[:, self._valid_mask]
+
+
+class BlockedSimpleImputer:
+    """
+    SimpleImputer that computes the statistics and fills the values in blocks of columns
+
+    Gives the results of `SimpleImputer` for the constant, mean and median
+    strategies, but only blocks of columns are copied. Unlike `SimpleImputer`,
+    columns without observed values are kept, `impute_nan()` removes them.
+    """
+
+    def __init__(self, strategy, fill_value=0, copy=True):
+        self.strategy = strategy
+        self.fill_value = fill_value
+        self.copy = copy
+
+    def fit(self, X):
+        values = np.asarray(X, dtype=float)
+        if self.strategy == "constant":
+            self.statistics_ = np.full(values.shape[1], float(self.fill_value))
+        elif self.strategy in ["mean", "median"]:
+            statistic = np.nanmean if self.strategy == "mean" else np.nanmedian
+            self.statistics_ = np.concatenate(
+                [np.empty(0)]
+                + [
+                    statistic(values[:, start : start + 256], axis=0)
+                    for start in range(0, values.shape[1], 256)
+                ]
+            )
+        else:
+            raise NotImplementedError(f"Strategy {self.strategy} not implemented")
+        return self
+
+    def transform(self, X):
+        X = np.array(X, dtype=float, copy=self.copy)
+        for start in range(0, X.shape[1], 256):
+            block = X[:, start : start + 256]
+            rows, cols = np.nonzero(np.isnan(block))
+            block[rows, cols] = self.statistics_[start + cols]
+        return X
+
+
+def _nanquantile(values, q):
+    """
+    Column-wise quantile of observed values in a single sort of the matrix
+    """
+    sorted_values = np.sort(values, axis=0)  # NaNs are sorted to the end
+    n_observed = (~np.isnan(values)).sum(axis=0)
+    position = q * np.maximum(n_observed - 1, 0)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, np.maximum(n_observed - 1, 0))
+    lower_values = np.take_along_axis(sorted_values, lower[None, :], axis=0)[0]
+    upper_values = np.take_along_axis(sorted_values, upper[None, :], axis=0)[0]
+    return lower_values + (position - lower) * (upper_values - lower_values)
+
+
+class ProteomicsImputer:
+    """
+    Fold-aware proteomics imputation with values below the detection limit
+    """
+
+    def __init__(
+        self,
+        strategy,
+        random_state=None,
+        downshift=1.8,
+        width=0.3,
+        quantile=0.01,
+        tune_sigma=1.0,
+        copy=True,
+    ):
+        self.strategy = strategy
+        self.random_state = random_state
+        self.downshift = downshift
+        self.width = width
+        self.quantile = quantile
+        self.tune_sigma = tune_sigma
+        self.copy = copy
+
+    def fit(self, X):
+        values = np.asarray(X, dtype=float)
+        if self.strategy == "Minimum":
+            self.loc_ = np.nanmin(values, axis=0)
+            self.scale_ = np.zeros(values.shape[1])
+        elif self.strategy == "Downshifted normal":
+            mean = np.nanmean(values, axis=0)
+            std = np.nanstd(values, axis=0)
+            self.loc_ = mean - self.downshift * std
+            self.scale_ = self.width * std
+        elif self.strategy == "MinProb":
+            std = np.nanstd(values, axis=0)
+            self.loc_ = _nanquantile(values, self.quantile)
+            self.scale_ = np.full(values.shape[1], np.median(std) * self.tune_sigma)
+        else:
+            raise NotImplementedError(f"Method {self.strategy} not implemented")
+        self._rng = np.random.default_rng(self.random_state)
+        return self
+
+    def transform(self, X):
+        X = np.array(X, dtype=float, copy=self.copy)
+        rows, cols = np.nonzero(np.isnan(X))
+        if self.strategy == "Minimum":
+            X[rows, cols] = self.loc_[cols]
+        else:
+            draws = self._rng.standard_normal(len(cols))
+            X[rows, cols] = self.loc_[cols] + self.scale_[cols] * draws
+        return X
+
+
+def impute_nan(X, missing_value, random_state, imputation_params=None, copy=True):
     """
     Missing value imputation
+    With `copy=False`, float data is imputed in place, except by the KNN imputers
     """
 
     class imputer_:
@@ -177,17 +776,23 @@ def impute_nan(X, missing_value, random_state):
         def fit(self, x):
             pass
 
-    X = X[X.columns[~X.isnull().all()]]  # Remove columns w only nans
+    empty = X.isnull().all()
+    if empty.any():
+        X = X.loc[:, ~empty]  # Remove columns w only nans
     if missing_value == "Zero":
-        imp = SimpleImputer(missing_values=np.nan, strategy="constant", fill_value=0)
+        imp = BlockedSimpleImputer("constant", fill_value=0, copy=copy)
     elif missing_value == "Mean":
-        imp = SimpleImputer(missing_values=np.nan, strategy="mean")
+        imp = BlockedSimpleImputer("mean", copy=copy)
     elif missing_value == "Median":
-        imp = SimpleImputer(missing_values=np.nan, strategy="median")
+        imp = BlockedSimpleImputer("median", copy=copy)
     elif missing_value == "None":
         imp = imputer_()
     elif missing_value == "KNNImputer":
         imp = KNNImputer()
+    elif missing_value in ["Downshifted normal", "Minimum", "MinProb"]:
+        imp = ProteomicsImputer(missing_value, random_state=random_state, copy=copy)
+    elif missing_value == "KNNImputer (blocked)":
+        imp = BlockedKNNImputer(**(imputation_params or {}))
     else:
         raise NotImplementedError(f"Method {missing_value} not implemented")
 
@@ -211,7 +816,10 @@ def return_classifier(classifier, classifier_params):
         cp["n_jobs"] = -1
 
     if classifier == "LinearSVC":
-        cv_generator = cp["cv_generator"]
+        # Calibration settings are consumed in `fit_linear_svc()`
+        cv_generator = cp.pop("cv_generator", None)
+        cp.pop("calibration", None)
+        cp.pop("calibration_holdout", None)
     else:
         cv_generator = None
 
@@ -231,13 +839,147 @@ def return_classifier(classifier, classifier_params):
     elif classifier == "AdaBoost":
         clf = ensemble.AdaBoostClassifier()
     elif classifier == "LinearSVC":
-        del cp["cv_generator"]
         clf = svm.LinearSVC()
 
     clf.set_params(**cp)
     return clf, cv_generator
 
 
+class RankingClassifier:
+    """
+    Wraps a fitted LinearSVC to report uncalibrated decision scores
+
+    `predict_proba()` returns the raw decision scores as `[-s, s]` instead of
+    probabilities. They rank the samples like probabilities would, which is
+    all that ROC AUC and PR AUC need, but they are not bounded to [0, 1].
+    """
+
+    def __init__(self, clf):
+        self.clf = clf
+
+    def predict(self, x):
+        return self.clf.predict(x)
+
+    def predict_proba(self, x):
+        scores = self.clf.decision_function(x)
+        return np.column_stack([-scores, scores])
+
+
+def _holdout_size(y, holdout_size):
+    """
+    Returns the number of holdout samples, or None if a class is too small to split
+
+    Both the holdout and the remaining samples keep at least one sample per class.
+    """
+    class_counts = y.value_counts()
+    n_classes = len(class_counts)
+    if class_counts.min() < 2:
+        return None
+    n_holdout = int(np.ceil(holdout_size * len(y)))
+    return min(max(n_holdout, n_classes), len(y) - n_classes)
+
+
+def fit_linear_svc(
+    clf, X_train, y_train, calibration, cv_generator, holdout_size, random_state
+):
+    """
+    Fits LinearSVC with the given calibration and returns the model and its coefficients
+
+    If a class is too small for the Platt scaling holdout, the uncalibrated
+    ranking classifier is returned.
+    """
+    from sklearn.calibration import CalibratedClassifierCV
+
+    if calibration in [None, "CalibratedClassifierCV"]:
+        # Since LinearSVC does not have `predict_proba()`
+        model = CalibratedClassifierCV(clf, cv=cv_generator)
+        model.fit(X_train, y_train)
+        coef_avg = 0
+        for j in model.calibrated_classifiers_:
+            coef_avg = coef_avg + j.estimator.coef_
+        coef_avg = coef_avg / len(model.calibrated_classifiers_)
+        coef = coef_avg[0]
+
+    elif calibration == "Platt scaling (holdout)":
+        # Single SVM fit, sigmoid fitted on the decision scores of a holdout
+        n_holdout = _holdout_size(y_train, holdout_size)
+        if n_holdout is None:
+            return fit_linear_svc(
+                clf, X_train, y_train, "None (ranking only)", None, None, None
+            )
+        splitter = StratifiedShuffleSplit(
+            n_splits=1, test_size=n_holdout, random_state=random_state
+        )
+        fit_index, holdout_index = next(splitter.split(X_train, y_train))
+        clf.fit(X_train.iloc[fit_index], y_train.iloc[fit_index])
+        model = CalibratedClassifierCV(clf, cv="prefit", method="sigmoid")
+        model.fit(X_train.iloc[holdout_index], y_train.iloc[holdout_index])
+        coef = clf.coef_[0]
+
+    elif calibration == "None (ranking only)":
+        clf.fit(X_train, y_train)
+        model = RankingClassifier(clf)
+        coef = clf.coef_[0]
+
+    else:
+        raise NotImplementedError(f"Calibration {calibration} not implemented")
+
+    return model, coef
+
+
+class FeatureImportanceAccumulator:
+    """
+    Running statistics of the feature importances over the CV splits
+
+    Each split adds the importances of the features it used, so a feature's
+    sum, mean and variance (Welford) are taken over the splits that selected it.
+    """
+
+    def __init__(self, features):
+        self.features = pd.Index(features)
+        self.n_splits = 0
+        self.n_selected = np.zeros(len(self.features), dtype=int)
+        self.sum = np.zeros(len(self.features))
+        self.mean = np.zeros(len(self.features))
+        self._m2 = np.zeros(len(self.features))
+
+    def add(self, features, importance):
+        """
+        Adds the importances of the features used in one split
+        """
+        idx = self.features.get_indexer(features)
+        values = np.asarray(importance, dtype=float)
+        self.n_splits += 1
+        self.n_selected[idx] += 1
+        self.sum[idx] += values
+        delta = values - self.mean[idx]
+        self.mean[idx] += delta / self.n_selected[idx]
+        self._m2[idx] += delta * (values - self.mean[idx])
+
+    @property
+    def std(self):
+        """
+        Sample standard deviation, NaN for features selected less than twice
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(
+                self.n_selected > 1, np.sqrt(self._m2 / (self.n_selected - 1)), np.nan
+            )
+
+    def any(self):
+        """
+        Whether any importance is not zero
+        """
+        return bool(self.mean.any() or self._m2.any())
+
+    def __repr__(self):
+        selected = self.n_selected > 0
+        return "FeatureImportanceAccumulator(n_splits={}, sum={})".format(
+            self.n_splits,
+            dict(zip(self.features[selected], self.sum[selected].round(6).tolist())),
+        )
+
+
 def perform_cross_validation(state, cohort_column=None):
     """
     Performs cross-validation
@@ -276,10 +1018,13 @@ def perform_cross_validation(state, cohort_column=None):
         "roc_curves_",
         "pr_curves_",
         "y_hats_",
-        "feature_importances_",
         "features_",
     ]:
         _cv_curves[_] = []
+    _cv_curves["feature_importances_"] = FeatureImportanceAccumulator(state.features)
+    if state.classifier == "LinearSVC":
+        # Splits without a calibration holdout, see `fit_linear_svc()`
+        _cv_curves["n_uncalibrated"] = 0
 
     for metric_name, metric_fct in scorer_dict.items():
         _cv_results[metric_name] = []
@@ -312,22 +1057,39 @@ def perform_cross_validation(state, cohort_column=None):
     else:
         iterator = cv_alg.split(X, y)
 
-    X = X[state.features]
+    # Splits are taken from the shared matrix, which is never copied as a whole
+    feature_index = X.columns.get_indexer(state.features)
+
+    # Distances for the blocked KNNImputer are shared between the splits
+    imputation_params = dict(state.get("imputation_params", {}))
+    if state.missing_value == "KNNImputer (blocked)":
+        imputation_params["distance_cache"] = KNNDistanceCache(
+            feature_view(X, state.features),
+            imputation_params.get("min_completeness", 0.0),
+            imputation_params.get("max_features"),
+        )
+
     for i, (train_index, test_index) in enumerate(iterator):
-        # Missing value imputation
+        # Missing value imputation, in place on the rows taken for this split
         X_train, imputer = impute_nan(
-            X.iloc[train_index], state.missing_value, state.random_state
+            _take(X, train_index, feature_index),
+            state.missing_value,
+            state.random_state,
+            imputation_params,
+            copy=False,
         )
         cols = X_train.columns  # Columns could be removed bc of nan
-        X_test = pd.DataFrame(imputer.transform(X.iloc[test_index][cols]), columns=cols)
+        X_test = _take(X, test_index, X.columns.get_indexer(cols))
+        X_test = pd.DataFrame(imputer.transform(X_test), columns=cols)
 
-        # Normalization of data
+        # Normalization of data, also in place
         X_train, scaler = normalize_dataset(
-            X_train, state.normalization, state.normalization_params
+            X_train, state.normalization, state.normalization_params, copy=False
         )
         X_test = pd.DataFrame(
             scaler.transform(X_test), columns=X_test.columns, index=X_test.index
         )
+        del imputer, scaler  # The KNN imputers keep copies of the training data
 
         # Define y
         y_train = y.iloc[train_index]
@@ -359,16 +1121,25 @@ def perform_cross_validation(state, cohort_column=None):
                 state.random_state,
             )
 
-            X_train = X_train[features_]
-            X_test = X_test[features_]
+            X_train = feature_view(X_train, features_)
+            X_test = feature_view(X_test, features_)
 
             # Fitting and predicting, and calculating prediction probabilities
             if state.classifier == "LinearSVC":
-                # Since LinearSVC does not have `predict_proba()`
-                from sklearn.calibration import CalibratedClassifierCV
-
-                calibrated_clf = CalibratedClassifierCV(clf, cv=cv_generator)
-                calibrated_clf.fit(X_train, y_train)
+                calibrated_clf, svc_coef = fit_linear_svc(
+                    clf,
+                    X_train,
+                    y_train,
+                    state.classifier_params.get("calibration"),
+                    cv_generator,
+                    state.classifier_params.get("calibration_holdout", 0.2),
+                    state.random_state,
+                )
+                if isinstance(calibrated_clf, RankingClassifier) and (
+                    state.classifier_params.get("calibration")
+                    == "Platt scaling (holdout)"
+                ):
+                    _cv_curves["n_uncalibrated"] += 1
 
                 # Train
                 y_train_pred = calibrated_clf.predict(X_train)
@@ -390,11 +1161,7 @@ def perform_cross_validation(state, cohort_column=None):
             if state.classifier == "LogisticRegression":
                 feature_importance = np.abs(clf.coef_[0])
             elif state.classifier == "LinearSVC":
-                coef_avg = 0
-                for j in calibrated_clf.calibrated_classifiers_:
-                    coef_avg = coef_avg + j.estimator.coef_
-                coef_avg = coef_avg / len(calibrated_clf.calibrated_classifiers_)
-                feature_importance = coef_avg[0]
+                feature_importance = svc_coef
             elif state.classifier in [
                 "AdaBoost",
                 "RandomForest",
@@ -465,8 +1232,8 @@ def perform_cross_validation(state, cohort_column=None):
             _cv_curves["y_hats_"].append((y_test.values, y_pred))
 
             if feature_importance is not None:
-                _cv_curves["feature_importances_"].append(
-                    dict(zip(X_train.columns.tolist(), feature_importance))
+                _cv_curves["feature_importances_"].add(
+                    X_train.columns, feature_importance
                 )
             else:
                 _cv_curves["feature_importances_"] = None
@@ -1,13 +1,14 @@
 # Plotly Graphs
+import os
 from itertools import chain
 
 # Others
 import numpy as np
 import pandas as pd
 import plotly.express as px
-import plotly.figure_factory as ff
 import plotly.graph_objects as go
-from scipy.spatial.distance import pdist, squareform
+import scipy.cluster.hierarchy as sch
+from scipy.spatial.distance import squareform
 from sklearn.decomposition import PCA
 from sklearn.metrics import auc
 
@@ -19,20 +20,46 @@ BLUE_COLOR = "#035672"
 RED_COLOR = "#f84f57"
 GRAY_COLOR = "#ccc"
 
+# Fold curves with more points are decimated for display
+MAX_CURVE_POINTS = 500
+
+# Clustering heatmaps with more features are averaged down to this size
+MAX_HEATMAP_SIZE = 500
+
+# Memory limit of the hierarchical clustering, set by OMICLEARN_CLUSTERING_MEMORY_MB
+MAX_CLUSTERING_MEMORY = float(
+    os.environ.get("OMICLEARN_CLUSTERING_MEMORY_MB", 2048)
+) * (1 << 20)
+
+# Rows of the matrices computed at once for the clustering
+CLUSTERING_BLOCK_SIZE = 512
+
 
 # Prepare feature importance chart
-def plot_feature_importance(feature_importance):
+def plot_feature_importance(feature_importance, feature_clusters=None):
     """
     Creates a Plotly barplot to plot feature importance
+
+    `feature_importance` is the FeatureImportanceAccumulator of the CV splits.
+    `feature_clusters` maps representative features to the redundant
+    features they replace, which are listed as cluster members.
     """
-    fi = [pd.DataFrame.from_dict(_, orient="index") for _ in feature_importance]
-    feature_df_ = pd.concat(fi)
-    feature_df = feature_df_.groupby(feature_df_.index).sum()
-    feature_df_std = feature_df_.groupby(feature_df_.index).std()
-    feature_df_std = feature_df_std / feature_df_std.sum() / feature_df.sum()
-    feature_df.columns = ["Feature_importance"]
-    feature_df = feature_df / feature_df.sum()
-    feature_df["Std"] = feature_df_std.values
+    selected = feature_importance.n_selected > 0
+    feature_df = pd.DataFrame(
+        {
+            "Feature_importance": feature_importance.sum[selected],
+            "Std": feature_importance.std[selected],
+            "Selected": feature_importance.n_selected[selected]
+            / feature_importance.n_splits,
+        },
+        index=feature_importance.features[selected],
+    ).sort_index()
+    feature_df["Std"] = (
+        feature_df["Std"]
+        / feature_df["Std"].sum()
+        / feature_df["Feature_importance"].sum()
+    )
+    feature_df["Feature_importance"] /= feature_df["Feature_importance"].sum()
 
     feature_df = feature_df.sort_values(by="Feature_importance", ascending=False)
     feature_df = feature_df[feature_df["Feature_importance"] > 0]
@@ -42,20 +69,27 @@ def plot_feature_importance(feature_importance):
     if len(feature_df) > display_limit:
         remainder = pd.DataFrame(
             {
-                "Feature_importance": [feature_df.iloc[display_limit:].sum().values[0]],
+                "Feature_importance": [
+                    feature_df["Feature_importance"].iloc[display_limit:].sum()
+                ],
                 "Name": "Remainder",
             },
             index=["Remainder"],
         )
-        feature_df = feature_df.iloc[
-            :display_limit
-        ]  # Show at most `display_limit` entries
-        feature_df = feature_df.append(remainder)
+        # Show at most `display_limit` entries
+        feature_df = pd.concat([feature_df.iloc[:display_limit], remainder])
 
     feature_df["Feature_importance"] = (
         feature_df["Feature_importance"].map("{:.3f}".format).astype(np.float32)
     )
     feature_df["Std"] = feature_df["Std"].map("{:.5f}".format)
+    feature_df["Selected"] = feature_df["Selected"].map(
+        "{:.0%}".format, na_action="ignore"
+    )
+    if feature_clusters:
+        feature_df["Cluster members"] = feature_df["Name"].map(
+            lambda x: ", ".join(feature_clusters.get(x, []))
+        )
     feature_df_wo_links = feature_df.copy()
     feature_df["Name"] = feature_df["Name"].apply(
         lambda x: '<a href="https://www.ncbi.nlm.nih.gov/search/all/?term={}" title="Search on NCBI" target="_blank">{}</a>'.format(
@@ -77,6 +111,7 @@ def plot_feature_importance(feature_importance):
         "Feature_importance": "Feature importances from the classifier",
         "Plot_Name": "Names",
         "Std": "Standard Deviation",
+        "Selected": "Selected in splits",
     }
 
     # Hide pvalue if it does not exist
@@ -85,7 +120,10 @@ def plot_feature_importance(feature_importance):
         "Name": True,
         "Feature_importance": True,
         "Std": True,
+        "Selected": True,
     }
+    if feature_clusters:
+        hover_data["Cluster members"] = True
     p = px.bar(
         feature_df.iloc[::-1],
         x="Feature_importance",
@@ -115,13 +153,23 @@ def plot_feature_importance(feature_importance):
             "Name": "Name and NCBI Link",
             "Feature_importance": "Feature Importance",
             "Std": "Standard Deviation",
+            "Selected": "Selected in splits",
         },
         inplace=True,
     )
 
+    table_columns = [
+        "Name and NCBI Link",
+        "Feature Importance",
+        "Standard Deviation",
+        "Selected in splits",
+    ]
+    if feature_clusters:
+        table_columns.append("Cluster members")
+
     return (
         p,
-        feature_df[["Name and NCBI Link", "Feature Importance", "Standard Deviation"]],
+        feature_df[table_columns],
         feature_df_wo_links,
     )
 
@@ -208,49 +256,134 @@ def plot_confusion_matrices(class_0, class_1, results, names):
     return p
 
 
+# Keys of curve points
+def _curve_keys(lengths, x):
+    """
+    Returns 16 byte keys of (curve, x) that sort like the pairs
+
+    Non-negative floats sort like their bits.
+    """
+    keys = np.empty((len(x), 2), ">u8")
+    keys[:, 0] = np.repeat(np.arange(len(lengths)), lengths)
+    keys[:, 1] = x.view(np.uint64)
+    return keys.view("V16").ravel()
+
+
+# Interpolate curves onto a common grid
+def interpolate_curves(x_grid, curves):
+    """
+    Interpolates monotonic curves (x, y) with x in [0, 1] onto a grid at once
+
+    Equals `np.interp(x_grid, x, y)` for each curve with its points sorted
+    by x, ties keeping their order, so decreasing PR curves can be passed
+    as they are. Returns one row per curve.
+    """
+    # Decreasing curves are reversed
+    reverse = np.array([x[0] > x[-1] for x, _ in curves])
+    curves = [(x[::-1], y[::-1]) if r else (x, y) for (x, y), r in zip(curves, reverse)]
+    lengths = np.array([len(x) for x, _ in curves])
+    x = np.concatenate([x for x, _ in curves], dtype=float)
+    y = np.concatenate([y for _, y in curves], dtype=float)
+    x += 0.0
+    x_grid = np.asarray(x_grid, dtype=float) + 0.0
+    n_curves, n_grid = len(curves), len(x_grid)
+    curve = np.repeat(np.arange(n_curves), lengths)
+
+    # Of points with the same x only the first and last change the result,
+    # in reversed curves they are swapped back into their order
+    new_x = (x[1:] != x[:-1]) | (curve[1:] != curve[:-1])
+    keep = np.flatnonzero(np.r_[True, new_x] | np.r_[new_x, True])
+    ties = np.flatnonzero(~new_x[keep[:-1]] & reverse[curve[keep[:-1]]])
+    keep[ties], keep[ties + 1] = keep[ties + 1], keep[ties]
+    x, y, lengths = x[keep], y[keep], np.bincount(curve[keep], minlength=n_curves)
+
+    # Last point of the same curve at or before each grid value
+    left = np.searchsorted(
+        _curve_keys(lengths, x),
+        _curve_keys(np.full(n_curves, n_grid), np.tile(x_grid, n_curves)),
+        side="right",
+    )
+    left = left.reshape(n_curves, n_grid) - 1
+
+    starts = np.r_[0, np.cumsum(lengths)[:-1]][:, None]
+    ends = starts + lengths[:, None] - 1
+    left = np.clip(left, starts, ends)
+    right = np.minimum(left + 1, ends)
+    dx = x[right] - x[left]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(dx > 0, (y[right] - y[left]) / dx, 0)
+    values = y[left] + slope * (x_grid - x[left])
+    values = np.where(x_grid < x[starts], y[starts], values)
+    return np.where(x_grid >= x[ends], y[ends], values)
+
+
+# Decimate curves for display
+def decimate_curve(x, y, n_points=MAX_CURVE_POINTS):
+    """
+    Reduces a curve to `n_points` keeping its shape
+
+    Largest-Triangle-Three-Buckets: the first and last points are kept and
+    of each bucket in between, the point spanning the largest triangle with
+    the previous selected point and the mean of the next bucket.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    if len(x) <= n_points or n_points < 3:
+        return x, y
+
+    edges = np.linspace(1, len(x) - 1, n_points - 1).astype(int)
+    # Means of the buckets, the last point is the bucket after the last one
+    counts = np.diff(np.r_[edges, len(x)])
+    mean_x = np.add.reduceat(x, edges) / counts
+    mean_y = np.add.reduceat(y, edges) / counts
+    selected = np.empty(n_points, int)
+    selected[0], selected[-1] = 0, len(x) - 1
+    for i in range(n_points - 2):
+        start, stop = edges[i], edges[i + 1]
+        prev_x, prev_y = x[selected[i]], y[selected[i]]
+        area = np.abs(
+            (prev_x - mean_x[i + 1]) * (y[start:stop] - prev_y)
+            - (prev_x - x[start:stop]) * (mean_y[i + 1] - prev_y)
+        )
+        selected[i + 1] = start + area.argmax()
+    return x[selected], y[selected]
+
+
 # Prepare ROC Curve
 def plot_roc_curve_cv(roc_curve_results, cohort_combos=None):
     """
     Plotly chart for roc curve for cross validation
     """
-    tprs = []
     base_fpr = np.linspace(0, 1, 101)
-    roc_aucs = []
+    roc_aucs = [auc(fpr, tpr) for fpr, tpr, _ in roc_curve_results]
     p = go.Figure()
 
-    for idx, (fpr, tpr, threshold) in enumerate(roc_curve_results):
-        roc_auc = auc(fpr, tpr)
-        roc_aucs.append(roc_auc)
-
-        if cohort_combos is not None:
-            text = "Train: {} <br>Test: {}".format(
-                cohort_combos[idx][0], cohort_combos[idx][1]
-            )
+    if cohort_combos is not None:
+        for (fpr, tpr, _), roc_auc, (train, test) in zip(
+            roc_curve_results, roc_aucs, cohort_combos
+        ):
             hovertemplate = (
                 "False positive rate: %{x:.2f} <br>True positive rate: %{y:.2f}"
                 + "<br>"
-                + text
+                + f"Train: {train} <br>Test: {test}"
             )
+            fpr, tpr = decimate_curve(fpr, tpr)
             p.add_trace(
-                go.Scatter(
+                go.Scattergl(
                     x=fpr,
                     y=tpr,
                     hovertemplate=hovertemplate,
                     hoverinfo="all",
                     mode="lines",
                     name="Train on {}, Test on {}, AUC {:.2f}".format(
-                        cohort_combos[idx][0], cohort_combos[idx][1], roc_auc
+                        train, test, roc_auc
                     ),
                 )
             )
-        else:
-            pass
-            # p.add_trace(go.Scatter(x=fpr, y=tpr, hoverinfo='skip', mode='lines', line=dict(color=BLUE_COLOR), showlegend=False,  opacity=0.1))
-        tpr = np.interp(base_fpr, fpr, tpr)
-        tpr[0] = 0.0
-        tprs.append(tpr)
-
-    tprs = np.array(tprs)
+
+    tprs = interpolate_curves(
+        base_fpr, [(fpr, tpr) for fpr, tpr, _ in roc_curve_results]
+    )
+    tprs[:, 0] = 0.0
     mean_tprs = tprs.mean(axis=0)
     std = tprs.std(axis=0)
     tprs_upper = np.minimum(mean_tprs + std, 1)
@@ -346,47 +479,38 @@ def plot_pr_curve_cv(pr_curve_results, class_ratio_test, cohort_combos=None):
     """
     Returns Plotly chart for Precision-Recall (PR) curve
     """
-    precisions = []
     base_recall = np.linspace(0, 1, 101)
-    pr_aucs = []
+    pr_aucs = [auc(recall, precision) for precision, recall, _ in pr_curve_results]
     p = go.Figure()
 
-    for idx, (precision, recall, _) in enumerate(pr_curve_results):
-        pr_auc = auc(recall, precision)
-        pr_aucs.append(pr_auc)
-        if cohort_combos is not None:
-            pr_df = pd.DataFrame(
-                {
-                    "recall": recall,
-                    "precision": precision,
-                    "train": cohort_combos[idx][0],
-                    "test": cohort_combos[idx][1],
-                }
-            )
-            text = "Train: {} <br>Test: {}".format(
-                cohort_combos[idx][0], cohort_combos[idx][1]
+    if cohort_combos is not None:
+        for (precision, recall, _), pr_auc, (train, test) in zip(
+            pr_curve_results, pr_aucs, cohort_combos
+        ):
+            hovertemplate = (
+                "Recall: %{x:.2f} <br>Precision: %{y:.2f}"
+                + "<br>"
+                + f"Train: {train} <br>Test: {test}"
             )
-            hovertemplate = "Recall: %{x:.2f} <br>Precision: %{y:.2f}" + "<br>" + text
+            recall, precision = decimate_curve(recall, precision)
             p.add_trace(
-                go.Scatter(
+                go.Scattergl(
                     x=recall,
                     y=precision,
                     hovertemplate=hovertemplate,
                     hoverinfo="all",
                     mode="lines",
                     name="Train on {}, Test on {}, AUC {:.2f}".format(
-                        cohort_combos[idx][0], cohort_combos[idx][1], pr_auc
+                        train, test, pr_auc
                     ),
                 )
             )
-        else:
-            pass
-            # p.add_trace(go.Scatter(x=recall, y=precision, hoverinfo='skip', mode='lines', line=dict(color=BLUE_COLOR'), showlegend=False,  opacity=0.1))
-        precision = np.interp(base_recall, recall, precision, period=100)
-        precision[0] = 1.0
-        precisions.append(precision)
-
-    precisions = np.array(precisions)
+
+    precisions = interpolate_curves(
+        base_recall,
+        [(recall, precision) for precision, recall, _ in pr_curve_results],
+    )
+    precisions[:, 0] = 1.0
     mean_precisions = precisions.mean(axis=0)
     std = precisions.std(axis=0)
     precisions_upper = np.minimum(mean_precisions + std, 1)
@@ -481,6 +605,111 @@ def plot_pr_curve_cv(pr_curve_results, class_ratio_test, cohort_combos=None):
     return p
 
 
+# Memory of the hier. clustering
+def clustering_memory(n_samples, n_features):
+    """
+    Estimated peak memory in bytes of clustering `n_features` features
+
+    The float32 data and correlation matrix, the float64 distances, which
+    the linkage copies, and a block of distances or the averaged heatmap rows.
+    """
+    n_distances = n_features * (n_features - 1) // 2
+    return (
+        4 * n_samples * n_features
+        + 4 * n_features**2
+        + 2 * 8 * n_distances
+        + max(12 * CLUSTERING_BLOCK_SIZE, 16 * MAX_HEATMAP_SIZE) * n_features
+    )
+
+
+# Pearson correlation for hier. clustering
+def correlation_matrix(values):
+    """
+    Pearson correlation of the columns in float32
+
+    Constant columns are uncorrelated to all columns.
+    """
+    values = np.array(values, dtype=np.float32)
+    values -= values.mean(axis=0)
+    norms = np.linalg.norm(values, axis=0)
+    values /= np.where(norms > 0, norms, 1)
+    corr = np.matmul(values.T, values)
+    return np.clip(corr, -1, 1, out=corr)
+
+
+# Distances for hier. clustering
+def row_distances(matrix):
+    """
+    Condensed Euclidean distances between the rows, as `pdist(matrix)`
+
+    Computed from dot products of blocks of rows in the precision of the
+    matrix, e.g. float32 for correlation matrices.
+    """
+    matrix = np.asarray(matrix)
+    n = len(matrix)
+    squared_norms = np.einsum("ij,ij->i", matrix, matrix, dtype=float)
+    distances = np.empty(n * (n - 1) // 2)
+    offset = 0
+    for start in range(0, n - 1, CLUSTERING_BLOCK_SIZE):
+        stop = min(start + CLUSTERING_BLOCK_SIZE, n - 1)
+        block = (matrix[start:stop] @ matrix[start:].T).astype(float)
+        block *= -2
+        block += squared_norms[start:stop, None]
+        block += squared_norms[start:]
+        np.maximum(block, 0, out=block)
+        np.sqrt(block, out=block)
+        for i in range(stop - start):
+            row = block[i, i + 1 :]
+            distances[offset : offset + len(row)] = row
+            offset += len(row)
+    return distances
+
+
+# Links of a dendrogram
+def dendrogram_links(linkage):
+    """
+    Returns the leaf order and the x and y coordinates of the links
+
+    Leaves are placed at 5, 15, 25, .. as in scipy's dendrogram. Each link
+    has four points, followed by NaN to draw all links as one line.
+    """
+    n = len(linkage) + 1
+    leaves = sch.leaves_list(linkage)
+    x = np.empty(2 * n - 1)
+    x[leaves] = 5 + 10 * np.arange(n)
+    height = np.zeros(2 * n - 1)
+    height[n:] = linkage[:, 2]
+    links_x = np.full((n - 1, 5), np.nan)
+    links_y = np.full((n - 1, 5), np.nan)
+    for k, (left, right) in enumerate(linkage[:, :2].astype(int)):
+        x[n + k] = (x[left] + x[right]) / 2
+        links_x[k, :4] = x[left], x[left], x[right], x[right]
+        links_y[k, :4] = height[left], height[n + k], height[n + k], height[right]
+    return leaves, links_x.ravel(), links_y.ravel()
+
+
+# Average a heatmap down
+def _downsample_heatmap(matrix, order, bins):
+    """
+    Returns `matrix[order][:, order]` averaged over the rows and columns of each bin
+
+    `bins` are the increasing bin numbers of the ordered rows, which are
+    averaged in blocks of bins.
+    """
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    counts = np.diff(np.r_[starts, len(bins)])
+    rows = np.empty((len(starts), len(order)))
+    step = max(1, CLUSTERING_BLOCK_SIZE * len(starts) // len(order))
+    for first in range(0, len(starts), step):
+        block = starts[first : first + step + 1]
+        stop = block[-1] if len(block) > step else len(order)
+        rows[first : first + step] = np.add.reduceat(
+            matrix[order[block[0] : stop]], block[:step] - block[0], axis=0
+        )
+    heat_data = np.add.reduceat(rows[:, order], starts, axis=1)
+    return heat_data / counts[:, None] / counts
+
+
 # Generate dendograms for hier. clustering
 def generate_dendrogram(
     matrix,
@@ -488,66 +717,74 @@ def generate_dendrogram(
     show_distances: bool = False,
     colorbar_title: str = "",
 ):
-    """Generate Dendrogram."""
+    """Generate Dendrogram.
 
-    # Initialize figure by creating upper dendrogram
-    fig = ff.create_dendrogram(
-        matrix,
-        orientation="bottom",
-        labels=labels,
-        colorscale=[GRAY_COLOR] * 8,
-    )
-    for i in range(len(fig["data"])):
-        fig["data"][i]["yaxis"] = "y2"
-
-    # Create side dendrogram
-    dendro_side = ff.create_dendrogram(
-        matrix, orientation="right", colorscale=[GRAY_COLOR] * 8
+    The rows are clustered once (complete linkage of Euclidean distances)
+    for both dendrograms. Heatmaps above MAX_HEATMAP_SIZE features show
+    averages over groups of neighboring features.
+    """
+    matrix = np.asarray(matrix)
+    distances = row_distances(matrix)
+    leaves, links_x, links_y = dendrogram_links(sch.linkage(distances, "complete"))
+    positions = 5 + 10 * np.arange(len(leaves))
+
+    # Both dendrograms are drawn from the same links, each as one line
+    line = dict(color=GRAY_COLOR)
+    fig = go.Figure(
+        [
+            go.Scatter(
+                x=links_x,
+                y=links_y,
+                yaxis="y2",
+                mode="lines",
+                line=line,
+                hoverinfo="skip",
+            ),
+            go.Scatter(
+                x=-links_y,
+                y=links_x,
+                xaxis="x2",
+                mode="lines",
+                line=line,
+                hoverinfo="skip",
+            ),
+        ]
     )
-    for i in range(len(dendro_side["data"])):
-        dendro_side["data"][i]["xaxis"] = "x2"
-
-    # Add Side Dendrogram Data to Figure
-    for data in dendro_side["data"]:
-        fig.add_trace(data)
-
-    # define dendro leaves
-    dendro_leaves = dendro_side["layout"]["yaxis"]["ticktext"]
-    dendro_leaves = list(map(int, dendro_leaves))
 
     # get heatmap data (z)
     if show_distances:
-        # calculate distances
-        heat_data = squareform(pdist(matrix))
+        heat_data = squareform(distances)
     else:
-        heat_data = matrix.values
+        heat_data = matrix
 
-    # arrange the heatmap data according to the dendrogram clustering
-    heat_data = heat_data[dendro_leaves, :]
-    heat_data = heat_data[:, dendro_leaves]
+    hovertemplate = (
+        "<b>Protein x:</b> %{x}<br><b>Protein y:</b> %{y}<extra>r = %{z:.2f}</extra>"
+    )
+    if len(leaves) > MAX_HEATMAP_SIZE:
+        # Features next to each other in the dendrogram are averaged
+        bins = np.arange(len(leaves)) * MAX_HEATMAP_SIZE // len(leaves)
+        heat_data = _downsample_heatmap(heat_data, leaves, bins)
+        positions = np.bincount(bins, weights=positions) / np.bincount(bins)
+        hovertemplate = "<extra>mean r = %{z:.2f}</extra>"
+    else:
+        # arrange the heatmap data according to the dendrogram clustering
+        heat_data = heat_data[np.ix_(leaves, leaves)]
 
-    heatmap = [
+    fig.add_trace(
         go.Heatmap(
-            x=dendro_leaves,
-            y=dendro_leaves,
-            z=heat_data,
+            x=positions,
+            y=positions,
+            # Shown with two decimals, fewer digits keep the figure small
+            z=heat_data.astype(float).round(3),
             colorscale=[
                 [0.0, BLUE_COLOR],
                 [0.5, "#ffffff"],
                 [1.0, RED_COLOR],
             ],
             colorbar={"title": colorbar_title},
-            hovertemplate=(
-                "<b>Protein x:</b> %{x}<br><b>Protein y:</b> %{y}"
-                "<extra>r = %{z:.2f}</extra>"
-            ),
+            hovertemplate=hovertemplate,
         )
-    ]
-
-    heatmap[0]["x"] = fig["layout"]["xaxis"]["tickvals"]
-    heatmap[0]["y"] = dendro_side["layout"]["yaxis"]["tickvals"]
-    for data in heatmap:
-        fig.add_trace(data)
+    )
 
     # modify layout
     fig.update_layout(
@@ -559,9 +796,12 @@ def generate_dendrogram(
         }
     )
 
-    # add labels to yaxis (needed for the hover)
-    fig["layout"]["yaxis"]["ticktext"] = fig["layout"]["xaxis"]["ticktext"]
-    fig["layout"]["yaxis"]["tickvals"] = fig["layout"]["xaxis"]["tickvals"]
+    # add labels to the axes (needed for the hover)
+    ticks = dict(
+        tickmode="array",
+        tickvals=5 + 10 * np.arange(len(leaves)),
+        ticktext=np.asarray(labels)[leaves],
+    )
 
     # modify axes
     params: dict = {
@@ -573,9 +813,9 @@ def generate_dendrogram(
         "ticks": "",
     }
     fig.update_layout(
-        xaxis={"domain": [0.15, 1], **params},
+        xaxis={"domain": [0.15, 1], **ticks, **params},
         xaxis2={"domain": [0, 0.15], **params},
-        yaxis={"domain": [0, 0.85], **params},
+        yaxis={"domain": [0, 0.85], **ticks, **params},
         yaxis2={"domain": [0.825, 0.975], **params},
     )
 
@@ -588,11 +828,10 @@ def perform_EDA(state):
     Perform EDA on the dataset by given method and return the chart
     """
 
-    data = state.df_sub[state.proteins].astype("float").fillna(0.0)
     if state.eda_method == "Hierarchical clustering":
-        data_to_be_correlated = data.iloc[:, state.data_range[0] : state.data_range[1]]
-        corr = data_to_be_correlated.corr(method="pearson")
-        labels = corr.columns
+        labels = state.proteins[state.data_range[0] : state.data_range[1]]
+        data = state.df_sub[labels].to_numpy(dtype=np.float32, na_value=0.0)
+        corr = correlation_matrix(data)
         p = generate_dendrogram(
             matrix=corr,
             labels=labels,
@@ -609,6 +848,7 @@ def perform_EDA(state):
         )
 
     elif state.eda_method == "PCA":
+        data = state.df_sub[state.proteins].astype("float").fillna(0.0)
         n_components = 2
         pca = PCA(n_components=n_components)
         pca.fit(data)
@@ -1,7 +1,7 @@
 """OmicLearn UI components."""
-import base64
 import os
 import platform
+import time
 
 import numpy as np
 import pandas as pd
@@ -9,8 +9,46 @@ import plotly
 import sklearn
 import streamlit as st
 
-from .ml_helper import calculate_cm, perform_cross_validation, transform_dataset
+from .cache_helper import DATA_CACHE, fingerprint
+from .data_helper import (
+    COLUMNAR_FORMATS,
+    CSV_DELIMITERS,
+    DATA_LAYOUTS,
+    FEATURE_PATTERNS,
+    ColumnarDataset,
+    DatasetProfile,
+    FeatureRegistry,
+    get_columnar_format,
+    get_compression,
+    get_data_root,
+    get_decompressed_name,
+    join_sample_annotations,
+    list_data_files,
+    open_decompressed,
+    read_excel_file,
+    read_features_as_rows,
+    read_header,
+    read_long_format,
+    read_sample_file,
+    read_typed_csv,
+    resolve_data_path,
+    sniff_delimiter,
+)
+from .export_helper import ExportService
+from .ml_helper import (
+    CATEGORICAL_ENCODINGS,
+    CategoricalEncoder,
+    calculate_cm,
+    feature_view,
+    is_categorical,
+    perform_cross_validation,
+    prefilter_features,
+    prune_redundant_features,
+    transform_dataset,
+)
 from .plot_helper import (
+    MAX_CLUSTERING_MEMORY,
+    clustering_memory,
     perform_EDA,
     plot_confusion_matrices,
     plot_feature_importance,
@@ -29,12 +67,63 @@ try:
 except ModuleNotFoundError:
     pass
 
+# Feature lists above this size are selected by pattern instead of a multiselect
+MAX_FEATURE_OPTIONS = 1000
+
+# Data of a run that is not kept for showing its results on later reruns
+RUN_DATA_KEYS = [
+    "df",
+    "df_sub",
+    "df_sub_y",
+    "subset_mask",
+    "profile",
+    "feature_registry",
+    "columnar_dataset",
+    "categorical_encoder",
+    "X",
+    "y",
+    "X_cohort",
+    "bar",
+]
+
+# Results of a run that are not part of its configuration
+RUN_RESULT_KEYS = [
+    "cv_results",
+    "cv_curves",
+    "summary",
+    "cohort_results",
+    "cohort_curves",
+    "cohort_summary",
+    "cohort_combos",
+    "top_features",
+    "figures",
+    "summary_text",
+    "bundle",
+]
+
+# Rows and columns shown in the dataset preview
+PREVIEW_ROWS = 30
+PREVIEW_COLUMNS = 20
+
 # Define paths
 _this_file = os.path.abspath(__file__)
 _this_directory = os.path.dirname(_this_file)
 _parent_directory = os.path.dirname(_this_directory)
 
 
+# Memoize derived state for the session
+def _session_memo(name, key, func, *args):
+    """
+    Returns func(*args), recomputed only when the key changes in this session
+    """
+    if key is None:
+        return func(*args)
+    memo = st.session_state.setdefault("memo", {})
+    if name not in memo or memo[name][0] != key:
+        memo[name] = (key, func(*args))
+    return memo[name][1]
+
+
 # Widget for recording
 def make_recording_widget(f, widget_values):
     """
@@ -89,6 +178,8 @@ def return_widgets():
         "number_input_": st.sidebar.number_input,
         "selectbox_": st.sidebar.selectbox,
         "multiselect": st.multiselect,
+        "selectbox": st.selectbox,
+        "number_input": st.number_input,
     }
     for sidebar_key, sidebar_value in sidebar_elements.items():
         record_widgets[sidebar_key] = make_recording_widget(
@@ -130,16 +221,75 @@ def _generate_normalization_elements(state, selectbox_, number_input_):
 
 
 # Generate missing value imputation elements for sidebar
-def _generate_imputation_elements(state, selectbox_):
+def _generate_imputation_elements(state, selectbox_, number_input_):
     # Preprocessing -- Missing value imputation
+    imputation_params = {}
     if state.n_missing > 0:
         st.sidebar.markdown(
             "## [Missing value imputation](https://OmicLearn.readthedocs.io/en/latest/METHODS.html#imputation-of-missing-values)"
         )
-        missing_values = ["Zero", "Mean", "Median", "KNNImputer", "None"]
+        missing_values = [
+            "Zero",
+            "Mean",
+            "Median",
+            "KNNImputer",
+            "KNNImputer (blocked)",
+            "Downshifted normal",
+            "Minimum",
+            "MinProb",
+            "None",
+        ]
         state["missing_value"] = selectbox_("Missing value imputation", missing_values)
+
+        # Missing value imputation -- Parameters selection
+        if state.missing_value == "KNNImputer (blocked)":
+            imputation_params["n_neighbors"] = number_input_(
+                "Number of neighbors for imputation:",
+                value=5,
+                min_value=1,
+                max_value=100,
+            )
+            imputation_params["min_completeness"] = number_input_(
+                "Min. completeness of neighbor features:",
+                value=0.0,
+                min_value=0.0,
+                max_value=1.0,
+                help="Only features with at least this fraction of observed values are used to find the nearest neighbors. With 0, the results are the same as with the KNNImputer.",
+            )
     else:
         state["missing_value"] = "None"
+    # Save the imputation params
+    state["imputation_params"] = imputation_params
+
+
+# Generate feature pre-filtering elements for sidebar
+def _generate_prefilter_elements(state, selectbox_, number_input_):
+    # Preprocessing -- Pre-filtering of features
+    state["prefilter_missing"] = number_input_(
+        "Max. fraction of missing values per feature:",
+        value=1.0,
+        min_value=0.0,
+        max_value=1.0,
+        help="Features with a larger fraction of missing values are removed before cross-validation.",
+    )
+    state["prefilter_variance"] = number_input_(
+        "Min. variance per feature:",
+        value=0.0,
+        min_value=0.0,
+        format="%.4f",
+        help="Features with a smaller variance are removed before cross-validation.",
+    )
+    state["redundancy_pruning"] = selectbox_(
+        "Redundant features:",
+        ["Keep", "Remove duplicates", "Remove duplicates and correlated"],
+        help="Keeps one representative feature of each group of identical or highly correlated features.",
+    )
+    if state.redundancy_pruning == "Remove duplicates and correlated":
+        state["correlation_threshold"] = number_input_(
+            "Correlation threshold:", value=0.95, min_value=0.5, max_value=1.0
+        )
+    else:
+        state["correlation_threshold"] = None
 
 
 # Generate feature selection elements for sidebar
@@ -179,7 +329,8 @@ def _generate_feature_selection_elements(state, selectbox_, number_input_):
 def _generate_classification_elements(
     state,
     selectbox_,
-    number_input_,
+    selectbox,
+    number_input,
 ):
     st.sidebar.markdown(
         "## [Classification](https://OmicLearn.readthedocs.io/en/latest/METHODS.html#classification)"
@@ -204,99 +355,119 @@ def _generate_classification_elements(
     classifier_params["random_state"] = state["random_state"]
 
     # Classification method -- Hyperparameter selection
-    if state.classifier == "AdaBoost":
-        classifier_params["n_estimators"] = number_input_(
-            "Number of estimators:", value=100, min_value=1, max_value=2000
-        )
-        classifier_params["learning_rate"] = number_input_(
-            "Learning rate:", value=1.0, min_value=0.001, max_value=100.0
-        )
+    # Changes in the form only rerun the app once they are applied
+    with st.sidebar.form("classifier_params"):
+        if state.classifier == "AdaBoost":
+            classifier_params["n_estimators"] = number_input(
+                "Number of estimators:", value=100, min_value=1, max_value=2000
+            )
+            classifier_params["learning_rate"] = number_input(
+                "Learning rate:", value=1.0, min_value=0.001, max_value=100.0
+            )
 
-    elif state.classifier == "KNeighborsClassifier":
-        classifier_params["n_neighbors"] = number_input_(
-            "Number of neighbors:", value=100, min_value=1, max_value=2000
-        )
-        classifier_params["weights"] = selectbox_(
-            "Select weight function used:", ["uniform", "distance"]
-        )
-        classifier_params["algorithm"] = selectbox_(
-            "Algorithm for computing the neighbors:",
-            ["auto", "ball_tree", "kd_tree", "brute"],
-        )
+        elif state.classifier == "KNeighborsClassifier":
+            classifier_params["n_neighbors"] = number_input(
+                "Number of neighbors:", value=100, min_value=1, max_value=2000
+            )
+            classifier_params["weights"] = selectbox(
+                "Select weight function used:", ["uniform", "distance"]
+            )
+            classifier_params["algorithm"] = selectbox(
+                "Algorithm for computing the neighbors:",
+                ["auto", "ball_tree", "kd_tree", "brute"],
+            )
 
-    elif state.classifier == "LogisticRegression":
-        classifier_params["penalty"] = selectbox_(
-            "Specify norm in the penalization:",
-            ["l2", "l1", "ElasticNet", "None"],
-        ).lower()
-        classifier_params["solver"] = selectbox_(
-            "Select the algorithm for optimization:",
-            ["lbfgs", "newton-cg", "liblinear", "sag", "saga"],
-        )
-        classifier_params["max_iter"] = number_input_(
-            "Maximum number of iteration:",
-            value=100,
-            min_value=1,
-            max_value=2000,
-        )
-        classifier_params["C"] = number_input_(
-            "C parameter:", value=1, min_value=1, max_value=100
-        )
+        elif state.classifier == "LogisticRegression":
+            classifier_params["penalty"] = selectbox(
+                "Specify norm in the penalization:",
+                ["l2", "l1", "ElasticNet", "None"],
+            ).lower()
+            classifier_params["solver"] = selectbox(
+                "Select the algorithm for optimization:",
+                ["lbfgs", "newton-cg", "liblinear", "sag", "saga"],
+            )
+            classifier_params["max_iter"] = number_input(
+                "Maximum number of iteration:",
+                value=100,
+                min_value=1,
+                max_value=2000,
+            )
+            classifier_params["C"] = number_input(
+                "C parameter:", value=1, min_value=1, max_value=100
+            )
 
-    elif state.classifier == "RandomForest":
-        classifier_params["n_estimators"] = number_input_(
-            "Number of estimators:", value=100, min_value=1, max_value=2000
-        )
-        classifier_params["criterion"] = selectbox_(
-            "Function for measure the quality:", ["gini", "entropy"]
-        )
-        classifier_params["max_features"] = selectbox_(
-            "Number of max. features:", ["auto", "int", "sqrt", "log2"]
-        )
-        if classifier_params["max_features"] == "int":
-            classifier_params["max_features"] = number_input_(
-                "Number of max. features:", value=5, min_value=1, max_value=100
+        elif state.classifier == "RandomForest":
+            classifier_params["n_estimators"] = number_input(
+                "Number of estimators:", value=100, min_value=1, max_value=2000
+            )
+            classifier_params["criterion"] = selectbox(
+                "Function for measure the quality:", ["gini", "entropy"]
+            )
+            classifier_params["max_features"] = selectbox(
+                "Number of max. features:", ["auto", "int", "sqrt", "log2"]
             )
+            if classifier_params["max_features"] == "int":
+                classifier_params["max_features"] = number_input(
+                    "Number of max. features:", value=5, min_value=1, max_value=100
+                )
 
-    elif state.classifier == "DecisionTree":
-        classifier_params["criterion"] = selectbox_(
-            "Function for measure the quality:", ["gini", "entropy"]
-        )
-        classifier_params["max_features"] = selectbox_(
-            "Number of max. features:", ["auto", "int", "sqrt", "log2"]
-        )
-        if classifier_params["max_features"] == "int":
-            classifier_params["max_features"] = number_input_(
-                "Number of max. features:", value=5, min_value=1, max_value=100
+        elif state.classifier == "DecisionTree":
+            classifier_params["criterion"] = selectbox(
+                "Function for measure the quality:", ["gini", "entropy"]
+            )
+            classifier_params["max_features"] = selectbox(
+                "Number of max. features:", ["auto", "int", "sqrt", "log2"]
             )
+            if classifier_params["max_features"] == "int":
+                classifier_params["max_features"] = number_input(
+                    "Number of max. features:", value=5, min_value=1, max_value=100
+                )
 
-    elif state.classifier == "LinearSVC":
-        classifier_params["penalty"] = selectbox_(
-            "Specify norm in the penalization:", ["l2", "l1"]
-        )
-        classifier_params["loss"] = selectbox_(
-            "Select loss function:", ["squared_hinge", "hinge"]
-        )
-        classifier_params["C"] = number_input_(
-            "C parameter:", value=1, min_value=1, max_value=100
-        )
-        classifier_params["cv_generator"] = number_input_(
-            "Cross-validation generator:", value=2, min_value=2, max_value=100
-        )
+        elif state.classifier == "LinearSVC":
+            classifier_params["penalty"] = selectbox(
+                "Specify norm in the penalization:", ["l2", "l1"]
+            )
+            classifier_params["loss"] = selectbox(
+                "Select loss function:", ["squared_hinge", "hinge"]
+            )
+            classifier_params["C"] = number_input(
+                "C parameter:", value=1, min_value=1, max_value=100
+            )
+            classifier_params["calibration"] = selectbox(
+                "Calibration method:",
+                [
+                    "CalibratedClassifierCV",
+                    "Platt scaling (holdout)",
+                    "None (ranking only)",
+                ],
+                help="`Platt scaling (holdout)` fits a single SVM per split. `None (ranking only)` skips calibration and uses the decision scores of the SVM.",
+            )
+            if classifier_params["calibration"] == "Platt scaling (holdout)":
+                classifier_params["calibration_holdout"] = number_input(
+                    "Calibration holdout fraction:",
+                    value=0.2,
+                    min_value=0.05,
+                    max_value=0.5,
+                )
+            elif classifier_params["calibration"] == "CalibratedClassifierCV":
+                classifier_params["cv_generator"] = number_input(
+                    "Cross-validation generator:", value=2, min_value=2, max_value=100
+                )
 
-    elif state.classifier == "XGBoost":
-        classifier_params["learning_rate"] = number_input_(
-            "Learning rate:", value=0.3, min_value=0.0, max_value=1.0
-        )
-        classifier_params["min_split_loss"] = number_input_(
-            "Min. split loss:", value=0, min_value=0, max_value=100
-        )
-        classifier_params["max_depth"] = number_input_(
-            "Max. depth:", value=6, min_value=0, max_value=100
-        )
-        classifier_params["min_child_weight"] = number_input_(
-            "Min. child weight:", value=1, min_value=0, max_value=100
-        )
+        elif state.classifier == "XGBoost":
+            classifier_params["learning_rate"] = number_input(
+                "Learning rate:", value=0.3, min_value=0.0, max_value=1.0
+            )
+            classifier_params["min_split_loss"] = number_input(
+                "Min. split loss:", value=0, min_value=0, max_value=100
+            )
+            classifier_params["max_depth"] = number_input(
+                "Max. depth:", value=6, min_value=0, max_value=100
+            )
+            classifier_params["min_child_weight"] = number_input(
+                "Min. child weight:", value=1, min_value=0, max_value=100
+            )
+        st.form_submit_button("Apply parameters", help=APPLY_PARAMETERS_TEXT)
 
     # Save the classification hyperparameters
     state["classifier_params"] = classifier_params
@@ -350,70 +521,108 @@ def generate_sidebar_elements(state, icon, report, record_widgets):
         "## [Preprocessing](https://OmicLearn.readthedocs.io/en/latest/METHODS.html#preprocessing)"
     )
     _generate_normalization_elements(state, selectbox_, number_input_)
-    _generate_imputation_elements(state, selectbox_)
+    _generate_prefilter_elements(state, selectbox_, number_input_)
+    _generate_imputation_elements(state, selectbox_, number_input_)
 
     # Feature Selection
     _generate_feature_selection_elements(state, selectbox_, number_input_)
 
     # Classification Method Selection
-    _generate_classification_elements(state, selectbox_, number_input_)
+    _generate_classification_elements(
+        state, selectbox_, record_widgets.selectbox, record_widgets.number_input
+    )
 
     # Cross-Validation
     _generate_cross_validation_elements(state, selectbox_, number_input_)
 
+    # Data cache
+    with st.sidebar.expander("Data cache"):
+        stats = DATA_CACHE.stats()
+        st.markdown(
+            DATA_CACHE_TEXT.format(
+                N_ENTRIES=stats["entries"],
+                SIZE=stats["size"] / (1 << 20),
+                MAX_SIZE=DATA_CACHE.max_size / (1 << 20),
+                HITS=stats["hits"],
+                MISSES=stats["misses"],
+                EVICTIONS=stats["evictions"],
+            )
+        )
+        if "rerun_ms" in st.session_state:
+            st.caption(RERUN_TEXT.format(RERUN_MS=st.session_state.rerun_ms))
+
     return state
 
 
-# Get session history
-def session_history(widget_values):
+# Session history table
+def _get_session_history_df():
     """
-    Helper function to save / show session history
+    Returns the runs of this session, latest first
     """
-
-    widget_values["run"] = len(st.session_state.history) + 1
-    st.session_state.history.append(widget_values)
     sessions_df = pd.DataFrame(st.session_state.history)
     new_column_names = {
         k: v.replace(":", "").replace("Select", "")
         for k, v in zip(sessions_df.columns, sessions_df.columns)
     }
     sessions_df = sessions_df.rename(columns=new_column_names)
-    sessions_df = sessions_df.iloc[::-1]
+    return sessions_df.iloc[::-1]
+
+
+# Get session history
+def session_history(widget_values=None):
+    """
+    Helper function to save / show session history
+    """
+
+    if widget_values is not None:
+        widget_values["run"] = len(st.session_state.history) + 1
+        st.session_state.history.append(widget_values)
+    if len(st.session_state.history) == 0:
+        return
+    sessions_df = _get_session_history_df()
 
     st.header("Session History")
     st.dataframe(sessions_df.style.format(precision=3))
-    get_download_link(sessions_df, "session_history.csv")
+    get_download_button(sessions_df, "session_history.csv")
 
 
 # Load data
-@st.cache_data(persist=True, show_spinner=True)
-def load_data(file_buffer, delimiter, header="infer"):
+@DATA_CACHE.memoize
+def load_data(
+    file_buffer,
+    delimiter,
+    header="infer",
+    precision=None,
+    layout=None,
+    compression=None,
+):
     """
     Load data to pandas dataframe
+    Text files are read with typed feature columns when a precision is given
+    and pivoted when a layout (name followed by its columns) is given
+    Compressed text files are decompressed while they are parsed
     """
 
     warnings = []
     df = pd.DataFrame()
     if file_buffer is not None:
+        if compression is not None:
+            file_buffer = open_decompressed(file_buffer, compression)
+
         if delimiter == "Excel File":
-            df = pd.read_excel(file_buffer)
-
-            # check if all columns are strings valid_columns = []
-            error = False
-            valid_columns = []
-            for idx, _ in enumerate(df.columns):
-                if isinstance(_, str):
-                    valid_columns.append(_)
-                else:
-                    warnings.append(
-                        f"Removing column {idx} with value {_} as type is {type(_)} and not string."
-                    )
-                    error = True
-            if error:
-                warnings.append(
-                    "Errors detected when importing Excel file. Please check that Excel did not convert protein names to dates."
-                )
-                df = df[valid_columns]
+            df, warnings = read_excel_file(file_buffer)
+
+        elif delimiter in COLUMNAR_FORMATS.values():
+            dataset = ColumnarDataset(file_buffer, delimiter)
+            df = dataset.read(dataset.columns)
+
+        elif layout is not None and layout[0] == "Features as rows":
+            df, warnings = read_features_as_rows(file_buffer, delimiter, *layout[1:])
+        elif layout is not None and layout[0] == "Long format":
+            df, warnings = read_long_format(file_buffer, delimiter, *layout[1:])
+
+        elif precision is not None and delimiter in CSV_DELIMITERS:
+            df, warnings = read_typed_csv(file_buffer, delimiter, precision)
 
         elif delimiter == "Comma (,)":
             df = pd.read_csv(file_buffer, sep=",", header=header)
@@ -424,6 +633,167 @@ def load_data(file_buffer, delimiter, header="infer"):
     return df, warnings
 
 
+# Load sample dataset
+@st.cache_resource(show_spinner=True)
+def load_sample_file(sample_file):
+    """
+    Load a bundled sample dataset, shared by all sessions
+    """
+    folder_to_load = os.path.join(_parent_directory, "data")
+    return read_sample_file(os.path.join(folder_to_load, sample_file + ".xlsx"))
+
+
+# Load server files
+@st.cache_resource(max_entries=4, show_spinner=True)
+def load_server_file(
+    file_path, modified, delimiter, precision=None, layout=None, compression=None
+):
+    """
+    Load a file from the data root, shared by all sessions until it is modified
+    """
+    df, warnings = load_data.__wrapped__(
+        file_path,
+        delimiter,
+        precision=precision,
+        layout=layout,
+        compression=compression,
+    )
+    # Identity of the file, so the dataset is never hashed on reruns
+    df.attrs["fingerprint"] = fingerprint(
+        (file_path, modified, delimiter, precision, layout, compression)
+    )
+    return df, warnings
+
+
+# List server files
+@st.cache_data(ttl=30, show_spinner=False)
+def _list_server_files(data_root):
+    """
+    Files in the data root, listed at most every 30 seconds
+    """
+    return list_data_files(data_root)
+
+
+def _load_file(source, delimiter, **kwargs):
+    """
+    Loads an uploaded file or a file from the data root
+    """
+    if isinstance(source, str):
+        modified = (os.stat(source).st_mtime_ns, os.stat(source).st_size)
+        return load_server_file(source, modified, delimiter, **kwargs)
+    return load_data(source, delimiter, **kwargs)
+
+
+# Join sample annotations
+@st.cache_resource(max_entries=4)
+def _join_sample_annotations(_df, _annotations, key, dataset_id):
+    """
+    Dataset joined with its sample annotations, computed once per dataset and annotations
+    """
+    df, warnings = join_sample_annotations(_df, _annotations, key)
+    # Identity of the joined dataset, so it is never hashed on reruns
+    df.attrs["fingerprint"] = dataset_id
+    return df, warnings
+
+
+# Load text files in one of the data layouts
+def _load_text_file(file_buffer, delimiter, compression=None):
+    """
+    Loads a text file with the selected layout and sample annotations
+    """
+    layout = st.selectbox("Data layout:", DATA_LAYOUTS, help=DATA_LAYOUT_TEXT)
+    if layout == "Samples as rows":
+        precision = None
+        # Server files are read into the typed matrix by default
+        if st.checkbox(
+            "Fast typed loading",
+            value=isinstance(file_buffer, str),
+            help=TYPED_LOADING_TEXT,
+        ):
+            precision = st.selectbox("Feature precision:", ["float64", "float32"])
+        return _load_file(
+            file_buffer, delimiter, precision=precision, compression=compression
+        )
+
+    if compression is not None:
+        columns = read_header(open_decompressed(file_buffer, compression), delimiter)
+    else:
+        columns = read_header(file_buffer, delimiter)
+    if layout == "Features as rows":
+        feature_column = st.selectbox("Feature column:", columns)
+        sample_prefix = st.text_input("Prefix of the sample columns:", "")
+        layout = (layout, feature_column, sample_prefix)
+    else:
+        sample_column = st.selectbox("Sample column:", columns)
+        feature_column = st.selectbox(
+            "Feature column:", columns, index=min(1, len(columns) - 1)
+        )
+        value_column = st.selectbox(
+            "Value column:", columns, index=min(2, len(columns) - 1)
+        )
+        layout = (layout, sample_column, feature_column, value_column)
+    df, warnings = _load_file(
+        file_buffer, delimiter, layout=layout, compression=compression
+    )
+
+    # Sample annotations are joined by their sample column
+    annotation_buffer = st.file_uploader(
+        "Upload sample annotations (optional):",
+        help=SAMPLE_ANNOTATIONS_TEXT,
+        type=["csv", "tsv", "txt", "xlsx", "xls"],
+    )
+    if annotation_buffer is not None and len(df) > 0:
+        if annotation_buffer.name.endswith((".xlsx", ".xls")):
+            annotation_format = "Excel File"
+        elif annotation_buffer.name.endswith((".tsv", ".txt")):
+            annotation_format = "Tab (\\t) for TSV"
+        else:
+            annotation_format = "Comma (,)"
+        annotations, annotation_warnings = load_data(
+            annotation_buffer, annotation_format
+        )
+        key = st.selectbox("Sample column of the annotations:", annotations.columns)
+        dataset_id = fingerprint((df.attrs.get("fingerprint"), annotation_buffer, key))
+        df, join_warnings = _join_sample_annotations(df, annotations, key, dataset_id)
+        warnings = warnings + annotation_warnings + join_warnings
+    return df, warnings
+
+
+# Get the columnar dataset of an uploaded or server file
+def _get_columnar_dataset(file_buffer, file_format):
+    """
+    Keeps the columnar dataset of the uploaded or server file for the session
+    """
+    if isinstance(file_buffer, str):
+        key = (file_buffer, os.stat(file_buffer).st_mtime_ns, file_format)
+    else:
+        key = (file_buffer.id, file_buffer.name, file_format)
+    if st.session_state.get("columnar_dataset_key") != key:
+        st.session_state["columnar_dataset"] = ColumnarDataset(file_buffer, file_format)
+        st.session_state["columnar_dataset_key"] = key
+    return st.session_state["columnar_dataset"]
+
+
+# Load feature columns of columnar datasets
+def _load_feature_columns(state, df):
+    """
+    Adds the lazily loaded feature columns to the rows of df
+    """
+    if state.get("columnar_dataset") is None:
+        return df
+    loaded = set(df.columns)
+    features = [_ for _ in state.proteins if _ not in loaded]
+    if len(features) == 0:
+        return df
+    feature_df = state.columnar_dataset.read(features, rows=df.index.to_numpy())
+    feature_df.index = df.index
+    # Missing values that were not counted when the file was loaded
+    if state.n_missing == 0 and feature_df.isna().to_numpy().any():
+        st.error(COLUMNAR_NAN_TEXT)
+        st.stop()
+    return pd.concat([df, feature_df], axis=1)
+
+
 # Generate tab elements for disclaimer, citation and bug report
 def _generate_tabs_elements():
     with st.expander(f"Disclaimer and Citation"):
@@ -438,6 +808,40 @@ def _generate_tabs_elements():
             st.markdown(BUG_REPORT_TEXT)
 
 
+# Show a window of the dataset
+def _show_dataset_preview(df):
+    """
+    Shows the first rows of one page of columns, the other columns first
+
+    Only this window is sent to the browser, whatever the size of the dataset.
+    """
+    is_metadata = df.columns.astype(str).str.startswith("_")
+    order = np.concatenate([np.flatnonzero(is_metadata), np.flatnonzero(~is_metadata)])
+    n_pages = max(1, -(-len(order) // PREVIEW_COLUMNS))
+
+    page = 1
+    if n_pages > 1:
+        page = st.number_input(
+            f"Page of columns (1 - {n_pages}):",
+            min_value=1,
+            max_value=n_pages,
+            value=1,
+            key=f"preview_page_{len(order)}",
+        )
+    window = order[(page - 1) * PREVIEW_COLUMNS : page * PREVIEW_COLUMNS]
+    st.markdown(
+        PREVIEW_TEXT.format(
+            N_ROWS=len(df),
+            N_FEATURES=int((~is_metadata).sum()),
+            N_OTHER=int(is_metadata.sum()),
+            N_SHOWN_ROWS=min(len(df), PREVIEW_ROWS),
+            FIRST=(page - 1) * PREVIEW_COLUMNS + 1,
+            LAST=(page - 1) * PREVIEW_COLUMNS + len(window),
+        )
+    )
+    st.dataframe(df.iloc[:PREVIEW_ROWS, window])
+
+
 # Show main text and data upload section
 def main_text_and_data_upload(state, APP_TITLE):
     # App title
@@ -448,21 +852,81 @@ def main_text_and_data_upload(state, APP_TITLE):
 
     # File upload or file selection
     with st.expander("Upload or select sample dataset (*Required)", expanded=True):
-        file_buffer = st.file_uploader("", type=["csv", "xlsx", "xls", "tsv"])
+        file_buffer = st.file_uploader(
+            "",
+            type=[
+                "csv",
+                "xlsx",
+                "xls",
+                "tsv",
+                "txt",
+                "parquet",
+                "feather",
+                "arrow",
+                "ipc",
+                "gz",
+                "zst",
+                "zip",
+            ],
+        )
         st.markdown(FILE_UPLOAD_TEXT)
 
-        if file_buffer is not None:
-            if file_buffer.name.endswith(".xlsx") or file_buffer.name.endswith(".xls"):
+        # Files from the server directory are read without uploading them
+        data_root = get_data_root()
+        source = file_buffer
+        if data_root is not None:
+            server_file = st.selectbox(
+                "Or select a file on the server:",
+                ["None"] + _list_server_files(data_root),
+                help=SERVER_FILE_TEXT,
+            )
+            if file_buffer is None and server_file != "None":
+                try:
+                    source = resolve_data_path(data_root, server_file)
+                except ValueError as e:
+                    st.error(e)
+
+        state["columnar_dataset"] = None
+        if source is not None:
+            file_name = source if isinstance(source, str) else source.name
+            compression = get_compression(file_name)
+            if compression is not None:
+                file_name = get_decompressed_name(source, file_name, compression)
+
+            if file_name.endswith(".xlsx") or file_name.endswith(".xls"):
                 delimiter = "Excel File"
-            elif file_buffer.name.endswith(".tsv"):
+            elif file_name.endswith(".tsv") or file_name.endswith(".txt"):
                 delimiter = "Tab (\\t) for TSV"
+            elif get_columnar_format(file_name) is not None:
+                delimiter = get_columnar_format(file_name)
             else:
+                # Detect the delimiter from the first lines
+                if compression is not None:
+                    detected = sniff_delimiter(open_decompressed(source, compression))
+                else:
+                    detected = sniff_delimiter(source)
+                delimiter_options = list(CSV_DELIMITERS)
                 delimiter = st.selectbox(
                     "Determine the delimiter in your dataset",
-                    ["Comma (,)", "Semicolon (;)"],
+                    delimiter_options,
+                    index=delimiter_options.index(detected) if detected else 0,
                 )
 
-            df, warnings = load_data(file_buffer, delimiter)
+            if compression is not None and delimiter not in CSV_DELIMITERS:
+                st.error(COMPRESSED_FILE_ERROR_TEXT)
+                df, warnings = pd.DataFrame(), []
+            elif delimiter in COLUMNAR_FORMATS.values():
+                # Features are loaded once they are needed for the analysis
+                state["columnar_dataset"] = _get_columnar_dataset(source, delimiter)
+                df = state.columnar_dataset.read(
+                    state.columnar_dataset.metadata_columns
+                )
+                df.attrs["fingerprint"] = fingerprint((source, delimiter))
+                warnings = []
+            elif delimiter in CSV_DELIMITERS:
+                df, warnings = _load_text_file(source, delimiter, compression)
+            else:
+                df, warnings = _load_file(source, delimiter)
 
             for warning in warnings:
                 st.warning(warning)
@@ -476,37 +940,74 @@ def main_text_and_data_upload(state, APP_TITLE):
 
         # Sample dataset / uploaded file selection
         dataframe_length = len(state.df)
-        max_df_length = 30
 
         if state.sample_file != "None" and dataframe_length:
             st.warning(
                 "**WARNING:** File uploaded but sample file selected. Please switch sample file to `None` to use your file."
             )
             state["df"] = pd.DataFrame()
+            state["columnar_dataset"] = None
         elif state.sample_file != "None":
             if state.sample_file == "Alzheimer":
                 st.info(ALZHEIMER_CITATION_TEXT)
 
-            folder_to_load = os.path.join(_parent_directory, "data")
-            file_to_load = os.path.join(folder_to_load, state.sample_file + ".xlsx")
-            state["df"] = pd.read_excel(file_to_load)
-            st.markdown("Using the following dataset:")
-            st.dataframe(state.df[state.df.columns[-20:]].head(max_df_length))
-        elif 0 < dataframe_length <= max_df_length:
+            state["df"] = load_sample_file(state.sample_file)
             st.markdown("Using the following dataset:")
-            st.dataframe(state.df)
-        elif dataframe_length > max_df_length:
+            _show_dataset_preview(state.df)
+        elif dataframe_length > 0:
             st.markdown("Using the following dataset:")
-            st.info(
-                f"The dataframe is too large, displaying the first {max_df_length} rows."
-            )
-            st.dataframe(state.df.head(max_df_length))
+            _show_dataset_preview(state.df)
         else:
             st.warning("**WARNING:** No dataset uploaded or selected.")
 
+    # Identity of the dataset for the memoization of the following steps
+    state["dataset_id"] = state.df.attrs.get("fingerprint")
+    if state.dataset_id is None and len(state.df) > 0:
+        state["dataset_id"] = fingerprint(state.df)
+
     return state
 
 
+# Select the rows of a subset
+@st.cache_resource(max_entries=4)
+def _select_subset(_df, dataset_id, subset_column, subset_class):
+    """
+    Row mask of the selected values, computed once per dataset and values
+    """
+    mask = _df[subset_column].isin(subset_class).to_numpy()
+    mask.flags.writeable = False
+    return mask
+
+
+# Rows of the subset
+def _get_subset(state):
+    """
+    Returns the rows of the subset, the dataset itself if no subset is selected
+    """
+    if state.get("subset_mask") is None:
+        return state.df
+    return state.df[state.subset_mask]
+
+
+# Categorical encoding of the metadata columns
+@st.cache_resource(max_entries=4)
+def _get_categorical_encoder(_df, dataset_id):
+    """
+    Category mappings of the metadata columns, fitted once per dataset
+    """
+    metadata_columns = [_ for _ in _df.columns if str(_).startswith("_")]
+    return CategoricalEncoder().fit(_df, metadata_columns)
+
+
+# Profile of a dataset
+@st.cache_resource(max_entries=4)
+def _get_dataset_profile(_df, dataset_id):
+    """
+    Dataset profile, computed once per dataset and shared by all sessions
+    """
+    return DatasetProfile(_df)
+
+
 # Generate data subset section
 def _generate_subset_section(state, multiselect):
     with st.expander("Create subset"):
@@ -517,18 +1018,23 @@ def _generate_subset_section(state, multiselect):
         )
 
         if state.subset_column != "None":
-            subset_options = state.df[state.subset_column].value_counts().index.tolist()
+            subset_options = state.profile.value_counts[state.subset_column]
+            subset_options = subset_options.index.tolist()
             subset_class = multiselect(
                 "Select values to keep:",
                 subset_options,
                 default=subset_options,
             )
-            state["df_sub"] = state.df[
-                state.df[state.subset_column].isin(subset_class)
-            ].copy()
+            state["subset_mask"] = _select_subset(
+                state.df, state.dataset_id, state.subset_column, subset_class
+            )
+            state["dataset_version"] = fingerprint(
+                (state.dataset_id, state.subset_column, subset_class)
+            )
         elif state.subset_column == "None":
-            state["df_sub"] = state.df.copy()
+            state["subset_mask"] = None
             state["subset_column"] = "None"
+            state["dataset_version"] = state.dataset_id
 
 
 # Generate classification target selection section
@@ -544,7 +1050,11 @@ def _generate_classification_target_section(state):
             unique_elements_list = []
         else:
             st.markdown(f"Unique elements in **`{state.target_column}`** column:")
-            unique_elements = state.df_sub[state.target_column].value_counts()
+            if state.subset_column == "None":
+                unique_elements = state.profile.value_counts[state.target_column]
+            else:
+                target = state.df[state.target_column][state.subset_mask]
+                unique_elements = target.value_counts()
             st.table(unique_elements)
             unique_elements_list = unique_elements.index.tolist()
         return unique_elements_list
@@ -575,7 +1085,6 @@ def _generate_class_selections(state, multiselect, unique_elements_list):
 def _generate_eda_section(state):
     with st.expander("EDA — Exploratory data analysis (^Recommended)"):
         st.markdown(EDA_TEXT)
-        state["df_sub_y"] = state.df_sub[state.target_column].isin(state.class_0)
         state["eda_method"] = st.selectbox(
             "Select an EDA method:",
             ["None", "PCA", "Hierarchical clustering"],
@@ -601,19 +1110,53 @@ def _generate_eda_section(state):
                 step=1 if len(state.proteins) < 100 else 10,
                 help="In large datasets, it is not possible to visaulize all the features.",
             )
+            clustering_bytes = clustering_memory(
+                len(state.df), state.data_range[1] - state.data_range[0]
+            )
+            st.caption(
+                CLUSTERING_MEMORY_TEXT.format(
+                    MEMORY=clustering_bytes / (1 << 20),
+                    LIMIT=MAX_CLUSTERING_MEMORY / (1 << 20),
+                )
+            )
 
-        if (state.eda_method != "None") and (
+        eda_key = fingerprint(
+            (
+                state.get("dataset_version"),
+                state.target_column,
+                state.class_0,
+                state.proteins,
+                state.eda_method,
+                state.get("pca_show_features"),
+                state.get("data_range"),
+            )
+        )
+        too_large = (
+            state.eda_method == "Hierarchical clustering"
+            and clustering_bytes > MAX_CLUSTERING_MEMORY
+        )
+        if too_large:
+            st.warning(CLUSTERING_TOO_LARGE_TEXT)
+        elif (state.eda_method != "None") and (
             st.button("Perform EDA", key="perform_eda")
         ):
             with st.spinner(f"Performing {state.eda_method}.."):
+                state["df_sub"] = _load_feature_columns(state, _get_subset(state))
+                state["df_sub_y"] = state.df_sub[state.target_column].isin(
+                    state.class_0
+                )
                 p = perform_EDA(state)
-                st.plotly_chart(p, use_container_width=True)
-                get_download_link(p, f"{state.eda_method}.pdf")
-                get_download_link(p, f"{state.eda_method}.svg")
+            # Kept for the session, so it is still shown after other widgets changed
+            # A new EDA replaces the figure and the exports of the previous one
+            st.session_state["eda"] = (eda_key, p, {})
+
+        if st.session_state.get("eda", (None,))[0] == eda_key:
+            _, p, exports = st.session_state.eda
+            show_figure(p, state.eda_method, exports)
 
 
 # Generate additional feature selection section
-def _generate_additional_feature_selection_section(state, multiselect):
+def _generate_additional_feature_selection_section(state, multiselect, selectbox):
     with st.expander("Additional features"):
         st.markdown(ADDITIONAL_FEATURES_TEXT)
 
@@ -640,9 +1183,9 @@ def _generate_additional_feature_selection_section(state, multiselect):
             st.markdown(
                 "The following additional features will be included for training:"
             )
-            additional_features_df.columns = [
-                "Additional features to be included for training"
-            ]
+            additional_features_df = additional_features_df.set_axis(
+                ["Additional features to be included for training"], axis=1
+            )
             st.table(additional_features_df)
             additional_features_df_list = list(
                 additional_features_df.iloc[:, 0].unique()
@@ -670,59 +1213,112 @@ def _generate_additional_feature_selection_section(state, multiselect):
                 default=None,
             )
 
+        # Encoding of the categorical additional features
+        categorical = [
+            _
+            for _ in state.additional_features
+            if is_categorical(state.profile.dtypes[_])
+        ]
+        if len(categorical) > 0:
+            st.markdown(CATEGORICAL_ENCODING_TEXT.format(FEATURES=categorical))
+            state["categorical_encoding"] = selectbox(
+                "Encoding of categorical features:",
+                CATEGORICAL_ENCODINGS,
+                help="Label: one number per category, One-hot: one column per category, Frequency: fraction of samples in the category.",
+            )
+        else:
+            state["categorical_encoding"] = "Label"
+
+
+# Read the features listed in an uploaded file
+def _upload_feature_list(state, label, key):
+    """
+    Returns the known features of the uploaded CSV file, one feature per row
+    """
+    file_buffer = st.file_uploader(label, help=label, type=["csv"], key=key)
+    feature_df, df_warnings = load_data(file_buffer, "Comma (,)", header=None)
+    for warning in df_warnings:
+        st.warning(warning)
+    if len(feature_df) == 0:
+        return []
+
+    known, unknown = state.feature_registry.resolve(feature_df.iloc[:, 0].tolist())
+    st.markdown(
+        FEATURE_LIST_TEXT.format(N_LISTED=len(known) + len(unknown), N_KNOWN=len(known))
+    )
+    if len(unknown) > 0:
+        st.warning(FEATURES_UPLOAD_WARNING_TEXT)
+    return known
+
+
+# Select features with a multiselect or by pattern for huge feature lists
+def _select_features(state, multiselect, label, key, default):
+    """
+    Returns the selected features
+
+    Feature lists above MAX_FEATURE_OPTIONS are not sent to the browser;
+    features are selected by regex or prefix and shown page by page.
+    """
+    registry = state.feature_registry
+    if len(registry) <= MAX_FEATURE_OPTIONS:
+        return multiselect(label, options=registry.features, default=default)
+
+    st.markdown(FEATURE_PATTERN_TEXT.format(N_FEATURES=len(registry)))
+    mode = st.selectbox("Select features by:", FEATURE_PATTERNS, key=f"{key}_mode")
+    pattern = st.text_input(f"{mode}:", "", key=f"{key}_pattern")
+    selected = default
+    if pattern:
+        try:
+            matches = registry.match(pattern, mode)
+            selected = registry.select(include=set(default).union(matches))
+        except ValueError as e:
+            st.error(str(e))
+
+    st.markdown(f"{len(selected)} features selected.")
+    if len(selected) > 0:
+        n_pages = registry.page(selected, 1)[1]
+        page = st.number_input(
+            "Page:", min_value=1, max_value=n_pages, value=1, key=f"{key}_page"
+        )
+        names, _ = registry.page(selected, page)
+        st.dataframe(pd.DataFrame({label: names}))
+    return selected
+
 
 # Generate exclude features selection section
 def _generate_exclude_features_section(state, multiselect):
     with st.expander("Exclude features"):
-        state["exclude_features"] = []
         st.markdown(EXCLUDE_FEATURES_TEXT)
         # File uploading for features to be excluded
-        exclusion_file_buffer = st.file_uploader(
+        uploaded_features = _upload_feature_list(
+            state,
             "Upload your CSV (comma(,) seperated) file here in which each row corresponds to a feature to be excluded.",
-            help="Upload your CSV (comma(,) seperated) file here in which each row corresponds to a feature to be excluded.",
-            type=["csv"],
+            "exclusion_file",
         )
-        exclusion_df, exc_df_warnings = load_data(
-            exclusion_file_buffer, "Comma (,)", header=None
+        state["exclude_features"] = _select_features(
+            state,
+            multiselect,
+            "Select features to be excluded:",
+            "exclude_features",
+            uploaded_features,
         )
-        for warning in exc_df_warnings:
-            st.warning(warning)
-
-        if len(exclusion_df) > 0:
-            st.markdown("The following features will be excluded:")
-            exclusion_df.columns = ["Features to be excluded from training"]
-            st.table(exclusion_df)
-            exclusion_df_list = list(exclusion_df.iloc[:, 0].unique())
-
-            suitable_uploaded_features = [
-                _ for _ in exclusion_df_list if _ in state.proteins
-            ]
-            if len(suitable_uploaded_features) != len(exclusion_df_list):
-                st.warning(FEATURES_UPLOAD_WARNING_TEXT)
-
-            state["exclude_features"] = multiselect(
-                "Select features to be excluded:",
-                help="Select features to be excluded from training:",
-                options=state.proteins,
-                default=suitable_uploaded_features,
-            )
-        else:
-            state["exclude_features"] = multiselect(
-                "Select features to be excluded:",
-                help="Select features to be excluded from training:",
-                options=state.proteins,
-                default=[],
-            )
 
 
 # Generate manual feature selection section
 def _generate_manual_feature_selection_section(state, multiselect):
     with st.expander("Manually select features"):
         st.markdown(MANUALLY_SELECT_FEATURES_TEXT)
-        manual_users_features = multiselect(
+        uploaded_features = _upload_feature_list(
+            state,
+            "Upload your CSV (comma(,) seperated) file here in which each row corresponds to a feature to be used.",
+            "manual_file",
+        )
+        manual_users_features = _select_features(
+            state,
+            multiselect,
             "Select your features manually:",
-            state.proteins,
-            default=None,
+            "manual_features",
+            uploaded_features,
         )
     if manual_users_features:
         state.proteins = manual_users_features
@@ -748,7 +1344,16 @@ def _generate_cohort_comparison_section(state):
 # Dataset handling all parts
 def dataset_handling(state, record_widgets):
     multiselect = record_widgets.multiselect
-    state["n_missing"] = state.df.isnull().sum().sum()
+    if state.get("dataset_id") is None:
+        state["profile"] = DatasetProfile(state.df)
+    else:
+        state["profile"] = _get_dataset_profile(state.df, state.dataset_id)
+    state["n_missing"] = state.profile.n_missing
+    if state.get("columnar_dataset") is not None:
+        proteins = state.columnar_dataset.feature_columns
+        state["n_missing"] += state.columnar_dataset.n_missing(proteins)
+    else:
+        proteins = state.profile.feature_columns
 
     if len(state.df) > 0:
         if state.n_missing > 0:
@@ -757,8 +1362,11 @@ def dataset_handling(state, record_widgets):
                 "Use missing value imputation or **XGBoost** classifier."
             )
         # Distinguish the features from others
-        state["proteins"] = [_ for _ in state.df.columns.to_list() if _[0] != "_"]
-        state["not_proteins"] = [_ for _ in state.df.columns.to_list() if _[0] == "_"]
+        state["proteins"] = list(proteins)
+        state["feature_registry"] = _session_memo(
+            "feature_registry", state.dataset_id, FeatureRegistry, state.proteins
+        )
+        state["not_proteins"] = list(state.profile.metadata_columns)
 
         # Create subset section
         _generate_subset_section(state, multiselect)
@@ -775,7 +1383,9 @@ def dataset_handling(state, record_widgets):
             _generate_eda_section(state)
 
             # Additional features selection section
-            _generate_additional_feature_selection_section(state, multiselect)
+            _generate_additional_feature_selection_section(
+                state, multiselect, record_widgets.selectbox
+            )
 
             # Exclude features section
             _generate_exclude_features_section(state, multiselect)
@@ -789,25 +1399,93 @@ def dataset_handling(state, record_widgets):
         # Define excluded features and proteins list
         if "exclude_features" not in state:
             state["exclude_features"] = []
-        state["proteins"] = [
-            _ for _ in state.proteins if _ not in state.exclude_features
-        ]
+        excluded = set(state.exclude_features)
+        state["proteins"] = [_ for _ in state.proteins if _ not in excluded]
 
     return state
 
 
 # Main analysis run section
 def main_analysis_run(state):
-    state.features = state.proteins + state.additional_features
-    subset = state.df_sub[
-        state.df_sub[state.target_column].isin(state.class_0)
-        | state.df_sub[state.target_column].isin(state.class_1)
-    ].copy()
-    state.y = subset[state.target_column].isin(state.class_0)
-    state.X = transform_dataset(subset, state.additional_features, state.proteins)
-
+    # Rows of the subset and the selected classes, the dataset is not copied
+    target = state.df[state.target_column]
+    mask = (target.isin(state.class_0) | target.isin(state.class_1)).to_numpy()
+    if state.get("subset_mask") is not None:
+        mask &= state.subset_mask
+    rows = np.flatnonzero(mask)
+    state.y = target.iloc[rows].isin(state.class_0)
     if state.cohort_column is not None:
-        state["X_cohort"] = subset[state.cohort_column]
+        state["X_cohort"] = state.df[state.cohort_column].iloc[rows]
+
+    source = state.df
+    if state.get("columnar_dataset") is not None:
+        source = _load_feature_columns(state, state.df.iloc[rows])
+        rows = None
+    # Category mappings of the dataset, also used to encode new samples
+    if state.get("dataset_id") is None:
+        state["categorical_encoder"] = None
+    else:
+        state["categorical_encoder"] = _get_categorical_encoder(
+            state.df, state.dataset_id
+        )
+    state.X = transform_dataset(
+        source,
+        state.additional_features,
+        state.proteins,
+        rows,
+        state.categorical_encoder,
+        state.get("categorical_encoding", "Label"),
+    )
+    encoded_features = list(state.X.columns[len(state.proteins) :])
+
+    # Pre-filter features without using the labels
+    state["n_prefiltered"] = 0
+    max_missing = state.get("prefilter_missing", 1.0)
+    min_variance = state.get("prefilter_variance", 0.0)
+    if (max_missing < 1.0 or min_variance > 0.0) and len(state.proteins) > 0:
+        # Profile of the selected samples, computed once per dataset and classes
+        if state.get("dataset_version") is None:
+            profile = DatasetProfile(state.X)
+        else:
+            analysis_id = fingerprint(
+                (
+                    state.dataset_version,
+                    state.target_column,
+                    state.class_0,
+                    state.class_1,
+                    state.proteins,
+                    state.additional_features,
+                )
+            )
+            profile = _get_dataset_profile(state.X, analysis_id)
+        proteins = prefilter_features(
+            feature_view(state.X, state.proteins), max_missing, min_variance, profile
+        )
+        state["n_prefiltered"] = len(state.proteins) - len(proteins)
+        st.info(
+            PREFILTER_INFO_TEXT.format(
+                N_REMOVED=state.n_prefiltered,
+                N_FEATURES=len(state.proteins),
+                N_KEPT=len(proteins),
+            )
+        )
+        state.proteins = proteins
+
+    # Keep one feature per group of duplicate or correlated features
+    state["feature_clusters"] = None
+    if state.get("redundancy_pruning", "Keep") != "Keep" and len(state.proteins) > 1:
+        proteins, state["feature_clusters"] = prune_redundant_features(
+            feature_view(state.X, state.proteins), state.correlation_threshold
+        )
+        st.info(
+            REDUNDANCY_INFO_TEXT.format(
+                N_REMOVED=len(state.proteins) - len(proteins),
+                N_CLUSTERS=len(state.feature_clusters),
+                N_KEPT=len(proteins),
+            )
+        )
+        state.proteins = proteins
+    state.features = state.proteins + encoded_features
 
     # Show the running info text
     st.info(
@@ -836,61 +1514,72 @@ def get_system_report():
     return report
 
 
-# Get download link for plots, CSV and TXT
-def get_download_link(exported_object, name):
+# Show a plotly figure
+def show_figure(p, name, exports=None):
+    """
+    Shows a figure whose modebar exports SVGs in the browser, and its PDF export
     """
-    Generate download link for charts in SVG and PDF formats and for dataframes in CSV format
+    config = {
+        "toImageButtonOptions": {
+            "format": "svg",
+            "filename": name,
+            "height": 700,
+            "width": 700,
+            "scale": 1,
+        }
+    }
+    st.plotly_chart(p, use_container_width=True, config=config)
+    if p:
+        get_download_button(p, f"{name}.pdf", exports)
+
+
+# Get download buttons for plots, CSV and TXT
+def get_download_button(exported_object, name, exports=None):
+    """
+    Download button for charts in PDF format, dataframes in CSV and texts in TXT format
+
+    Charts are only rendered to PDF after "Prepare" was pressed. The files
+    are kept in `exports`, by default the exports of the last run.
     """
-    os.makedirs("downloads/", exist_ok=True)
     extension = name.split(".")[-1]
-    download_button_css_class = "css-1x8cf1d edgvbvh10"
-
-    if extension == "svg":
-        exported_object.write_image("downloads/" + name, height=700, width=700, scale=1)
-        with open("downloads/" + name) as f:
-            svg = f.read()
-        b64 = base64.b64encode(svg.encode()).decode()
-        href = (
-            f'<a class="{download_button_css_class}" href="data:image/svg+xml;base64,%s" download="%s" >Download as *.svg</a>'
-            % (b64, name)
-        )
-        st.markdown(href, unsafe_allow_html=True)
-
-    elif extension == "pdf":
-        exported_object.write_image("downloads/" + name, height=700, width=700, scale=1)
-        with open("downloads/" + name, "rb") as f:
-            pdf = f.read()
-        b64 = base64.encodebytes(pdf).decode()
-        href = (
-            f'<a class="{download_button_css_class}" href="data:application/pdf;base64,%s" download="%s" >Download as *.pdf</a>'
-            % (b64, name)
+    key = f"download_{name}"
+
+    if extension == "pdf":
+        if exports is None:
+            exports = st.session_state.setdefault("exports", {})
+        export_key = (name, id(exported_object))
+        if export_key not in exports:
+            if not st.button("Prepare *.pdf", key=f"prepare_{name}"):
+                return
+            with st.spinner(f"Rendering {name}.."):
+                exports[export_key] = (
+                    _get_export_service().render(exported_object, "pdf").result()
+                )
+        st.download_button(
+            "Download as *.pdf",
+            exports[export_key],
+            file_name=name,
+            mime="application/pdf",
+            key=key,
         )
-        st.markdown("")
-        st.markdown(href, unsafe_allow_html=True)
 
     elif extension == "csv":
-        exported_object.to_csv("downloads/" + name, index=False)
-        with open("downloads/" + name, "rb") as f:
-            csv = f.read()
-        b64 = base64.b64encode(csv).decode()
-        href = (
-            f'<a class="{download_button_css_class}" href="data:file/csv;base64,%s" download="%s" >Download as *.csv</a>'
-            % (b64, name)
+        st.download_button(
+            "Download as *.csv",
+            exported_object.to_csv(index=False).encode(),
+            file_name=name,
+            mime="text/csv",
+            key=key,
         )
-        st.markdown("")
-        st.markdown(href, unsafe_allow_html=True)
 
     elif extension == "txt":
-        with open("downloads/" + name, "w") as f:
-            f.write(exported_object.replace("  ", ""))
-        with open("downloads/" + name, "rb") as f:
-            txt = f.read()
-        b64 = base64.b64encode(txt).decode()
-        href = (
-            f'<a class="{download_button_css_class}" href="data:text/plain;base64,%s" download="%s" >Download as *.txt</a>'
-            % (b64, name)
+        st.download_button(
+            "Download as *.txt",
+            exported_object.replace("  ", ""),
+            file_name=name,
+            mime="text/plain",
+            key=key,
         )
-        st.markdown(href, unsafe_allow_html=True)
 
     else:
         raise NotImplementedError("This output format function is not implemented")
@@ -915,6 +1604,21 @@ def generate_summary_text(state, report):
         params = [f"{k} = {v}" for k, v in state.normalization_params.items()]
         text += f"Data was normalized in each using a {state.normalization} ({', '.join(params)}) approach. "
 
+    # Pre-filtering
+    if state.get("n_prefiltered", 0) > 0:
+        text += f"Before cross-validation, {state.n_prefiltered} features with a fraction of missing values above {state.prefilter_missing} or a variance below {state.prefilter_variance} were removed. "
+
+    if state.get("feature_clusters"):
+        n_removed = sum(len(_) for _ in state.feature_clusters.values())
+        if state.correlation_threshold is None:
+            text += f"{n_removed} duplicate features were removed. "
+        else:
+            text += f"{n_removed} features that were duplicates of or had an absolute Pearson correlation of at least {state.correlation_threshold} with a remaining feature were removed. "
+
+    # Categorical encoding
+    if state.get("categorical_encoding", "Label") != "Label":
+        text += f"Categorical additional features were {state.categorical_encoding.lower()} encoded. "
+
     # Missing value imptutation
     if state.n_missing > 0:
         if state.missing_value != "None":
@@ -993,11 +1697,13 @@ def generate_summary_text(state, report):
     st.header("Summary")
     with st.expander("Summary text"):
         st.info(text)
-        get_download_link(text, "summary_text.txt")
+        get_download_button(text, "summary_text.txt")
+    return text
 
 
 # Display feature importances
-def _generate_feature_importances_section(state, cv_curves):
+def _generate_feature_importances_section(state):
+    cv_curves = state.cv_curves
     top_features = []
     # Feature importances from the classifier
     with st.expander("Feature importances from the classifier"):
@@ -1012,24 +1718,22 @@ def _generate_feature_importances_section(state, cv_curves):
 
         if cv_curves["feature_importances_"] is not None:
             # Check whether all feature importance attributes are 0 or not
-            if (
-                pd.DataFrame(cv_curves["feature_importances_"]).isin([0]).all().all()
-                == False
-            ):
-                p, feature_df, feature_df_wo_links = plot_feature_importance(
-                    cv_curves["feature_importances_"]
+            if cv_curves["feature_importances_"].any():
+                p, feature_df, feature_df_wo_links = _get_run_figure(
+                    state,
+                    "clf_feature_importance",
+                    plot_feature_importance,
+                    cv_curves["feature_importances_"],
+                    state.get("feature_clusters"),
                 )
-                st.plotly_chart(p, use_container_width=True)
-                if p:
-                    get_download_link(p, "clf_feature_importance.pdf")
-                    get_download_link(p, "clf_feature_importance.svg")
+                show_figure(p, "clf_feature_importance")
 
                 # Display `feature_df` with NCBI links
                 st.write(
                     feature_df.to_html(escape=False, index=False),
                     unsafe_allow_html=True,
                 )
-                get_download_link(feature_df_wo_links, "clf_feature_importances.csv")
+                get_download_button(feature_df_wo_links, "clf_feature_importances.csv")
 
                 top_features = feature_df.index.to_list()
 
@@ -1045,40 +1749,46 @@ def _generate_feature_importances_section(state, cv_curves):
 
 
 # Generate ROC section
-def _generate_roc_curve_section(cv_curves):
+def _generate_roc_curve_section(state):
     with st.expander("Receiver operating characteristic Curve"):
-        p = plot_roc_curve_cv(cv_curves["roc_curves_"])
-        st.plotly_chart(p, use_container_width=True)
-        if p:
-            get_download_link(p, "roc_curve.pdf")
-            get_download_link(p, "roc_curve.svg")
+        p = _get_run_figure(
+            state, "roc_curve", plot_roc_curve_cv, state.cv_curves["roc_curves_"]
+        )
+        show_figure(p, "roc_curve")
 
 
 # Generate PR curve
-def _generate_pr_curve_section(cv_curves, cv_results):
+def _generate_pr_curve_section(state):
     with st.expander("Precision-Recall Curve"):
         st.markdown(
             "Precision-Recall (PR) Curve might be used for imbalanced datasets."
         )
-        p = plot_pr_curve_cv(cv_curves["pr_curves_"], cv_results["class_ratio_test"])
-        st.plotly_chart(p, use_container_width=True)
-        if p:
-            get_download_link(p, "pr_curve.pdf")
-            get_download_link(p, "pr_curve.svg")
+        p = _get_run_figure(
+            state,
+            "pr_curve",
+            plot_pr_curve_cv,
+            state.cv_curves["pr_curves_"],
+            state.cv_results["class_ratio_test"],
+        )
+        show_figure(p, "pr_curve")
 
 
 # Generate confusion matrix
-def _generate_cm_section(state, cv_curves):
+def _generate_cm_section(state):
+    cv_curves = state.cv_curves
     with st.expander("Confusion matrix"):
         names = ["CV_split {}".format(_ + 1) for _ in range(len(cv_curves["y_hats_"]))]
         names.insert(0, "Sum of all splits")
-        p = plot_confusion_matrices(
-            state.class_0, state.class_1, cv_curves["y_hats_"], names
+        p = _get_run_figure(
+            state,
+            "cm",
+            plot_confusion_matrices,
+            state.class_0,
+            state.class_1,
+            cv_curves["y_hats_"],
+            names,
         )
-        st.plotly_chart(p, use_container_width=True)
-        if p:
-            get_download_link(p, "cm.pdf")
-            get_download_link(p, "cm.svg")
+        show_figure(p, "cm")
 
         cm_results = [calculate_cm(*_)[1] for _ in cv_curves["y_hats_"]]
         cm_results = pd.DataFrame(cm_results, columns=["TPR", "FPR", "TNR", "FNR"])
@@ -1091,44 +1801,44 @@ def _generate_cm_section(state, cv_curves):
 
 
 # Display results table
-def _generate_results_table_section(state, cv_results):
+def _generate_results_table_section(state):
     with st.expander("Table for run results"):
         st.markdown(f"**Run results for `{state.classifier}` model:**")
-        state["summary"] = pd.DataFrame(pd.DataFrame(cv_results).describe())
         st.table(state.summary)
         st.info(RESULTS_TABLE_INFO)
-        get_download_link(state.summary, "run_results.csv")
+        get_download_button(state.summary, "run_results.csv")
 
 
 # Display cohort results
-def _generate_cohort_results_section(state, cv_results):
+def _generate_cohort_results_section(state):
     st.header("Cohort comparison results")
-    cohort_results, cohort_curves = perform_cross_validation(state, state.cohort_column)
+    cohort_results, cohort_curves = state.cohort_results, state.cohort_curves
 
     # ROC-AUC for Cohorts
     with st.expander("Receiver operating characteristic Curve"):
-        p = plot_roc_curve_cv(
-            cohort_curves["roc_curves_"], cohort_curves["cohort_combos"]
+        p = _get_run_figure(
+            state,
+            "roc_curve_cohort",
+            plot_roc_curve_cv,
+            cohort_curves["roc_curves_"],
+            cohort_curves["cohort_combos"],
         )
-        st.plotly_chart(p, use_container_width=True)
-        if p:
-            get_download_link(p, "roc_curve_cohort.pdf")
-            get_download_link(p, "roc_curve_cohort.svg")
+        show_figure(p, "roc_curve_cohort")
 
     # PR Curve for Cohorts
     with st.expander("Precision-Recall Curve"):
         st.markdown(
             "Precision-Recall (PR) Curve might be used for imbalanced datasets."
         )
-        p = plot_pr_curve_cv(
+        p = _get_run_figure(
+            state,
+            "pr_curve_cohort",
+            plot_pr_curve_cv,
             cohort_curves["pr_curves_"],
             cohort_results["class_ratio_test"],
             cohort_curves["cohort_combos"],
         )
-        st.plotly_chart(p, use_container_width=True)
-        if p:
-            get_download_link(p, "pr_curve_cohort.pdf")
-            get_download_link(p, "pr_curve_cohort.svg")
+        show_figure(p, "pr_curve_cohort")
 
     # Confusion Matrix (CM) for Cohorts
     with st.expander("Confusion matrix"):
@@ -1138,49 +1848,153 @@ def _generate_cohort_results_section(state, cv_results):
         ]
         names.insert(0, "Sum of cohort comparisons")
 
-        p = plot_confusion_matrices(
-            state.class_0, state.class_1, cohort_curves["y_hats_"], names
+        p = _get_run_figure(
+            state,
+            "cm_cohorts",
+            plot_confusion_matrices,
+            state.class_0,
+            state.class_1,
+            cohort_curves["y_hats_"],
+            names,
         )
-        st.plotly_chart(p, use_container_width=True)
-        if p:
-            get_download_link(p, "cm_cohorts.pdf")
-            get_download_link(p, "cm_cohorts.svg")
+        show_figure(p, "cm_cohorts")
 
     with st.expander("Table for run results"):
-        state["cohort_summary"] = pd.DataFrame(pd.DataFrame(cv_results).describe())
         st.table(state.cohort_summary)
-        get_download_link(state.cohort_summary, "run_results_cohort.csv")
+        get_download_button(state.cohort_summary, "run_results_cohort.csv")
 
-    state["cohort_combos"] = cohort_curves["cohort_combos"]
-    state["cohort_results"] = cohort_results
+
+# Run the cross-validation
+def run_cross_validation(state):
+    """
+    Runs the cross-validation and the cohort comparison, keeping the results in state
+    """
+    state.bar = st.progress(0)
+    st.markdown("Performing analysis and Running cross-validation")
+    state["cv_results"], state["cv_curves"] = perform_cross_validation(state)
+    state["summary"] = pd.DataFrame(pd.DataFrame(state.cv_results).describe())
+
+    if state.cohort_checkbox:
+        state["cohort_results"], state["cohort_curves"] = perform_cross_validation(
+            state, state.cohort_column
+        )
+        state["cohort_summary"] = state.summary
+        state["cohort_combos"] = state.cohort_curves["cohort_combos"]
+
+    runs = [state.cv_curves] + ([state.cohort_curves] if state.cohort_checkbox else [])
+    for curves in runs:
+        if curves.get("n_uncalibrated", 0) > 0:
+            st.warning(
+                UNCALIBRATED_SPLITS_TEXT.format(
+                    N_SPLITS=curves["n_uncalibrated"],
+                    N_TOTAL=len(curves["y_hats_"]),
+                )
+            )
+    return state
+
+
+# Keep the results of a run
+def keep_run(state):
+    """
+    Returns the run without the data, to show its results on later reruns
+    """
+    # A new run replaces the exports of the previous one
+    st.session_state["exports"] = {}
+    return objdict({k: v for k, v in state.items() if k not in RUN_DATA_KEYS})
+
+
+# Figures of a run
+def _get_run_figure(state, name, plot, *args):
+    """
+    Creates a figure of the run once, so reruns show the same figure
+    """
+    figures = state.setdefault("figures", {})
+    if name not in figures:
+        figures[name] = plot(*args)
+    return figures[name]
+
+
+# Export service
+@st.cache_resource
+def _get_export_service():
+    """
+    Background export service with a warm renderer, shared by all sessions
+    """
+    return ExportService()
+
+
+# Download all results of a run in one file
+def results_bundle(state):
+    """
+    Zip file with all figures, tables, the summary text and the run config
+
+    The bundle is rendered in the background. Until it is ready a status is
+    shown, other widgets can still be used; the next rerun checks it again.
+    """
+    if state.get("bundle") is None:
+        tables = {"run_results.csv": state.summary}
+        if state.cohort_checkbox:
+            tables["run_results_cohort.csv"] = state.cohort_summary
+        if "clf_feature_importance" in state.figures:
+            tables["clf_feature_importances.csv"] = state.figures[
+                "clf_feature_importance"
+            ][2]
+        if len(st.session_state.history) > 0:
+            tables["session_history.csv"] = _get_session_history_df()
+        figures = {
+            name: p[0] if isinstance(p, tuple) else p
+            for name, p in state.figures.items()
+        }
+        config = {k: v for k, v in state.items() if k not in RUN_RESULT_KEYS}
+        state["bundle"] = _get_export_service().bundle(
+            figures,
+            tables,
+            {"summary_text.txt": state.summary_text.replace("  ", "")},
+            config,
+        )
+
+    st.header("Export")
+    status = st.empty()
+    while not state.bundle.done():
+        # Each update lets Streamlit stop this rerun for a newer one
+        status.info(BUNDLE_TEXT)
+        time.sleep(0.5)
+    status.empty()
+    try:
+        bundle = state.bundle.result()
+    except (ValueError, RuntimeError) as e:
+        st.warning(f"The results could not be exported due to {e}.")
+        return
+    st.download_button(
+        "Download all results as *.zip",
+        bundle,
+        file_name="omiclearn_results.zip",
+        mime="application/zip",
+        key="download_bundle",
+    )
 
 
 # Display all results and plots
 def display_results_and_plots(state):
-    state.bar = st.progress(0)
-
-    # Cross-Validation
-    st.markdown("Performing analysis and Running cross-validation")
-    cv_results, cv_curves = perform_cross_validation(state)
     st.header("Cross-validation results")
 
     # Feature importances
-    _generate_feature_importances_section(state, cv_curves)
+    _generate_feature_importances_section(state)
 
     # ROC-AUC
-    _generate_roc_curve_section(cv_curves)
+    _generate_roc_curve_section(state)
 
     # Precision-Recall Curve
-    _generate_pr_curve_section(cv_curves, cv_results)
+    _generate_pr_curve_section(state)
 
     # Confusion Matrix (CM)
-    _generate_cm_section(state, cv_curves)
+    _generate_cm_section(state)
 
     # Results table
-    _generate_results_table_section(state, cv_results)
+    _generate_results_table_section(state)
 
     # Cohort results
     if state.cohort_checkbox:
-        _generate_cohort_results_section(state, cv_results)
+        _generate_cohort_results_section(state)
 
     return state
@@ -57,8 +57,18 @@ EXCLUDE_FEATURES_TEXT = """Exclude some features from the model training by sele
 This can be useful when, e.g., re-running a model without a top feature and assessing the difference in classification accuracy.
 """
 
+FEATURE_LIST_TEXT = (
+    "{N_KNOWN} of the {N_LISTED} features in the file were found in the dataset."
+)
+
+FEATURE_PATTERN_TEXT = """The dataset has {N_FEATURES} features. Select them by a regular expression (e.g. `^HLA-`)
+or by prefixes separated by commas (e.g. `HLA-, KRT`). The selected features are added to the ones of the uploaded file.
+"""
+
 ADDITIONAL_FEATURES_TEXT = "Select additional features. All non numerical values will be encoded (e.g. M/F -> 0,1)"
 
+CATEGORICAL_ENCODING_TEXT = "Categorical features: `{FEATURES}`. The categories are taken from the whole dataset and are encoded without the target."
+
 FEATURES_UPLOAD_WARNING_TEXT = """⚠️ **Warning:** All of the features provided can not be used since they might not start with leading '_'. 
 Suitable features are provided in the selectbox below."""
 
@@ -92,3 +102,50 @@ RUNNING_INFO_TEXT = """
     Please check our [recommendations](https://OmicLearn.readthedocs.io/en/latest/RECOMMENDATIONS.html)
     page for potential pitfalls and interpret performance metrics accordingly.
 """
+
+PREFILTER_INFO_TEXT = """**Pre-filtering:** Removed **{N_REMOVED}** of {N_FEATURES} features 
+based on missing values and variance. Using the remaining **{N_KEPT}** features."""
+
+REDUNDANCY_INFO_TEXT = """**Redundant features:** Removed **{N_REMOVED}** features that are duplicates of 
+or correlated with one of {N_CLUSTERS} representative features. Using the remaining **{N_KEPT}** features."""
+
+TYPED_LOADING_TEXT = """Recommended for wide numeric matrices. The file is parsed in parallel and all features
+(columns without a leading '_') are read as numbers. Decimal commas are converted and other non-numeric
+values (e.g. 'Filtered') are set to missing values."""
+
+DATA_LAYOUT_TEXT = """**Samples as rows:** one row per sample and one column per feature.\n
+**Features as rows:** one row per feature (e.g. a MaxQuant `proteinGroups.txt`), the columns starting with the given prefix are the samples; columns without numeric values are excluded.\n
+**Long format:** one row per sample and feature (e.g. a DIA-NN or Spectronaut report).\n
+Pivoted files are read in chunks and the sample names are stored in the `_sample` column."""
+
+SAMPLE_ANNOTATIONS_TEXT = """Table with one row per sample. The selected sample column is matched with the sample names,
+all other columns are added as additional features with a leading '_' (e.g. `_disease`)."""
+
+SERVER_FILE_TEXT = """Files in the data directory of this OmicLearn server (set by the `OMICLEARN_DATA_ROOT` environment variable).
+They are read directly from the disk, so they are not limited by the upload size."""
+
+COMPRESSED_FILE_ERROR_TEXT = """**ERROR:** Compressed files (`.gz`, `.zst`, `.zip`) must contain a `.csv`, `.tsv` or `.txt` file.
+Excel and columnar files are already compressed and can be uploaded directly."""
+
+DATA_CACHE_TEXT = """Loaded datasets are cached on disk: **{N_ENTRIES}** entries, **{SIZE:.1f}** of **{MAX_SIZE:.0f}** MB.\n
+Since the server started: {HITS} hits, {MISSES} misses, {EVICTIONS} evictions."""
+
+COLUMNAR_NAN_TEXT = "**ERROR:** The features contain missing values that were not found when the file was loaded. Write the file with pandas to store them as missing values (nulls)."
+
+UNCALIBRATED_SPLITS_TEXT = "**WARNING:** In {N_SPLITS} of {N_TOTAL} splits a class has too few training samples for a calibration holdout, the uncalibrated decision scores are used for these splits."
+
+APPLY_PARAMETERS_TEXT = "The parameters of the classifier are used once they are applied. Changing them does not rerun the app."
+
+RERUN_TEXT = "The previous rerun of the app took {RERUN_MS:.0f} ms."
+
+PREVIEW_TEXT = "**{N_ROWS}** samples, **{N_FEATURES}** features and **{N_OTHER}** other columns (leading `_`). Showing the first {N_SHOWN_ROWS} rows of columns {FIRST} to {LAST}."
+
+RESULTS_REPLAY_TEXT = "Results of the last run. Press **Run analysis** to update them with the current settings."
+
+BUNDLE_TEXT = (
+    "Preparing the figures, tables and the summary text of the run for download.."
+)
+
+CLUSTERING_MEMORY_TEXT = "Estimated memory of the clustering: {MEMORY:,.0f} MB of at most {LIMIT:,.0f} MB (set by `OMICLEARN_CLUSTERING_MEMORY_MB`)."
+
+CLUSTERING_TOO_LARGE_TEXT = "**WARNING:** Clustering this many features would exceed the memory limit. Select a smaller data range."
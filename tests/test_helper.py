@@ -1,20 +1,65 @@
 """Tests for omiclearn utils."""
+import gzip
+import json
+import os
 import sys
+import zipfile
 from io import BytesIO
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import pytest
 import streamlit as st
 
 sys.path.append("..")
 from test_results import *
 
+from omiclearn.utils import data_helper
+from omiclearn.utils.cache_helper import DiskCache, fingerprint
+from omiclearn.utils.data_helper import (
+    ColumnarDataset,
+    DatasetProfile,
+    FeatureRegistry,
+    get_data_root,
+    get_decompressed_name,
+    join_sample_annotations,
+    list_data_files,
+    open_decompressed,
+    read_excel_file,
+    read_features_as_rows,
+    read_long_format,
+    read_sample_file,
+    read_typed_csv,
+    resolve_data_path,
+    sniff_delimiter,
+)
+from omiclearn.utils.export_helper import ExportService
 from omiclearn.utils.ml_helper import (
+    BlockedKNNImputer,
+    CategoricalEncoder,
+    FeatureImportanceAccumulator,
+    KNNDistanceCache,
+    ProteomicsImputer,
+    RankingClassifier,
     calculate_cm,
+    fit_linear_svc,
     normalize_dataset,
     perform_cross_validation,
+    prefilter_features,
+    prune_redundant_features,
     transform_dataset,
 )
+from omiclearn.utils.plot_helper import (
+    correlation_matrix,
+    decimate_curve,
+    dendrogram_links,
+    generate_dendrogram,
+    interpolate_curves,
+    row_distances,
+)
 from omiclearn.utils.ui_components import load_data, main_analysis_run, objdict
 
 state = {}
@@ -48,6 +93,326 @@ def test_load_data():
     pd.testing.assert_frame_equal(tsv_data, df)
 
 
+def test_read_typed_csv():
+    """
+    Test the typed loading of wide text files
+    """
+    output = BytesIO(b"A;B;_disease\n1,5;Filtered;a\n2;NaN;b\n 3 ;4;a\n")
+    data, warnings = read_typed_csv(output, "Semicolon (;)", "float32")
+    df = pd.DataFrame(
+        {"A": [1.5, 2.0, 3.0], "B": [np.nan, np.nan, 4.0], "_disease": list("aba")}
+    )
+    df[["A", "B"]] = df[["A", "B"]].astype("float32")
+    pd.testing.assert_frame_equal(data, df)
+    assert len(warnings) == 3
+
+    data, warnings = read_typed_csv("test_tsv.tsv", "Tab (\\t) for TSV")
+    pd.testing.assert_frame_equal(
+        data, pd.DataFrame({"A": [1.0, 1.0], "B": [0.0, 0.0]})
+    )
+    assert warnings == []
+
+
+def test_read_excel_file(monkeypatch):
+    """
+    Test reading Excel files with both readers
+    """
+    df = pd.DataFrame({"AAA": [1, 2], "BBB": [0.5, np.nan], 3: ["a", "b"]})
+    output = BytesIO()
+    df.to_excel(output, index=False)
+
+    for calamine_installed in {False, data_helper.calamine_installed}:
+        monkeypatch.setattr(data_helper, "calamine_installed", calamine_installed)
+        data, warnings = read_excel_file(output)
+        pd.testing.assert_frame_equal(data, df[["AAA", "BBB"]])
+        assert len(warnings) == 2
+
+    # Empty and duplicate headers are named like pandas does
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    workbook.active.append(["AAA", None, "AAA", "AAA.1", "AAA", 2])
+    workbook.active.append([1, 2, 3, 4, 5, 6])
+    output = BytesIO()
+    workbook.save(output)
+    expected = pd.read_excel(output)
+    for calamine_installed in {False, data_helper.calamine_installed}:
+        monkeypatch.setattr(data_helper, "calamine_installed", calamine_installed)
+        data, warnings = read_excel_file(output)
+        assert list(data.columns) == list(expected.columns[:-1])
+        assert list(data.columns) == ["AAA", "Unnamed: 1", "AAA.2", "AAA.1", "AAA.3"]
+
+
+def test_pivot_layouts():
+    """
+    Test reading transposed and long format files in chunks
+    """
+    expected = pd.DataFrame(
+        {"_sample": ["S1", "S2"], "P1": [1.0, 4.0], "P2": [2.0, np.nan]}
+    )
+    transposed = pd.DataFrame(
+        {"Protein": ["P1", "P2"], "LFQ S1": [1.0, 2.0], "LFQ S2": [4.0, np.nan]}
+    )
+    output = BytesIO(transposed.to_csv(sep="\t", index=False).encode())
+    data, warnings = read_features_as_rows(
+        output, "Tab (\\t) for TSV", "Protein", "LFQ ", chunksize=1
+    )
+    pd.testing.assert_frame_equal(data, expected, check_column_type=False)
+
+    # Sample columns are taken from the header, also with non-numeric cells
+    transposed["LFQ S2"] = ["4", "Filtered"]
+    transposed["LFQ notes"] = ["a", "b"]
+    output = BytesIO(transposed.to_csv(sep="\t", index=False).encode())
+    data, warnings = read_features_as_rows(
+        output, "Tab (\\t) for TSV", "Protein", "LFQ "
+    )
+    pd.testing.assert_frame_equal(data, expected, check_column_type=False)
+    assert warnings == [
+        "Excluded 1 columns without numeric values (LFQ notes).",
+        "Set 1 non-numeric cells in 1 columns to NaN (LFQ S2).",
+    ]
+
+    long = pd.DataFrame(
+        {
+            "Run": ["S1", "S2", "S1", "S1"],
+            "PG": ["P1", "P1", "P2", "P1"],
+            "Q": [0, 4, 2, 1],
+        }
+    )
+    output = BytesIO(long.to_csv(index=False).encode())
+    data, warnings = read_long_format(
+        output, "Comma (,)", "Run", "PG", "Q", chunksize=3
+    )
+    pd.testing.assert_frame_equal(data, expected, check_column_type=False)
+    assert len(warnings) == 1
+
+    annotations = pd.DataFrame({"id": ["S2", "S1"], "disease": ["b", "a"]})
+    pivoted = data
+    data, warnings = join_sample_annotations(pivoted, annotations, "id")
+    assert data.columns.tolist() == ["_sample", "_disease", "P1", "P2"]
+    assert data["_disease"].tolist() == ["a", "b"]
+    assert warnings == []
+    # The features are shared with the pivoted frame
+    assert np.shares_memory(data["P1"].to_numpy(), pivoted["P1"].to_numpy())
+    data, warnings = join_sample_annotations(data, annotations, "id")
+    assert data.columns.tolist() == ["_sample", "_disease", "P1", "P2"]
+    assert warnings == ["Skipping annotations already in the dataset: _disease."]
+
+
+def test_compressed_files():
+    """
+    Test reading gzip, zstd and zip compressed text files
+    """
+    df = pd.DataFrame({"A": [1.5, 2.0], "_disease": ["a", "b"]})
+    text = df.to_csv(sep=";", index=False).encode()
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as f:
+        f.writestr("data.csv", text)
+
+    for compression, content, file_name in [
+        ("gzip", gzip.compress(text), "data.csv.gz"),
+        ("zstd", pa.compress(text, "zstd", asbytes=True), "data.csv.zst"),
+        ("zip", archive.getvalue(), "data.zip"),
+    ]:
+        output = BytesIO(content)
+        assert get_decompressed_name(output, file_name, compression) == "data.csv"
+        delimiter = sniff_delimiter(open_decompressed(output, compression))
+        assert delimiter == "Semicolon (;)"
+        data, warnings = load_data(output, delimiter, compression=compression)
+        pd.testing.assert_frame_equal(data, df)
+        data, warnings = read_typed_csv(
+            open_decompressed(output, compression), delimiter
+        )
+        pd.testing.assert_frame_equal(data, df)
+
+
+def test_data_root(tmp_path, monkeypatch):
+    """
+    Test that only files inside the data root can be selected
+    """
+    data_root, outside = tmp_path / "data", tmp_path / "outside"
+    (data_root / "sub").mkdir(parents=True)
+    outside.mkdir()
+    (data_root / "sub" / "data.tsv").write_text("A\tB\n1\t0\n")
+    (data_root / "notes.md").write_text("")
+    (outside / "secret.csv").write_text("A\n1\n")
+    (data_root / "link.csv").symlink_to(outside / "secret.csv")
+
+    monkeypatch.setenv("OMICLEARN_DATA_ROOT", str(data_root))
+    root = get_data_root()
+    assert list_data_files(root) == [os.path.join("sub", "data.tsv")]
+    assert resolve_data_path(root, "sub/data.tsv") == str(
+        data_root / "sub" / "data.tsv"
+    )
+    for path in ["link.csv", "../outside/secret.csv", str(outside / "secret.csv")]:
+        with pytest.raises(ValueError):
+            resolve_data_path(root, path)
+
+
+def test_feature_registry():
+    """
+    Test the lookup and the pattern selection of features
+    """
+    registry = FeatureRegistry(["HLA-A", "HLA-B", "KRT1", "ALB", "hla-c"])
+    assert len(registry) == 5 and "KRT1" in registry and "XYZ" not in registry
+
+    known, unknown = registry.resolve(["KRT1", "XYZ", "HLA-A", "XYZ"])
+    assert known == ["HLA-A", "KRT1"] and unknown == ["XYZ"]
+
+    assert registry.match("^HLA-") == ["HLA-A", "HLA-B"]
+    assert registry.match("(?i)^hla") == ["HLA-A", "HLA-B", "hla-c"]
+    assert registry.match("KRT, ALB", "Prefix") == ["KRT1", "ALB"]
+    assert registry.match(" ", "Prefix") == []
+    with pytest.raises(ValueError):
+        registry.match("HLA-(")
+
+    assert registry.select(exclude={"ALB", "KRT1"}) == ["HLA-A", "HLA-B", "hla-c"]
+    assert registry.select(include=["ALB", "HLA-B"], exclude=["ALB"]) == ["HLA-B"]
+
+    names = [f"P{i}" for i in range(120)]
+    assert registry.page(names, 3) == (names[100:], 3)
+    assert registry.page(names, 9)[0] == names[100:]
+    assert registry.page([], 1) == ([], 1)
+
+
+def test_read_sample_file(tmp_path, monkeypatch):
+    """
+    Test the conversion of sample datasets
+    """
+    monkeypatch.setenv("OMICLEARN_CACHE_DIR", str(tmp_path))
+    df = read_sample_file("Sample.xlsx")
+    assert len(list(tmp_path.glob("data/*.arrow"))) == 1
+    pd.testing.assert_frame_equal(read_sample_file("Sample.xlsx"), df)
+    pd.testing.assert_frame_equal(df, pd.read_excel("Sample.xlsx"))
+
+
+def test_disk_cache(tmp_path, monkeypatch):
+    """
+    Test the size cap, expiry, statistics and fallbacks of the disk cache
+    """
+    monkeypatch.setenv("OMICLEARN_CACHE_DIR", str(tmp_path))
+    cache = DiskCache("test", max_size=1 << 30, ttl=3600)
+    calls = []
+
+    @cache.memoize
+    def load(value):
+        calls.append(value)
+        return pd.DataFrame({"A": np.arange(1000.0) * value}), ["warning"]
+
+    for value in [1, 2, 1]:
+        data, warnings = load(value)
+        pd.testing.assert_frame_equal(
+            data, pd.DataFrame({"A": np.arange(1000.0) * value})
+        )
+        assert warnings == ["warning"]
+    assert calls == [1, 2]
+    assert cache.stats()["hits"] == 1 and cache.stats()["entries"] == 2
+
+    # Hits return the same frame with its fingerprint, also from disk
+    assert load(2)[0] is load(2)[0]
+    assert load(2)[0].attrs["fingerprint"] != load(1)[0].attrs["fingerprint"]
+    cache._memory.clear()
+    assert load(2)[0].attrs["fingerprint"] == load(2)[0].attrs["fingerprint"]
+
+    # Only the most recently used entry fits
+    load(1)
+    cache.max_size = max(_[1] for _ in cache._entries())
+    cache.evict()
+    assert cache.stats()["entries"] == 1 and cache.evictions == 1
+    load(1)
+    assert calls == [1, 2]
+
+    cache.ttl = 0
+    load(1)
+    assert calls == [1, 2, 1]
+
+    # Mixed type columns are cached as strings, other failures in memory only
+    cache.ttl, cache.max_size = 3600, 1 << 30
+
+    @cache.memoize
+    def load_mixed(value):
+        calls.append(value)
+        return pd.DataFrame({value: [1.0, 2.0, 3.0], "_age": [1, "NA", 3]})
+
+    for _ in range(3):
+        data = load_mixed("A")
+        assert data["_age"].tolist() == ["1", "NA", "3"]
+        data = load_mixed(3)
+    assert calls == [1, 2, 1, "A", 3]
+    assert cache.stats()["entries"] == 1 and "fingerprint" in data.attrs
+
+    # Concurrent sessions count every hit and miss
+    from concurrent.futures import ThreadPoolExecutor
+
+    cache._memory.clear()
+    counts = cache.stats()
+    with ThreadPoolExecutor(8) as executor:
+        list(
+            executor.map(
+                cache.get, ["missing", load_mixed("A").attrs["fingerprint"]] * 200
+            )
+        )
+    assert cache.stats()["misses"] - counts["misses"] == 200
+    assert cache.stats()["hits"] - counts["hits"] == 201
+
+    assert fingerprint(BytesIO(b"a")) != fingerprint(BytesIO(b"b"))
+    # Large buffers are hashed with their full content
+    content = bytearray(70 << 20)
+    first = fingerprint(BytesIO(content))
+    content[35 << 20] = 1
+    assert fingerprint(BytesIO(content)) != first
+    assert fingerprint(pd.DataFrame({"A": [1]})) != fingerprint(
+        pd.DataFrame({"A": [2]})
+    )
+
+
+def test_columnar_dataset():
+    """
+    Test loading Parquet, Feather and Arrow IPC files by column
+    """
+    df = pd.DataFrame(
+        {"AAA": [1.0, np.nan, 3.0], "BBB": [4.0, 5.0, 6.0], "_disease": list("aab")}
+    )
+    for file_format, write in [
+        ("Parquet File", df.to_parquet),
+        ("Feather File", df.to_feather),
+    ]:
+        output = BytesIO()
+        write(output)
+        dataset = ColumnarDataset(output, file_format)
+        assert dataset.metadata_columns == ["_disease"]
+        assert dataset.feature_columns == ["AAA", "BBB"]
+        assert dataset.n_missing(dataset.feature_columns) == 1
+        pd.testing.assert_frame_equal(dataset.read(["_disease"]), df[["_disease"]])
+        pd.testing.assert_frame_equal(
+            dataset.read(["BBB"], rows=[2, 0]),
+            df[["BBB"]].iloc[[2, 0]].reset_index(drop=True),
+        )
+
+        output.seek(0)
+        data, warnings = load_data(output, file_format)
+        pd.testing.assert_frame_equal(data, df)
+
+    # NaN floats of other writers are missing values, besides the nulls
+    table = pa.table(
+        {
+            "AAA": pa.array([1.0, np.nan, 3.0]),
+            "BBB": pa.array([4.0, None, np.nan], from_pandas=False),
+            "CCC": pa.array([1, None, 3]),
+            "_disease": pa.array(list("aab")),
+        }
+    )
+    for file_format, write in [
+        ("Parquet File", pq.write_table),
+        ("Feather File", feather.write_feather),
+    ]:
+        output = BytesIO()
+        write(table, output)
+        dataset = ColumnarDataset(output, file_format)
+        assert dataset.n_missing(["AAA"]) == 1
+        assert dataset.n_missing(dataset.feature_columns) == 4
+
+
 def test_transform_dataset():
     """
     Test the transform dataset function
@@ -59,16 +424,64 @@ def test_transform_dataset():
         columns=["a", "b", "c", "d"],
     )
     df_t = transform_dataset(df, ["c"], ["a", "b"])
-    assert df_t["c"].dtype == np.dtype("int")
+    assert df_t["c"].tolist() == [0, 1, 0]
 
     df_t = transform_dataset(df, ["c", "d"], ["a", "b"])
-    assert df_t["c"].dtype == np.dtype("int")
-    assert df_t["d"].dtype == np.dtype("int")
+    assert df_t["c"].tolist() == [0, 1, 0]
+    assert df_t["d"].tolist() == [0, 1, 1]
 
-    df_t = transform_dataset(df, [], ["a", "b"])
+    df_t = transform_dataset(df, [], ["a", "b"], rows=np.array([2, 0]))
+    assert df_t.index.tolist() == [2, 0]
+    assert df_t["a"].tolist() == [7.0, 1.0]
 
+    # One shared read-only float matrix
     for column in df_t.columns:
         assert df_t[column].dtype == np.dtype("float")
+    assert not df_t.to_numpy().flags.writeable
+
+    df["a"] = df["a"].astype(np.float32)
+    df["b"] = df["b"].astype(np.float32)
+    assert transform_dataset(df, ["c"], ["a", "b"]).to_numpy().dtype == np.float32
+
+
+def test_categorical_encoder():
+    """
+    Test the label, one-hot and frequency encoding of categorical columns
+    """
+    from sklearn.preprocessing import LabelEncoder
+
+    df = pd.DataFrame(
+        {"_sex": ["m", "w", "m", "d", "w", "m"], "_age": [1, 2, 3, 4, 5, 6]}
+    )
+    encoder = CategoricalEncoder().fit(df)
+    assert list(encoder.categories_) == ["_sex"]
+
+    X = encoder.transform(df, ["_sex", "_age"])
+    assert X[:, 0].tolist() == LabelEncoder().fit_transform(df["_sex"]).tolist()
+    assert X[:, 1].tolist() == df["_age"].tolist()
+
+    assert encoder.feature_names(["_sex", "_age"], "One-hot") == [
+        "_sex=d",
+        "_sex=m",
+        "_sex=w",
+        "_age",
+    ]
+    X = encoder.transform(df, ["_sex"], "One-hot", rows=np.array([0, 3]))
+    assert X.tolist() == [[0, 1, 0], [1, 0, 0]]
+
+    X = encoder.transform(df, ["_sex"], "Frequency")
+    assert X[:, 0].tolist() == [0.5, 1 / 3, 0.5, 1 / 6, 1 / 3, 0.5]
+
+    # The fitted mapping encodes new samples, unseen and missing values are NaN
+    new = pd.DataFrame({"_sex": ["w", "x", None]})
+    X = encoder.transform(new, ["_sex"])
+    assert X[0, 0] == 2 and np.isnan(X[1:, 0]).all()
+    assert encoder.transform(new, ["_sex"], "One-hot").tolist()[1] == [0, 0, 0]
+
+    df_t = transform_dataset(
+        df, ["_sex"], ["_age"], encoder=encoder, encoding="One-hot"
+    )
+    assert df_t.columns.tolist() == ["_age", "_sex=d", "_sex=m", "_sex=w"]
 
 
 def test_normalize_dataset():
@@ -159,6 +572,432 @@ def test_integration():
     assert str(_cv_curves) == str(expected_cv_curves_str), "Error in CV Curves"
 
 
+def test_blocked_knn_imputer():
+    """
+    Compare the blocked KNNImputer against the KNNImputer of scikit-learn
+    """
+    from sklearn.impute import KNNImputer
+
+    rng = np.random.default_rng(23)
+    values = rng.normal(size=(60, 40))
+    values[rng.random(values.shape) < rng.uniform(0, 0.6, size=40)] = np.nan
+    X = pd.DataFrame(values, columns=[f"P{_}" for _ in range(40)])
+    X_train, X_test = X.iloc[:45], X.iloc[45:]
+
+    knn = KNNImputer().fit(X_train)
+    expected_train, expected_test = knn.transform(X_train), knn.transform(X_test)
+
+    # Without restricting the neighbor features, both give the same values
+    imputer = BlockedKNNImputer(n_candidates=10).fit(X_train)
+    np.testing.assert_allclose(imputer.transform(X_train), expected_train)
+    np.testing.assert_allclose(imputer.transform(X_test), expected_test)
+
+    # The same holds when the distances are taken from a shared cache
+    cache = KNNDistanceCache(X)
+    imputer = BlockedKNNImputer(distance_cache=cache).fit(X_train)
+    np.testing.assert_allclose(imputer.transform(X_train), expected_train)
+    np.testing.assert_allclose(imputer.transform(X_test), expected_test)
+
+    # Restricting the neighbor features only imputes the missing values
+    cache = KNNDistanceCache(X, min_completeness=0.8)
+    assert 0 < len(cache.features) < X.shape[1]
+    imputer = BlockedKNNImputer(distance_cache=cache).fit(X_train)
+    imputed = imputer.transform(X_test)
+    observed = ~np.isnan(X_test.values)
+    assert not np.isnan(imputed).any()
+    np.testing.assert_array_equal(imputed[observed], X_test.values[observed])
+
+
+def test_proteomics_imputer():
+    """
+    Test the fold-aware proteomics imputation strategies
+    """
+    rng = np.random.default_rng(23)
+    values = rng.normal(loc=20, scale=2, size=(50, 30))
+    values[rng.random(values.shape) < 0.3] = np.nan
+    X_train, X_test = values[:40], values[40:]
+    missing = np.isnan(X_test)
+
+    for strategy in ["Downshifted normal", "Minimum", "MinProb"]:
+        imputer = ProteomicsImputer(strategy, random_state=23).fit(X_train)
+        imputed = imputer.transform(X_test)
+        assert not np.isnan(imputed).any()
+        np.testing.assert_array_equal(imputed[~missing], X_test[~missing])
+
+        # Values are drawn below the observed training values of each feature
+        cols = np.nonzero(missing)[1]
+        assert np.mean(imputed[missing] < np.nanmean(X_train, axis=0)[cols]) > 0.9
+
+        # Same random state gives the same values
+        imputer = ProteomicsImputer(strategy, random_state=23).fit(X_train)
+        np.testing.assert_array_equal(imputer.transform(X_test), imputed)
+
+    imputer = ProteomicsImputer("Minimum").fit(X_train)
+    cols = np.nonzero(missing)[1]
+    np.testing.assert_array_equal(
+        imputer.transform(X_test)[missing], np.nanmin(X_train, axis=0)[cols]
+    )
+
+
+def test_prefilter_features():
+    """
+    Test the pre-filtering of features by missing values and variance
+    """
+    X = pd.DataFrame(
+        {
+            "a": [1.0, 2.0, 3.0, 4.0],
+            "b": [1.0, np.nan, np.nan, np.nan],
+            "c": [5.0, 5.0, 5.0, np.nan],
+            "d": [np.nan, np.nan, np.nan, np.nan],
+        }
+    )
+    assert prefilter_features(X) == ["a", "b", "c", "d"]
+    assert prefilter_features(X, max_missing_fraction=0.5) == ["a", "c"]
+    assert prefilter_features(X, min_variance=0.1) == ["a"]
+
+
+def test_dataset_profile():
+    """
+    Test the column roles and statistics of the dataset profile
+    """
+    df = pd.DataFrame(
+        {
+            "AAA": [1.0, 2.0, np.nan, 5.0],
+            "BBB": [np.nan] * 4,
+            "_disease": ["a", "b", "a", None],
+        }
+    )
+    profile = DatasetProfile(df)
+    assert profile.feature_columns == ["AAA", "BBB"]
+    assert profile.metadata_columns == ["_disease"]
+    assert profile.n_missing == 6
+    assert profile.missing_fraction.tolist() == [0.25, 1.0]
+    np.testing.assert_allclose(profile.mean, [np.nanmean(df.AAA), np.nan])
+    np.testing.assert_allclose(profile.variance, [np.nanvar(df.AAA), 0.0])
+    np.testing.assert_allclose(profile.minimum, [1.0, np.nan])
+    np.testing.assert_allclose(profile.maximum, [5.0, np.nan])
+    assert profile.value_counts["_disease"].to_dict() == {"a": 2, "b": 1}
+
+    X = df[["AAA", "BBB"]]
+    assert prefilter_features(X, 0.5, profile=profile) == ["AAA"]
+
+
+def test_prune_redundant_features():
+    """
+    Test the removal of duplicate and correlated features
+    """
+    rng = np.random.default_rng(23)
+    X = pd.DataFrame(rng.normal(size=(40, 4)), columns=["a", "b", "c", "d"])
+    X["a_copy"] = X["a"]
+    X["b_scaled"] = 3 * X["b"] + rng.normal(scale=0.01, size=40)
+    X.loc[0, "b"] = np.nan
+
+    kept, clusters = prune_redundant_features(X)
+    assert kept == ["a", "b", "c", "d", "b_scaled"]
+    assert clusters == {"a": ["a_copy"]}
+
+    # The complete feature is kept as the representative of the cluster
+    kept, clusters = prune_redundant_features(X, correlation_threshold=0.95)
+    assert kept == ["a", "c", "d", "b_scaled"]
+    assert clusters == {"a": ["a_copy"], "b_scaled": ["b"]}
+
+    # Correlations are computed on the samples where both features are observed
+    X["c_missing"] = 2 * X["c"] + 1
+    X.loc[X.index[:16], "c_missing"] = np.nan
+    kept, clusters = prune_redundant_features(X, correlation_threshold=0.95)
+    assert kept == ["a", "c", "d", "b_scaled"]
+    assert clusters == {"a": ["a_copy"], "b_scaled": ["b"], "c": ["c_missing"]}
+
+
+def test_cross_validation_memory():
+    """
+    Test that the CV holds about one copy of the feature matrix besides the split
+    """
+    import tracemalloc
+
+    rng = np.random.default_rng(23)
+    values = rng.normal(size=(300, 4000))
+    values[rng.random(values.shape) < 0.2] = np.nan
+    df = pd.DataFrame(values, columns=[f"P{_}" for _ in range(4000)])
+    df.insert(0, "_disease", rng.choice(["a", "b"], 300))
+    del values
+    test_state = objdict(
+        df=df,
+        target_column="_disease",
+        class_0=["a"],
+        class_1=["b"],
+        proteins=df.columns[1:].tolist(),
+        additional_features=[],
+        random_state=23,
+        normalization="StandardScaler",
+        normalization_params={},
+        missing_value="Median",
+        feature_method="ExtraTrees",
+        max_features=20,
+        n_trees=10,
+        cohort_column=None,
+        classifier="LogisticRegression",
+        classifier_params={"random_state": 23},
+        cv_method="StratifiedKFold",
+        cv_splits=5,
+        bar=st.progress(0),
+    )
+    matrix_size = df.memory_usage().sum()
+
+    tracemalloc.start()
+    try:
+        main_analysis_run(test_state)
+        preparation_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        perform_cross_validation(test_state)
+        cv_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # The shared matrix, and the training split and its copy for the classifier
+    assert preparation_peak < 1.2 * matrix_size
+    assert cv_peak < 2.7 * matrix_size
+
+
+def test_rerun_cost(monkeypatch):
+    """
+    Test that a rerun of the data and sidebar sections stays below 100 ms for 10k features
+    """
+    import time
+
+    from PIL import Image
+
+    from omiclearn.utils import ui_components
+
+    rng = np.random.default_rng(23)
+    df = pd.DataFrame(
+        rng.normal(size=(500, 10000)), columns=[f"P{_}" for _ in range(10000)]
+    )
+    df["_disease"] = rng.choice(["a", "b"], 500)
+    # Warm caches of a running app, the session and the dataset profile are kept
+    profile = DatasetProfile(df)
+    monkeypatch.setattr(st, "session_state", objdict())
+    monkeypatch.setattr(ui_components, "_get_dataset_profile", lambda *_: profile)
+    report = ui_components.get_system_report()
+    icon = Image.new("RGB", (8, 8))
+
+    durations = []
+    for _ in range(3):
+        start = time.perf_counter()
+        state = objdict(df=df, dataset_id="dataset", class_0=None, class_1=None)
+        widget_values, record_widgets = ui_components.return_widgets()
+        state = ui_components.dataset_handling(state, record_widgets)
+        state = ui_components.generate_sidebar_elements(
+            state, icon, report, record_widgets
+        )
+        durations.append(time.perf_counter() - start)
+    assert len(state.proteins) == 10000 and state.classifier_params
+    assert min(durations[1:]) < 0.1
+
+
+def _sample_state(classifier, classifier_params):
+    """
+    Build a state for the Sample.xlsx demo case with the given classifier
+    """
+    df = pd.read_excel("Sample.xlsx")
+    test_state = objdict()
+    test_state["df"] = df
+    test_state["df_sub"] = df.copy()
+    test_state["target_column"] = "_disease"
+    test_state["class_0"] = ["a"]
+    test_state["class_1"] = ["b"]
+    test_state["proteins"] = ["AAA", "BBB", "CCC"]
+    test_state["additional_features"] = []
+    test_state["random_state"] = 23
+    test_state["normalization"] = "StandardScaler"
+    test_state["normalization_params"] = {}
+    test_state["missing_value"] = "None"
+    test_state["feature_method"] = "None"
+    test_state["max_features"] = 0
+    test_state["n_trees"] = 0
+    test_state["cohort_column"] = None
+    test_state["classifier"] = classifier
+    test_state["classifier_params"] = classifier_params
+    test_state["cv_method"] = "StratifiedKFold"
+    test_state["cv_splits"] = 3
+    test_state["bar"] = st.progress(0)
+    main_analysis_run(test_state)
+    return test_state
+
+
+def test_export_service():
+    """
+    Test that the export service renders figures and bundles a run into a zip
+    """
+    import plotly.graph_objects as go
+
+    service = ExportService()
+    fig = go.Figure(go.Scatter(x=[0, 1], y=[0, 1]))
+    assert service.render(fig, "svg").result().startswith(b"<svg")
+
+    bundle = service.bundle(
+        {"roc_curve": fig},
+        {"run_results.csv": pd.DataFrame({"roc_auc": [0.9]})},
+        {"summary_text.txt": "Summary"},
+        {"classifier": "AdaBoost", "cv_splits": np.int64(5)},
+    )
+    with zipfile.ZipFile(BytesIO(bundle.result())) as f:
+        assert sorted(f.namelist()) == [
+            "roc_curve.pdf",
+            "roc_curve.svg",
+            "run_config.json",
+            "run_results.csv",
+            "summary_text.txt",
+        ]
+        assert f.read("roc_curve.pdf").startswith(b"%PDF")
+        assert f.read("run_results.csv") == b"roc_auc\n0.9\n"
+        assert f.read("summary_text.txt") == b"Summary"
+        assert json.loads(f.read("run_config.json")) == {
+            "classifier": "AdaBoost",
+            "cv_splits": "5",
+        }
+
+
+def test_interpolate_curves():
+    """
+    Test the batched interpolation of ROC and PR curves against np.interp
+    """
+    from sklearn.metrics import precision_recall_curve, roc_curve
+
+    rng = np.random.default_rng(23)
+    x_grid = np.linspace(0, 1, 101)
+    roc_curves, pr_curves = [], []
+    for n in [7, 50, 500]:
+        y = rng.random(n) < 0.4
+        y_score = (rng.random(n) + y * 0.5).round(1)
+        roc_curves.append(roc_curve(y, y_score)[:2])
+        pr_curves.append(precision_recall_curve(y, y_score)[1::-1])
+
+    expected = [np.interp(x_grid, fpr, tpr) for fpr, tpr in roc_curves]
+    assert np.array_equal(interpolate_curves(x_grid, roc_curves), expected)
+
+    # Decreasing recall, ties keep their order
+    expected = []
+    for recall, precision in pr_curves:
+        order = np.argsort(recall, kind="stable")
+        expected.append(np.interp(x_grid, recall[order], precision[order]))
+    assert np.array_equal(interpolate_curves(x_grid, pr_curves), expected)
+
+
+def test_decimate_curve():
+    """
+    Test that a decimated curve keeps its end points and stays close to the original
+    """
+    x = np.linspace(0, 1, 10000)
+    y = np.sqrt(x)
+    x_, y_ = decimate_curve(x, y, 100)
+    assert len(x_) == 100
+    assert (x_[0], x_[-1]) == (0, 1)
+    assert np.all(np.diff(x_) > 0)
+    assert np.abs(np.interp(x, x_, y_) - y).max() < 0.05
+    assert len(decimate_curve(x[:50], y[:50], 100)[0]) == 50
+
+
+def test_feature_importance_accumulator():
+    """
+    Test the running sum, mean and std of feature importances across splits
+    """
+    importances = FeatureImportanceAccumulator(["A", "B", "C"])
+    splits = [(["A", "B"], [0.2, 0.8]), (["A", "C"], [0.5, 0.5]), (["A"], [1.0])]
+    for features, importance in splits:
+        importances.add(features, importance)
+
+    assert importances.n_splits == 3
+    assert list(importances.n_selected) == [3, 1, 1]
+    assert np.allclose(importances.sum, [1.7, 0.8, 0.5])
+    assert np.allclose(importances.mean, [1.7 / 3, 0.8, 0.5])
+    std = importances.std
+    assert np.isclose(std[0], np.std([0.2, 0.5, 1.0], ddof=1))
+    assert np.isnan(std[1:]).all()
+    assert importances.any()
+    assert not FeatureImportanceAccumulator(["A"]).any()
+
+
+def test_hierarchical_clustering():
+    """
+    Test the correlation matrix, distances and dendrogram against pandas and scipy
+    """
+    import scipy.cluster.hierarchy as sch
+    from scipy.spatial.distance import pdist
+
+    rng = np.random.default_rng(23)
+    values = rng.normal(size=(30, 40))
+    values[:, 1] = 1  # Constant feature
+
+    corr = correlation_matrix(values)
+    assert corr.dtype == np.float32
+    expected = pd.DataFrame(values).corr().to_numpy()
+    mask = ~np.isnan(expected)
+    assert np.allclose(corr[mask], expected[mask], atol=1e-6)
+    assert (corr[1] == 0).all()
+
+    assert np.allclose(row_distances(corr), pdist(corr), atol=1e-5)
+
+    linkage = sch.linkage(pdist(corr), "complete")
+    leaves, links_x, links_y = dendrogram_links(linkage)
+    dendrogram = sch.dendrogram(linkage, no_plot=True)
+    assert list(leaves) == dendrogram["leaves"]
+    links = np.column_stack(
+        [links_x.reshape(-1, 5)[:, :4], links_y.reshape(-1, 5)[:, :4]]
+    )
+    expected = np.column_stack([dendrogram["icoord"], dendrogram["dcoord"]])
+    assert np.allclose(
+        sorted(map(tuple, links.round(9))), sorted(map(tuple, expected.round(9)))
+    )
+
+    fig = generate_dendrogram(corr, [str(_) for _ in range(40)])
+    assert len(fig.data) == 3
+    assert fig.data[2].z.shape == (40, 40)
+    assert list(fig.layout.xaxis.ticktext) == [str(_) for _ in leaves]
+
+
+def test_linear_svc_calibration():
+    """
+    Run LinearSVC with every calibration method and check the outputs
+    """
+    for calibration in [
+        "CalibratedClassifierCV",
+        "Platt scaling (holdout)",
+        "None (ranking only)",
+    ]:
+        classifier_params = {
+            "random_state": 23,
+            "penalty": "l2",
+            "loss": "squared_hinge",
+            "C": 1,
+            "calibration": calibration,
+            "calibration_holdout": 0.3,
+            "cv_generator": 2,
+        }
+        test_state = _sample_state("LinearSVC", classifier_params)
+        _cv_results, _cv_curves = perform_cross_validation(test_state)
+
+        assert len(_cv_results["roc_auc"]) == 3
+        assert all(0 <= _ <= 1 for _ in _cv_results["roc_auc"])
+        # Coefficient-based feature importances are kept for every method
+        feature_importance = _cv_curves["feature_importances_"]
+        assert feature_importance.n_splits == 3
+        assert list(feature_importance.n_selected) == [3, 3, 3]
+        assert feature_importance.any()
+        assert _cv_curves["n_uncalibrated"] == 0
+
+    # The holdout keeps one sample per class, even for small training sets
+    from sklearn.svm import LinearSVC
+
+    rng = np.random.default_rng(23)
+    X = pd.DataFrame(rng.normal(size=(16, 3)), columns=["a", "b", "c"])
+    y = pd.Series([0] * 8 + [1] * 8)
+    args = ("Platt scaling (holdout)", None, 0.05, 23)
+    model, coef = fit_linear_svc(LinearSVC(), X, y, *args)
+    assert model.predict_proba(X).shape == (16, 2) and len(coef) == 3
+    model, coef = fit_linear_svc(LinearSVC(), X.iloc[7:], y.iloc[7:], *args)
+    assert isinstance(model, RankingClassifier)
+
+
 def test_calculate_cm():
     y_test = [1, 0, 1, 1, 0, 1, 1, 1, 0, 1, 0, 0]
     y_pred = [0, 0, 1, 1, 0, 1, 1, 1, 0, 0, 0, 1]
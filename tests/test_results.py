@@ -62,4 +62,4 @@ expected_cv_results = {
     "pr_auc_train": [1.0, 1.0, 0.9742063492063492, 1.0, 1.0, 0.9742063492063492],
 }
 
-expected_cv_curves_str = """{'pr_auc': [], 'roc_curves_': [(array([0.  , 0.25, 1.  ]), array([0., 1., 1.]), array([1.7956569 , 0.7956569 , 0.20434304], dtype=float32)), (array([0., 0., 1.]), array([0.        , 0.66666667, 1.        ]), array([1.8162205 , 0.8162206 , 0.15752529], dtype=float32)), (array([0.        , 0.        , 0.33333333, 1.        ]), array([0., 1., 1., 1.]), array([1.8069754, 0.8069754, 0.502567 , 0.1422766], dtype=float32)), (array([0.  , 0.25, 1.  ]), array([0., 1., 1.]), array([1.7956569 , 0.7956569 , 0.20434304], dtype=float32)), (array([0., 0., 1.]), array([0.        , 0.66666667, 1.        ]), array([1.8162205 , 0.8162206 , 0.15752529], dtype=float32)), (array([0., 0., 1.]), array([0., 1., 1.]), array([1.8069754, 0.8069754, 0.1422766], dtype=float32))], 'pr_curves_': [(array([0.42857143, 0.75      , 1.        ]), array([1., 1., 0.]), array([0.20434304, 0.7956569 ], dtype=float32)), (array([0.5, 1. , 1. ]), array([1.        , 0.66666667, 0.        ]), array([0.15752529, 0.8162206 ], dtype=float32)), (array([0.5 , 0.75, 1.  , 1.  ]), array([1., 1., 1., 0.]), array([0.1422766, 0.502567 , 0.8069754], dtype=float32)), (array([0.42857143, 0.75      , 1.        ]), array([1., 1., 0.]), array([0.20434304, 0.7956569 ], dtype=float32)), (array([0.5, 1. , 1. ]), array([1.        , 0.66666667, 0.        ]), array([0.15752529, 0.8162206 ], dtype=float32)), (array([0.5, 1. , 1. ]), array([1., 1., 0.]), array([0.1422766, 0.8069754], dtype=float32))], 'y_hats_': [(array([ True,  True,  True, False, False, False, False]), array([1, 1, 1, 1, 0, 0, 0])), (array([ True,  True,  True, False, False, False]), array([1, 1, 0, 0, 0, 0])), (array([ True,  True,  True, False, False, False]), array([1, 1, 1, 1, 0, 0])), (array([ True,  True,  True, False, False, False, False]), array([1, 1, 1, 1, 0, 0, 0])), (array([ True,  True,  True, False, False, False]), array([1, 1, 0, 0, 0, 0])), (array([ True,  True,  True, False, False, False]), array([1, 1, 1, 0, 0, 0]))], 'feature_importances_': [{'_study': 0.0, 'CCC': 1.0, 'BBB': 0.0, 'AAA': 0.0}, {'_study': 0.0, 'CCC': 1.0, 'BBB': 0.0, 'AAA': 0.0}, {'_study': 0.0, 'AAA': 0.0717181, 'CCC': 0.9282819, 'BBB': 0.0}, {'_study': 0.0, 'CCC': 1.0, 'BBB': 0.0, 'AAA': 0.0}, {'_study': 0.0, 'CCC': 1.0, 'BBB': 0.0, 'AAA': 0.0}, {'_study': 0.0, 'AAA': 0.0717181, 'CCC': 0.9282819, 'BBB': 0.0}], 'features_': []}"""
+expected_cv_curves_str = """{'pr_auc': [], 'roc_curves_': [(array([0.  , 0.25, 1.  ]), array([0., 1., 1.]), array([1.7956569 , 0.7956569 , 0.20434304], dtype=float32)), (array([0., 0., 1.]), array([0.        , 0.66666667, 1.        ]), array([1.8162205 , 0.8162206 , 0.15752529], dtype=float32)), (array([0.        , 0.        , 0.33333333, 1.        ]), array([0., 1., 1., 1.]), array([1.8069754, 0.8069754, 0.502567 , 0.1422766], dtype=float32)), (array([0.  , 0.25, 1.  ]), array([0., 1., 1.]), array([1.7956569 , 0.7956569 , 0.20434304], dtype=float32)), (array([0., 0., 1.]), array([0.        , 0.66666667, 1.        ]), array([1.8162205 , 0.8162206 , 0.15752529], dtype=float32)), (array([0., 0., 1.]), array([0., 1., 1.]), array([1.8069754, 0.8069754, 0.1422766], dtype=float32))], 'pr_curves_': [(array([0.42857143, 0.75      , 1.        ]), array([1., 1., 0.]), array([0.20434304, 0.7956569 ], dtype=float32)), (array([0.5, 1. , 1. ]), array([1.        , 0.66666667, 0.        ]), array([0.15752529, 0.8162206 ], dtype=float32)), (array([0.5 , 0.75, 1.  , 1.  ]), array([1., 1., 1., 0.]), array([0.1422766, 0.502567 , 0.8069754], dtype=float32)), (array([0.42857143, 0.75      , 1.        ]), array([1., 1., 0.]), array([0.20434304, 0.7956569 ], dtype=float32)), (array([0.5, 1. , 1. ]), array([1.        , 0.66666667, 0.        ]), array([0.15752529, 0.8162206 ], dtype=float32)), (array([0.5, 1. , 1. ]), array([1., 1., 0.]), array([0.1422766, 0.8069754], dtype=float32))], 'y_hats_': [(array([ True,  True,  True, False, False, False, False]), array([1, 1, 1, 1, 0, 0, 0])), (array([ True,  True,  True, False, False, False]), array([1, 1, 0, 0, 0, 0])), (array([ True,  True,  True, False, False, False]), array([1, 1, 1, 1, 0, 0])), (array([ True,  True,  True, False, False, False, False]), array([1, 1, 1, 1, 0, 0, 0])), (array([ True,  True,  True, False, False, False]), array([1, 1, 0, 0, 0, 0])), (array([ True,  True,  True, False, False, False]), array([1, 1, 1, 0, 0, 0]))], 'features_': [], 'feature_importances_': FeatureImportanceAccumulator(n_splits=6, sum={'AAA': 0.143436, 'BBB': 0.0, 'CCC': 5.856564, '_study': 0.0})}"""